@@ -0,0 +1,207 @@
+import gzip
+import math
+import os
+import numpy as np
+
+SENTENCE_START = '<s>'
+SENTENCE_END = '</s>'
+UNKNOWN_WORD = '<unk>'
+LOG10 = math.log(10)
+ROOT = 0
+OOV_LOG10_PROB = -10.0
+
+class LookupCache(object):
+
+    # direct-mapped memo of (history id, word id) -> (score, next history id): a colliding key evicts the previous entry,
+    # so the cache never grows beyond its capacity and a lookup is a single vectorized gather
+    def __init__(self, capacity=1 << 20):
+        self.numBits = max(1, (capacity - 1).bit_length())
+        self.keys = np.full(1 << self.numBits, -1, dtype=np.int64)
+        self.scores = np.empty(1 << self.numBits, dtype=np.float64)
+        self.states = np.empty(1 << self.numBits, dtype=np.int64)
+        self.hits = 0
+        self.misses = 0
+
+    def getSlots(self, keys):
+        return ((keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(64 - self.numBits)).astype(np.int64)
+
+    def get(self, keys):
+        slots = self.getSlots(keys)
+        found = self.keys[slots] == keys
+        self.hits += int(found.sum())
+        self.misses += len(keys) - int(found.sum())
+        return found, self.scores[slots], self.states[slots]
+
+    def put(self, keys, scores, states):
+        slots = self.getSlots(keys)
+        self.keys[slots] = keys
+        self.scores[slots] = scores
+        self.states[slots] = states
+
+class ArpaModel(object):
+
+    # every n-gram is an entry of one array-backed trie, entry 0 being the empty history; the entries are sorted by
+    # order and then by (parent, word), so the child keys parent * (numWords + 1) + word + 1 form one sorted array
+    # and a child lookup is a binary search. Scores are negative natural logs like the l= scores of the lattices
+    def __init__(self, words, entryOrders, childKeys, logProbs, backoffs, suffixes, states, cacheSize=1 << 20):
+        self.words = words
+        self.wordIds = dict((word, wordId) for wordId, word in enumerate(words))
+        self.numWords = len(words)
+        self.entryOrders = entryOrders
+        self.childKeys = childKeys
+        self.logProbs = logProbs
+        self.backoffs = backoffs
+        self.suffixes = suffixes
+        self.states = states
+        self.order = int(entryOrders.max()) if len(entryOrders) else 0
+        self.unknownWord = self.wordIds.get(UNKNOWN_WORD, -1)
+        self.oovScore = -LOG10 * OOV_LOG10_PROB
+        self.cache = LookupCache(cacheSize)
+        startWord = self.wordIds.get(SENTENCE_START, -1)
+        self.startState = int(self.states[self.getChildren(np.array([ROOT]), np.array([startWord]))[0]]) if startWord >= 0 else ROOT
+        self.endWord = self.wordIds.get(SENTENCE_END, -1)
+
+    @classmethod
+    def load(cls, arpaFilePath, cacheSize=1 << 20):
+        # the parsed trie is kept next to the ARPA file, so only the first run pays for reading the text
+        binaryFilePath = arpaFilePath + '.npz'
+        if(os.path.exists(binaryFilePath) and os.path.getmtime(binaryFilePath) >= os.path.getmtime(arpaFilePath)):
+            with np.load(binaryFilePath) as arrays:
+                return cls(arrays['words'].tolist(), arrays['entryOrders'], arrays['childKeys'], arrays['logProbs'], arrays['backoffs'], arrays['suffixes'], arrays['states'], cacheSize)
+        model = cls.fromArpaFile(arpaFilePath, cacheSize)
+        model.save(binaryFilePath)
+        return model
+
+    @classmethod
+    def fromArpaFile(cls, arpaFilePath, cacheSize=1 << 20):
+        sections = cls.readSections(arpaFilePath)
+        words = [fields[1] for fields in sections[1]]
+        wordIds = dict((word, wordId) for wordId, word in enumerate(words))
+        numWordKeys = len(words) + 1
+
+        entryOrders = [np.zeros(1, dtype=np.int8)]
+        childKeys, logProbs, backoffs = [], [np.zeros(1)], [np.zeros(1)]
+        previousKeys = np.zeros(0, dtype=np.int64)
+        for order in range(1, len(sections) + 1):
+            lines = sections[order]
+            ids = np.array([[wordIds[word] for word in fields[1:order + 1]] for fields in lines], dtype=np.int64).reshape(len(lines), order)
+            parents = np.zeros(len(lines), dtype=np.int64)
+            for position in range(order - 1):
+                keys = parents * numWordKeys + ids[:, position] + 1
+                found = np.searchsorted(previousKeys, keys)
+                assert np.all(previousKeys[np.minimum(found, len(previousKeys) - 1)] == keys), "Every n-gram context should be in the model"
+                parents = found + 1
+            keys = parents * numWordKeys + ids[:, -1] + 1
+            sortedEntries = np.argsort(keys, kind='stable')
+            childKeys.append(keys[sortedEntries])
+            logProbs.append(-LOG10 * np.array([float(fields[0]) for fields in lines])[sortedEntries])
+            backoffs.append(-LOG10 * np.array([float(fields[order + 1]) if len(fields) > order + 1 else 0.0 for fields in lines])[sortedEntries])
+            entryOrders.append(np.full(len(lines), order, dtype=np.int8))
+            previousKeys = np.concatenate(childKeys)
+
+        childKeys = np.concatenate(childKeys) if childKeys else np.zeros(0, dtype=np.int64)
+        entryOrders = np.concatenate(entryOrders)
+        suffixes, states = cls.linkSuffixes(entryOrders, childKeys, np.concatenate(backoffs), numWordKeys)
+        return cls(words, entryOrders, childKeys, np.concatenate(logProbs), np.concatenate(backoffs), suffixes, states, cacheSize)
+
+    @classmethod
+    def readSections(cls, arpaFilePath):
+        openFile = gzip.open if arpaFilePath.endswith('.gz') else open
+        sections = {}
+        current = None
+        with openFile(arpaFilePath, 'rt', encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if(not line or line.startswith('ngram ')):
+                    continue
+                if(line.startswith('\\')):
+                    current = int(line[1:line.index('-')]) if line.endswith('-grams:') else None
+                    if(current is not None):
+                        sections[current] = []
+                elif(current is not None):
+                    sections[current].append(line.split())
+        assert sections and sorted(sections) == list(range(1, len(sections) + 1)), "ARPA file should contain the n-gram sections 1 to N"
+        return sections
+
+    @classmethod
+    def linkSuffixes(cls, entryOrders, childKeys, backoffs, numWordKeys):
+        # suffix: the entry without its first word, or the longest shorter suffix the model has;
+        # state: the shortest suffix that still predicts every following word like the entry itself
+        numEntries = len(entryOrders)
+        parents = np.r_[-1, childKeys // numWordKeys]
+        lastWords = np.r_[-1, childKeys % numWordKeys]
+        hasChildren = np.zeros(numEntries, dtype=bool)
+        hasChildren[parents[1:]] = True
+        suffixes = np.zeros(numEntries, dtype=np.int64)
+        states = np.zeros(numEntries, dtype=np.int64)
+        maxOrder = int(entryOrders.max()) if numEntries else 0
+        for order in range(1, maxOrder + 1):
+            entries = np.flatnonzero(entryOrders == order)
+            if(order > 1):
+                contexts = suffixes[parents[entries]]
+                pending = np.arange(len(entries))
+                while(pending.size):
+                    keys = contexts[pending] * numWordKeys + lastWords[entries[pending]]
+                    found = np.minimum(np.searchsorted(childKeys, keys), len(childKeys) - 1)
+                    isFound = childKeys[found] == keys
+                    suffixes[entries[pending[isFound]]] = found[isFound] + 1
+                    pending = pending[~isFound]
+                    atRoot = contexts[pending] == ROOT
+                    pending = pending[~atRoot]
+                    contexts[pending] = suffixes[contexts[pending]]
+            isState = (hasChildren[entries] | (backoffs[entries] != 0)) & (order < maxOrder)
+            states[entries] = np.where(isState, entries, states[suffixes[entries]])
+        return suffixes, states
+
+    def save(self, binaryFilePath):
+        temporaryFilePath = binaryFilePath + '.tmp.npz'
+        np.savez(temporaryFilePath, words=np.array(self.words), entryOrders=self.entryOrders, childKeys=self.childKeys, logProbs=self.logProbs,
+                 backoffs=self.backoffs, suffixes=self.suffixes, states=self.states)
+        os.replace(temporaryFilePath, binaryFilePath)
+
+    def getWordIds(self, words):
+        return np.array([self.wordIds.get(word, self.unknownWord) for word in words], dtype=np.int64)
+
+    def getChildren(self, states, wordIds):
+        keys = states * (self.numWords + 1) + wordIds + 1
+        found = np.minimum(np.searchsorted(self.childKeys, keys), max(len(self.childKeys) - 1, 0))
+        return np.where((self.childKeys[found] == keys) & (wordIds >= 0), found + 1, -1) if len(self.childKeys) else np.full(len(keys), -1)
+
+    def score(self, states, wordIds):
+        states, wordIds = np.asarray(states, dtype=np.int64), np.asarray(wordIds, dtype=np.int64)
+        keys = states * (self.numWords + 1) + wordIds + 1
+        found, scores, nextStates = self.cache.get(keys)
+        missing = np.flatnonzero(~found)
+        if(missing.size):
+            uniqueKeys, inverse = np.unique(keys[missing], return_inverse=True)
+            uniqueScores, uniqueStates = self.calculateScores(uniqueKeys // (self.numWords + 1), uniqueKeys % (self.numWords + 1) - 1)
+            scores[missing], nextStates[missing] = uniqueScores[inverse], uniqueStates[inverse]
+            self.cache.put(uniqueKeys, uniqueScores, uniqueStates)
+        return scores, nextStates
+
+    def calculateScores(self, states, wordIds):
+        # standard backoff: follow the suffixes of the history, adding their backoff weights, until the word is found
+        scores = np.zeros(len(states))
+        nextStates = np.full(len(states), ROOT, dtype=np.int64)
+        contexts = states.copy()
+        pending = np.arange(len(states))
+        while(pending.size):
+            children = self.getChildren(contexts[pending], wordIds[pending])
+            isFound = children >= 0
+            scores[pending[isFound]] += self.logProbs[children[isFound]]
+            nextStates[pending[isFound]] = self.states[children[isFound]]
+            pending = pending[~isFound]
+            atRoot = contexts[pending] == ROOT
+            scores[pending[atRoot]] = self.oovScore
+            pending = pending[~atRoot]
+            scores[pending] += self.backoffs[contexts[pending]]
+            contexts[pending] = self.suffixes[contexts[pending]]
+        return scores, nextStates
+
+    def scoreSentence(self, words):
+        state, total = self.startState, 0.0
+        for wordId in self.getWordIds(list(words) + [SENTENCE_END]):
+            score, nextState = self.calculateScores(np.array([state]), np.array([wordId]))
+            total += float(score[0])
+            state = int(nextState[0])
+        return total
@@ -0,0 +1,18 @@
+import numpy as np
+
+def expandRanges(starts, counts):
+    offsets = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) + np.repeat(starts - offsets, counts)
+
+def gatherSegments(offsets, items, keys):
+    starts = offsets[keys]
+    counts = offsets[keys + 1] - starts
+    return items[expandRanges(starts, counts)], np.cumsum(counts) - counts
+
+def reduceByKey(keys, values, reduceSegments):
+    if(not len(keys)):
+        return keys, values
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    segmentStarts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[segmentStarts], reduceSegments(values[order], segmentStarts)
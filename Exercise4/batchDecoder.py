@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from decodeWordGraphs import WordGraph
+from latticeCache import LatticeCache
+from vocabulary import Vocabulary
+
+# one parsed model per worker process, shared by all segments it decodes
+languageModels = {}
+# one vocabulary per worker process and cache directory, seeded from the cache so cached word ids need no translation,
+# and the number of its words already sent back to the main process
+vocabularies = {}
+numReportedWords = {}
+
+class Segment(object):
+
+    def __init__(self, latticeFilePath, startTime, code):
+        self.latticeFilePath = latticeFilePath
+        self.startTime = startTime
+        self.code = code
+
+class SegmentResult(object):
+
+    def __init__(self, segment, ctmLines=None, confidenceLines=None, numEdges=0, numEdgesBeforePruning=0, stats=None, error=None, newWords=(), sweepCTMLines=()):
+        self.segment = segment
+        self.ctmLines = ctmLines
+        self.confidenceLines = confidenceLines
+        self.numEdges = numEdges
+        self.numEdgesBeforePruning = numEdgesBeforePruning
+        self.stats = stats
+        self.error = error
+        self.newWords = newWords
+        self.sweepCTMLines = sweepCTMLines
+
+def readManifest(manifestFilePath):
+    manifestDir = os.path.dirname(manifestFilePath)
+    segments = []
+    with open(manifestFilePath, 'r') as file:
+        for line in file:
+            line = line.split('#')[0].strip()
+            if(line):
+                latticeFilePath, startTime, code = line.split()
+                segments.append(Segment(os.path.join(manifestDir, latticeFilePath), float(startTime), code))
+    return segments
+
+def getRescorer(rescoring):
+    if(rescoring is None):
+        return None
+    from arpaModel import ArpaModel
+    from lmRescoring import LatticeRescorer
+    arpaFilePath, beam, maxStatesPerNode = rescoring
+    if(arpaFilePath not in languageModels):
+        languageModels[arpaFilePath] = ArpaModel.load(arpaFilePath)
+    return LatticeRescorer(languageModels[arpaFilePath], beam=beam, maxStatesPerNode=maxStatesPerNode)
+
+def getSweepScales(sweep):
+    lmScales, acousticScales = np.broadcast_arrays(np.asarray(sweep[0], dtype=np.float64), np.asarray(sweep[1], dtype=np.float64))
+    return lmScales.tolist(), acousticScales.tolist()
+
+def getSweepCTMPath(resultFilePath, lmScale, acousticScale):
+    root, extension = os.path.splitext(resultFilePath)
+    return root + '.lm%g.am%g' % (lmScale, acousticScale) + extension
+
+def getVocabulary(cacheDir):
+    if(cacheDir not in vocabularies):
+        vocabularies[cacheDir] = LatticeCache(cacheDir).loadVocabulary() if cacheDir is not None else Vocabulary()
+        numReportedWords[cacheDir] = len(vocabularies[cacheDir])
+    return vocabularies[cacheDir]
+
+def getNewWords(cacheDir):
+    newWords = getVocabulary(cacheDir).words[numReportedWords[cacheDir]:]
+    numReportedWords[cacheDir] += len(newWords)
+    return newWords
+
+def decodeSegment(task):
+    segment, pruningThreshold, lmScale, mode, cacheDir, maxArcsPerFrame, traceMemory, rescoring, consensus, confusionNetworkDir, sweep, withConfidences, measureDensity, confidenceRescoring = task
+    try:
+        latticeCache = LatticeCache(cacheDir) if cacheDir is not None else None
+        wordGraph = WordGraph(segment.latticeFilePath, segment.startTime, segment.code, None, None, pruningThreshold, lmScale, mode, latticeCache, maxArcsPerFrame,
+                              traceMemory=traceMemory, rescorer=getRescorer(rescoring), vocabulary=getVocabulary(cacheDir),
+                              sweepLmScales=sweep[0] if sweep is not None else None, sweepAcousticScales=sweep[1] if sweep is not None else 1.0,
+                              confidenceRescoring=confidenceRescoring)
+        if(consensus or confusionNetworkDir is not None):
+            network = wordGraph.decodeConsensus() if consensus else wordGraph.getConfusionNetwork()
+            if(confusionNetworkDir is not None):
+                network.save(os.path.join(confusionNetworkDir, os.path.basename(segment.latticeFilePath).split('.htk')[0] + '.cn'))
+        # the word graph only computes what is asked for: the 1-best CTM alone needs neither posteriors nor pruning
+        ctmLines = wordGraph.getCTMLines()
+        confidenceLines = wordGraph.getConfidenceMeasureLines() if withConfidences else None
+        numEdges = wordGraph.numPrunedEdges if measureDensity else 0
+        return SegmentResult(segment, ctmLines, confidenceLines, numEdges, wordGraph.numEdgesBeforePruning, wordGraph.stats, newWords=getNewWords(cacheDir),
+                             sweepCTMLines=[wordGraph.getCTMLines(index) for index in range(len(wordGraph.sweepEncodedResults))])
+    except Exception:
+        return SegmentResult(segment, error=traceback.format_exc(), newWords=getNewWords(cacheDir))
+
+def decodeBatch(segments, resultFilePath, confMeasFilePath, pruningThreshold, lmScale, mode='log semiring', cacheDir=None, numWorkers=None, maxArcsPerFrame=None, statsFilePath=None, traceMemory=False, rescoring=None, consensus=False, confusionNetworkDir=None, sweep=None, measureDensity=True, confidenceRescoring=False):
+    # without a confidence measure file the confidences are not computed at all
+    numWorkers = max(1, min(numWorkers or os.cpu_count() or 1, len(segments)))
+    if(confusionNetworkDir is not None):
+        os.makedirs(confusionNetworkDir, exist_ok=True)
+    tasks = [(segment, pruningThreshold, lmScale, mode, cacheDir, maxArcsPerFrame, traceMemory, rescoring, consensus, confusionNetworkDir, sweep,
+              confMeasFilePath is not None, measureDensity, confidenceRescoring) for segment in segments]
+    vocabulary = LatticeCache(cacheDir).loadVocabulary() if cacheDir is not None else Vocabulary()
+    numSeedWords = len(vocabulary)
+    # a sweep writes one more CTM file per pair of scales, all from the same pass over every lattice
+    sweepFiles = [open(getSweepCTMPath(resultFilePath, lmScale, acousticScale), 'w') for lmScale, acousticScale in zip(*sweep)] if sweep is not None else []
+    results = []
+    # results come back in manifest order, so the merged files do not depend on which worker finishes first
+    with open(resultFilePath, 'w') as resultFile, open(confMeasFilePath if confMeasFilePath is not None else os.devnull, 'w') as confMeasFile:
+        with ProcessPoolExecutor(numWorkers) as executor:
+            for result in executor.map(decodeSegment, tasks):
+                if(result.error is None):
+                    resultFile.writelines(result.ctmLines)
+                    confMeasFile.writelines(result.confidenceLines or [])
+                    for sweepFile, ctmLines in zip(sweepFiles, result.sweepCTMLines):
+                        sweepFile.writelines(ctmLines)
+                    if(statsFilePath is not None):
+                        result.stats.writeJSONLine(statsFilePath)
+                else:
+                    print("Decoding " + result.segment.latticeFilePath + " failed:\n" + result.error, file=sys.stderr)
+                vocabulary.internAll(result.newWords)
+                results.append(result)
+    for sweepFile in sweepFiles:
+        sweepFile.close()
+    # the next run starts every worker with all words seen so far
+    if(cacheDir is not None and len(vocabulary) > numSeedWords):
+        LatticeCache(cacheDir).storeVocabulary(vocabulary)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Decode all lattices listed in a manifest of "<lattice> <start> <code>" lines')
+    parser.add_argument('manifest')
+    parser.add_argument('pruningThreshold', type=float)
+    parser.add_argument('lmScale', type=float)
+    parser.add_argument('--ctm', default='results.ctm')
+    parser.add_argument('--confidence-measures', default='confidenceMeasures.txt')
+    parser.add_argument('--no-confidence-measures', action='store_true', help='only write the CTM, which skips the posteriors of the best path')
+    parser.add_argument('--mode', default='log semiring', choices=['log semiring', 'tropical semiring'])
+    parser.add_argument('--cache-dir', default=os.environ.get('LATTICE_CACHE_DIR', '.latticeCache'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-arcs-per-frame', type=int, default=None)
+    parser.add_argument('--stats', default=None, help='append one JSON line of stage timings and counters per lattice to this file')
+    parser.add_argument('--trace-memory', action='store_true', help='measure the peak memory of every stage with tracemalloc')
+    parser.add_argument('--arpa', default=None, help='rescore every lattice with this ARPA n-gram model')
+    parser.add_argument('--lm-beam', type=float, default=float('inf'), help='drop LM histories of a node scoring this much worse than its best one')
+    parser.add_argument('--lm-max-states', type=int, default=None, help='keep at most this many LM histories per node')
+    parser.add_argument('--consensus', action='store_true', help='decode the confusion network instead of the best path, with slot posteriors as confidences')
+    parser.add_argument('--confusion-network-dir', default=None, help='write the confusion network of every lattice to this directory')
+    parser.add_argument('--sweep-lm-scales', type=float, nargs='+', default=None, help='also write the best path of every one of these LM scales, each to its own CTM file')
+    parser.add_argument('--sweep-acoustic-scales', type=float, nargs='+', default=[1.0], help='acoustic scales paired with the sweep LM scales, or one for all of them')
+    parser.add_argument('--confidence-rescoring', action='store_true', help='prune and decode with the confidence measures as edge weights')
+    parser.add_argument('--num-words', type=int, default=None, help='number of reference words, used to report the word graph density')
+    args = parser.parse_args()
+
+    results = decodeBatch(readManifest(args.manifest), args.ctm, None if args.no_confidence_measures else args.confidence_measures, args.pruningThreshold, args.lmScale, args.mode, args.cache_dir, args.workers, args.max_arcs_per_frame, args.stats, args.trace_memory,
+                          (args.arpa, args.lm_beam, args.lm_max_states) if args.arpa is not None else None, args.consensus, args.confusion_network_dir,
+                          getSweepScales((args.sweep_lm_scales, args.sweep_acoustic_scales)) if args.sweep_lm_scales is not None else None, args.num_words is not None, args.confidence_rescoring)
+    failures = [result for result in results if result.error is not None]
+    print("Decoded", len(results) - len(failures), "of", len(results), "segments")
+    if(args.num_words):
+        print("Word Graph Density before pruning", sum(result.numEdgesBeforePruning for result in results)/float(args.num_words))
+        print("Word Graph Density", sum(result.numEdges for result in results)/float(args.num_words))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import numpy as np
+from decodeWordGraphs import WordGraph
+from latticeGenerator import LatticeGenerator
+
+MODES = ('log semiring', 'tropical semiring')
+REFERENCE_ARRAYS = ('forwardProbs', 'backwardProbs', 'posteriorProbs', 'confidenceMeasures')
+
+class BenchmarkCase(object):
+
+    def __init__(self, numEdges, branchingFactor, vocabularySize, durationSeconds, seed):
+        self.numEdges = numEdges
+        self.branchingFactor = branchingFactor
+        self.vocabularySize = vocabularySize
+        self.durationSeconds = durationSeconds
+        self.seed = seed
+
+    def getName(self):
+        name = 'edges%d.branching%g.vocabulary%d.seed%d' % (self.numEdges, self.branchingFactor, self.vocabularySize, self.seed)
+        return name + ('.duration%g' % self.durationSeconds if self.durationSeconds is not None else '')
+
+    def getLatticeFilePath(self, workDir):
+        latticeFilePath = os.path.join(workDir, self.getName() + '.htk.gz')
+        if(not os.path.exists(latticeFilePath)):
+            generator = LatticeGenerator.forNumEdges(self.numEdges, self.branchingFactor, durationSeconds=self.durationSeconds, vocabularySize=self.vocabularySize, seed=self.seed)
+            generator.write(latticeFilePath + '.tmp')
+            os.replace(latticeFilePath + '.tmp', latticeFilePath)
+        return latticeFilePath
+
+def getReferencePath(referenceDir, case, mode):
+    return os.path.join(referenceDir, case.getName() + '.' + mode.split()[0] + '.npz')
+
+def getReferenceArrays(wordGraph):
+    arrays = dict((name, getattr(wordGraph, name)) for name in REFERENCE_ARRAYS)
+    arrays['fullPathProb'] = np.array([wordGraph.fullPathProb])
+    arrays['decodedWords'] = np.array([tupleResult[0] for tupleResult in wordGraph.encodedResults])
+    return arrays
+
+def compareReference(arrays, referencePath, tolerance):
+    mismatches = []
+    with np.load(referencePath) as reference:
+        for name, values in arrays.items():
+            expected = reference[name]
+            if(values.shape != expected.shape):
+                mismatches.append(name + ' has shape ' + str(values.shape) + ' instead of ' + str(expected.shape))
+            elif(values.dtype.kind == 'f' and not np.allclose(values, expected, rtol=tolerance, atol=0, equal_nan=True)):
+                mismatches.append(name + ' differs by up to ' + str(np.nanmax(np.abs(values - expected))))
+            elif(values.dtype.kind != 'f' and not np.array_equal(values, expected)):
+                mismatches.append(name + ' differs')
+    return mismatches
+
+def runCase(task):
+    # every case runs in a fresh process, so the peak memory of one lattice does not hide behind an earlier, larger one
+    case, latticeFilePath, mode, pruningThreshold, lmScale, traceMemory, saveReferenceDir, checkReferenceDir, tolerance = task
+    wordGraph = WordGraph(latticeFilePath, 0.0, '', None, None, pruningThreshold, lmScale, mode, traceMemory=traceMemory)
+    # the stages run lazily, so the arrays are asked for before the timings are read
+    arrays = getReferenceArrays(wordGraph)
+    report = wordGraph.stats.toDict()
+    report.update({'case': case.getName(), 'mode': mode, 'pruningThreshold': pruningThreshold, 'mismatches': []})
+    if(saveReferenceDir is not None):
+        np.savez_compressed(getReferencePath(saveReferenceDir, case, mode), **arrays)
+    if(checkReferenceDir is not None):
+        referencePath = getReferencePath(checkReferenceDir, case, mode)
+        if(os.path.exists(referencePath)):
+            report['mismatches'] = compareReference(arrays, referencePath, tolerance)
+        else:
+            report['mismatches'] = ['no reference at ' + referencePath]
+    return report
+
+def printReport(report):
+    numEdges = report['counters']['edgesBeforePruning']
+    print('%s  %s  %d edges  %.3fs wall  %.3fs cpu  %.0f edges/s' % (report['case'], report['mode'], numEdges, report['wallTime'], report['cpuTime'], numEdges / max(report['wallTime'], 1e-9)))
+    for stage in report['stages']:
+        memory = '  %.1f MB traced' % (stage['peakTracedBytes'] / 1e6) if stage['peakTracedBytes'] is not None else ''
+        peakRss = '  %.1f MB peak rss' % (stage['peakRss'] / 1e3) if stage['peakRss'] is not None else ''
+        print('    %-34s %8.4fs wall %8.4fs cpu %12.0f edges/s%s%s' % (stage['name'], stage['wallTime'], stage['cpuTime'], numEdges / max(stage['wallTime'], 1e-9), peakRss, memory))
+    for mismatch in report['mismatches']:
+        print('    MISMATCH ' + mismatch)
+
+def runBenchmark(cases, workDir, pruningThreshold, lmScale=None, traceMemory=False, saveReferenceDir=None, checkReferenceDir=None, tolerance=0.0, reportFilePath=None):
+    for directory in (workDir, saveReferenceDir):
+        if(directory is not None):
+            os.makedirs(directory, exist_ok=True)
+    tasks = [(case, case.getLatticeFilePath(workDir), mode, pruningThreshold, lmScale, traceMemory, saveReferenceDir, checkReferenceDir, tolerance) for case in cases for mode in MODES]
+    reports = []
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        for report in pool.imap(runCase, tasks):
+            printReport(report)
+            if(reportFilePath is not None):
+                with open(reportFilePath, 'a') as reportFile:
+                    reportFile.write(json.dumps(report, sort_keys=True) + '\n')
+            reports.append(report)
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time every WordGraph stage on synthetic lattices of growing size')
+    parser.add_argument('--edges', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--branching', type=float, default=10.0)
+    parser.add_argument('--vocabulary', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=None, help='seconds per lattice, defaults to ten nodes per frame')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pruning-threshold', type=float, default=500.0)
+    parser.add_argument('--lm-scale', type=float, default=None)
+    parser.add_argument('--work-dir', default='.benchmark', help='where the generated lattices are kept between runs')
+    parser.add_argument('--trace-memory', action='store_true')
+    parser.add_argument('--save-reference', default=None, help='directory to store the results of both semirings in')
+    parser.add_argument('--check-reference', default=None, help='directory with stored results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.0, help='relative tolerance of the comparison, 0 asks for identical results')
+    parser.add_argument('--report', default=None, help='append one JSON line per case and semiring to this file')
+    args = parser.parse_args()
+
+    cases = [BenchmarkCase(numEdges, args.branching, args.vocabulary, args.duration, args.seed) for numEdges in args.edges]
+    reports = runBenchmark(cases, args.work_dir, args.pruning_threshold, args.lm_scale, args.trace_memory, args.save_reference, args.check_reference, args.tolerance, args.report)
+    sys.exit(1 if any(report['mismatches'] for report in reports) else 0)
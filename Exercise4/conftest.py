@@ -0,0 +1,28 @@
+import pytest
+from decodeWordGraphs import Lattice
+from vocabulary import Vocabulary
+
+def makeLattice(nodeTimes, edges, lmScale=1.0):
+    # edges: (from, to, word, acoustic score, language score), with the words interned in order of appearance
+    vocabulary = Vocabulary(['!NULL'])
+    edgeFrom, edgeTo, words, acousticScores, languageScores = zip(*edges)
+    return Lattice(nodeTimes, edgeFrom, edgeTo, vocabulary.internAll(words), acousticScores, languageScores, vocabulary, lmScale)
+
+@pytest.fixture
+def slotLattice():
+    # A or B, then C or a skip of it: the best path is A C
+    return makeLattice([0, 10, 20], [(0, 1, 'A', 5.0, 1.0), (0, 1, 'B', 6.0, 1.0), (1, 2, 'C', 5.0, 1.0), (1, 2, '!NULL', 7.0, 1.0)])
+
+@pytest.fixture
+def reverseNumberedLattice():
+    # A or B, then C, then D or E; the inner nodes are numbered against the direction of the edges:
+    # 0 -> 3 -> 2 -> 1 -> 4 in time, and every one of them is on every path
+    return makeLattice([0, 30, 20, 10, 40], [(0, 3, 'A', 5.0, 1.0), (0, 3, 'B', 6.0, 1.0), (3, 2, 'C', 5.0, 1.0), (2, 1, '!NULL', 1.0, 1.0),
+                                             (1, 4, 'D', 4.0, 1.0), (1, 4, 'E', 3.0, 1.5)])
+
+@pytest.fixture
+def branchingLattice():
+    # edges skipping nodes and parallel edges, so paths of different lengths share prefixes and suffixes
+    return makeLattice([0, 10, 20, 30, 40, 50], [(0, 1, 'A', 2.0, 1.0), (0, 2, 'B', 4.5, 1.0), (1, 2, 'C', 2.0, 0.25), (1, 3, 'D', 5.0, 1.0),
+                                                 (2, 3, 'E', 1.0, 1.0), (2, 4, 'F', 4.0, 2.0), (3, 4, 'G', 2.0, 0.25), (3, 4, 'H', 2.5, 0.0),
+                                                 (3, 5, 'I', 6.0, 1.0), (4, 5, 'J', 1.0, 1.0), (0, 3, 'K', 7.5, 0.5)])
@@ -0,0 +1,137 @@
+import numpy as np
+from arrayUtils import expandRanges, reduceByKey
+from latticeCache import readColumnFile, writeColumnFile
+
+MAGIC = b'HTKCNET1'
+
+class ConfusionNetwork(object):
+
+    COLUMNS = ('slotOffsets', 'slotStarts', 'slotEnds', 'entryWords', 'entryPosteriors', 'entryStarts', 'entryEnds')
+
+    # slots are sorted in time, the entries of a slot by decreasing posterior; posteriors are probabilities and
+    # whatever is missing to 1 in a slot is the posterior of skipping it. Times are frames
+    def __init__(self, slotOffsets, slotStarts, slotEnds, entryWords, entryPosteriors, entryStarts, entryEnds, words):
+        self.slotOffsets = slotOffsets
+        self.slotStarts = slotStarts
+        self.slotEnds = slotEnds
+        self.entryWords = entryWords
+        self.entryPosteriors = entryPosteriors
+        self.entryStarts = entryStarts
+        self.entryEnds = entryEnds
+        self.words = words
+        self.numSlots = len(slotOffsets) - 1
+
+    @classmethod
+    def fromLattice(cls, lattice, posteriorProbs, pivotEdges, reduceSegments):
+        # pivot algorithm: the pivot edges (the best path) define one slot each, every other word cluster joins the slot
+        # it overlaps most, and clusters that overlap no pivot form new slots between them. Sorting dominates the cost
+        isWord = ~lattice.words.getFillerMask()
+        edges = np.flatnonzero(isWord[lattice.edgeWords])
+        edgeClusters, clusterWords, clusterStarts, clusterEnds, clusterPosteriors = cls.clusterWords(
+            lattice.edgeWords[edges], lattice.getEdgeStartTimes()[edges], lattice.getEdgeEndTimes()[edges], posteriorProbs[edges], reduceSegments)
+
+        pivotEdges = np.asarray(pivotEdges, dtype=np.int64)
+        pivotEdges = pivotEdges[isWord[lattice.edgeWords[pivotEdges]]]
+        pivotStarts, pivotEnds = lattice.getEdgeStartTimes()[pivotEdges].astype(np.int64), lattice.getEdgeEndTimes()[pivotEdges].astype(np.int64)
+        slots = cls.assignToPivots(clusterStarts, clusterEnds, pivotStarts, pivotEnds)
+        # a cluster holding a pivot stays in the slot of that pivot, however far its other alignments reach
+        slots[edgeClusters[np.searchsorted(edges, pivotEdges)]] = np.arange(len(pivotEdges))
+
+        unassigned = np.flatnonzero(slots < 0)
+        newSlots, newSlotStarts, newSlotEnds = cls.groupOverlapping(clusterStarts[unassigned], clusterEnds[unassigned])
+        slots[unassigned] = len(pivotEdges) + newSlots
+        slotStarts = np.r_[pivotStarts, newSlotStarts]
+        slotEnds = np.r_[pivotEnds, newSlotEnds]
+        slotOrder = np.lexsort((slotEnds, slotStarts))
+        slotRanks = np.empty(len(slotOrder), dtype=np.int64)
+        slotRanks[slotOrder] = np.arange(len(slotOrder))
+        slots = slotRanks[slots]
+
+        # clusters of the same word that ended up in the same slot are one entry
+        numWords = len(lattice.words)
+        keys, posteriors = reduceByKey(slots * numWords + clusterWords, clusterPosteriors, reduceSegments)
+        _, entryStarts = reduceByKey(slots * numWords + clusterWords, clusterStarts, np.minimum.reduceat)
+        _, entryEnds = reduceByKey(slots * numWords + clusterWords, clusterEnds, np.maximum.reduceat)
+        entrySlots, entryWords = keys // numWords, keys % numWords
+        order = np.lexsort((posteriors, entrySlots))
+        slotOffsets = np.zeros(len(slotOrder) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(entrySlots, minlength=len(slotOrder)), out=slotOffsets[1:])
+        return cls(slotOffsets, slotStarts[slotOrder].astype(np.int32), slotEnds[slotOrder].astype(np.int32), entryWords[order].astype(np.int32),
+                   np.minimum(np.exp(-posteriors[order]), 1.0), entryStarts[order].astype(np.int32), entryEnds[order].astype(np.int32), list(lattice.words))
+
+    @classmethod
+    def clusterWords(cls, words, starts, ends, posteriors, reduceSegments):
+        # edges of the same word whose intervals overlap are alternative alignments of one hypothesis, so their posteriors add up
+        words, starts, ends = words.astype(np.int64), starts.astype(np.int64), ends.astype(np.int64)
+        if(not len(words)):
+            return words, words, starts, ends, posteriors
+        span = int(ends.max()) + 1
+        order = np.lexsort((starts, words))
+        words, starts, ends, posteriors = words[order], starts[order], ends[order], posteriors[order]
+        reachedEnds = np.maximum.accumulate(words * span + ends) - words * span
+        isFirst = np.r_[True, (words[1:] != words[:-1]) | (starts[1:] >= reachedEnds[:-1])]
+        clusterStarts = np.flatnonzero(isFirst)
+        edgeClusters = np.empty(len(order), dtype=np.int64)
+        edgeClusters[order] = np.cumsum(isFirst) - 1
+        return (edgeClusters, words[clusterStarts], starts[clusterStarts], np.maximum.reduceat(ends, clusterStarts),
+                reduceSegments(posteriors, clusterStarts))
+
+    @classmethod
+    def assignToPivots(cls, starts, ends, pivotStarts, pivotEnds):
+        # the pivots do not overlap, so the ones a cluster overlaps form a contiguous range found by two binary searches
+        firstPivots = np.searchsorted(pivotEnds, starts, 'right')
+        numPivots = np.maximum(np.searchsorted(pivotStarts, ends, 'left') - firstPivots, 0)
+        slots = np.full(len(starts), -1, dtype=np.int64)
+        clusters = np.flatnonzero(numPivots > 0)
+        if(not clusters.size):
+            return slots
+        candidates = expandRanges(firstPivots[clusters], numPivots[clusters])
+        owners = np.repeat(clusters, numPivots[clusters])
+        overlaps = np.minimum(ends[owners], pivotEnds[candidates]) - np.maximum(starts[owners], pivotStarts[candidates])
+        segmentStarts = np.cumsum(numPivots[clusters]) - numPivots[clusters]
+        bestOverlaps = np.maximum.reduceat(overlaps, segmentStarts)
+        isBest = overlaps == np.repeat(bestOverlaps, numPivots[clusters])
+        bestCandidates = np.flatnonzero(isBest)
+        firstBest = bestCandidates[np.r_[True, owners[bestCandidates[1:]] != owners[bestCandidates[:-1]]]]
+        slots[owners[firstBest]] = candidates[firstBest]
+        return slots
+
+    @classmethod
+    def groupOverlapping(cls, starts, ends):
+        if(not len(starts)):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        order = np.lexsort((ends, starts))
+        reachedEnds = np.maximum.accumulate(ends[order])
+        isFirst = np.r_[True, starts[order][1:] >= reachedEnds[:-1]]
+        groups = np.empty(len(starts), dtype=np.int64)
+        groups[order] = np.cumsum(isFirst) - 1
+        groupStarts = np.flatnonzero(isFirst)
+        return groups, starts[order][groupStarts], np.maximum.reduceat(ends[order], groupStarts)
+
+    @classmethod
+    def load(cls, filePath):
+        loaded = readColumnFile(filePath, MAGIC)
+        assert loaded is not None, filePath + " is not a confusion network file"
+        columns, header = loaded
+        return cls(*[columns[name] for name in cls.COLUMNS], words=header['words'])
+
+    def save(self, filePath):
+        columns = dict((name, np.asarray(getattr(self, name))) for name in ConfusionNetwork.COLUMNS)
+        columns['entryPosteriors'] = columns['entryPosteriors'].astype(np.float32)
+        writeColumnFile(filePath, columns, {'words': self.words}, MAGIC)
+
+    def getSlot(self, slot):
+        entries = slice(self.slotOffsets[slot], self.slotOffsets[slot + 1])
+        return list(zip([self.words[word] for word in self.entryWords[entries]], self.entryPosteriors[entries].tolist()))
+
+    def getSkipPosteriors(self):
+        slotSums = np.add.reduceat(np.r_[self.entryPosteriors, 0], self.slotOffsets[:-1]) if self.numSlots else np.zeros(0)
+        slotSums[np.diff(self.slotOffsets) == 0] = 0
+        return np.maximum(1.0 - slotSums, 0.0)
+
+    def getConsensus(self):
+        # per slot the most probable entry, unless skipping the slot is more probable; returns the chosen entries
+        firstEntries = self.slotOffsets[:-1]
+        hasEntries = np.diff(self.slotOffsets) > 0
+        isChosen = hasEntries & (self.entryPosteriors[np.minimum(firstEntries, max(len(self.entryPosteriors) - 1, 0))] > self.getSkipPosteriors())
+        return firstEntries[isChosen]
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import numpy as np
+from arpaModel import ArpaModel
+from decodeWordGraphs import Lattice, WordGraph
+from latticeParser import FRAMES_PER_SECOND
+from vocabulary import Vocabulary
+
+# the character inventory of the English wav2vec2 CTC heads: <pad> is the blank and | separates words
+DEFAULT_TOKENS = ['<pad>', '<s>', '</s>', '<unk>', '|', "'"] + [chr(code) for code in range(ord('a'), ord('z') + 1)]
+WORD_DELIMITER = '|'
+SINK_WORD = '!NULL'
+INT_COLUMNS = ('key', 'prefixId', 'lastToken', 'partialWord', 'lmState', 'numWords', 'wordNode')
+FLOAT_COLUMNS = ('logBlank', 'logNonBlank', 'lmLogProb', 'nodeAcoustic')
+NODE_COLUMNS = ('parents', 'utterances', 'words', 'frames', 'acousticScores', 'languageScores')
+# WordGraph needs every arc to cost something, so the acoustic scores of a lattice lose at least this much per frame
+MIN_ACOUSTIC_COST_PER_FRAME = 1.0
+
+def getLogSoftmax(logits):
+    logits = np.asarray(logits, dtype=np.float64)
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+def getSyntheticLogProbs(text, tokens=DEFAULT_TOKENS, rng=None, blankIndex=0, wordDelimiter=WORD_DELIMITER, maxTokenFrames=3, maxBlankFrames=2, peak=8.0, noise=1.0):
+    # CTC-like output for a known transcript, to run the decoder without a model: every character of the words joined
+    # by the delimiter peaks for one to maxTokenFrames frames, with blanks in between, on top of Gaussian logit noise
+    rng = rng if rng is not None else np.random.default_rng(0)
+    tokenIds = dict((token, tokenId) for tokenId, token in enumerate(tokens))
+    targets = []
+    for token in [tokenIds[character] for character in wordDelimiter.join(text.lower().split())]:
+        # a repeated character needs a blank in between, or CTC collapses the two
+        numBlankFrames = int(rng.integers(0, maxBlankFrames + 1))
+        if(targets and targets[-1] == token):
+            numBlankFrames = max(1, numBlankFrames)
+        targets += [blankIndex] * numBlankFrames + [token] * int(rng.integers(1, maxTokenFrames + 1))
+    targets += [blankIndex] * int(rng.integers(1, maxBlankFrames + 1))
+    logits = rng.normal(0.0, noise, (len(targets), len(tokens)))
+    logits[np.arange(len(targets)), targets] += peak
+    return getLogSoftmax(logits)
+
+class CTCResult(object):
+
+    def __init__(self, words, score, lattice):
+        self.words = words
+        self.score = score
+        self.lattice = lattice
+
+class CTCPrefixBeamSearch(object):
+
+    # prefix beam search over the character output of a CTC model with a word-level n-gram model, run for a whole batch
+    # at once: every frame extends the beamWidth prefixes of every utterance by the tokensPerFrame most likely tokens,
+    # merges the extensions that spell the same prefix, and keeps the best by acoustic log probability plus lmScale
+    # times the LM log probability of the completed words plus wordBonus per word. Every completed word of a prefix that
+    # made it into a beam becomes a lattice node, so the hypotheses form a tree of words whose paths score exactly like
+    # the hypotheses themselves, ready for WordGraph
+    def __init__(self, tokens=DEFAULT_TOKENS, blankIndex=0, wordDelimiter=WORD_DELIMITER, languageModel=None, lmScale=0.5, wordBonus=0.0, beamWidth=16,
+                 tokensPerFrame=8, tokenMinLogProb=-10.0, framesPerSecond=50, unknownWordOffset=-10.0, vocabulary=None):
+        self.tokens = list(tokens)
+        self.numTokens = len(self.tokens)
+        self.blankIndex = blankIndex
+        self.delimiter = self.tokens.index(wordDelimiter)
+        # special tokens like <s> or <unk> of wav2vec2 vocabularies are never part of a transcript
+        self.extendable = np.array([tokenId != blankIndex and not (token.startswith('<') and token.endswith('>')) for tokenId, token in enumerate(self.tokens)])
+        self.languageModel = languageModel
+        self.lmScale = lmScale
+        self.wordBonus = wordBonus
+        self.beamWidth = beamWidth
+        self.tokensPerFrame = min(tokensPerFrame, int(self.extendable.sum()))
+        self.tokenMinLogProb = tokenMinLogProb
+        self.framesPerSecond = framesPerSecond
+        self.unknownWordOffset = unknownWordOffset
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.lmWordIds = {}
+        self.partialWordIds = {}
+        self.partialWords = ['']
+        self.partialWordsKnown = np.ones(1, dtype=bool)
+        self.lmPrefixes = None
+        self.nodeChunks = []
+        self.numNodes = 0
+        self.numPrefixes = 0
+
+    def getLanguageModelIds(self, words):
+        for word in words:
+            if(word not in self.lmWordIds):
+                self.lmWordIds[word] = int(self.languageModel.getWordIds([word])[0])
+        return np.array([self.lmWordIds[word] for word in words], dtype=np.int64)
+
+    def scoreWords(self, states, words):
+        # natural log probabilities of the words and the LM states after them. A spelling the LM does not know is most
+        # likely a misspelling, which <unk> would otherwise welcome like any rare word
+        if(self.languageModel is None or not len(words)):
+            return np.zeros(len(words)), states
+        scores, nextStates = self.languageModel.score(states, self.getLanguageModelIds(words))
+        isUnknown = np.array([word not in self.languageModel.wordIds for word in words])
+        return -scores + self.unknownWordOffset * isUnknown, nextStates
+
+    def scoreSentenceEnds(self, states):
+        if(self.languageModel is None or self.languageModel.endWord < 0 or not len(states)):
+            return np.zeros(len(states))
+        return -self.languageModel.score(states, np.full(len(states), self.languageModel.endWord))[0]
+
+    def getPartialWords(self, partialWords, tokens):
+        # the partial word of a prefix is an id into a trie of the spellings seen so far, extended once per distinct spelling
+        uniqueKeys, inverse = np.unique(partialWords * self.numTokens + tokens, return_inverse=True)
+        ids = np.empty(len(uniqueKeys), dtype=np.int64)
+        numPartialWords = len(self.partialWords)
+        for position, key in enumerate(uniqueKeys.tolist()):
+            if(key not in self.partialWordIds):
+                self.partialWordIds[key] = len(self.partialWords)
+                self.partialWords.append(self.partialWords[key // self.numTokens] + self.tokens[key % self.numTokens])
+            ids[position] = self.partialWordIds[key]
+        if(len(self.partialWords) > numPartialWords):
+            # the flags grow by doubling, so they are not copied once per frame
+            if(len(self.partialWords) > len(self.partialWordsKnown)):
+                self.partialWordsKnown = np.r_[self.partialWordsKnown, np.ones(max(len(self.partialWords), 2 * len(self.partialWordsKnown)) - len(self.partialWordsKnown), dtype=bool)]
+            self.partialWordsKnown[numPartialWords:len(self.partialWords)] = [self.isKnownPrefix(partialWord) for partialWord in self.partialWords[numPartialWords:]]
+        return ids[inverse.reshape(-1)]
+
+    def isKnownPrefix(self, partialWord):
+        if(self.languageModel is None):
+            return True
+        if(self.lmPrefixes is None):
+            self.lmPrefixes = set(word[:length] for word in self.languageModel.words for length in range(1, len(word) + 1))
+        return partialWord in self.lmPrefixes
+
+    def addNodes(self, parents, utterances, words, frames, acousticScores, languageScores):
+        # a node stands for a completed word and holds the scores of the arc from the node of the word before
+        nodeIds = self.numNodes + np.arange(len(parents))
+        self.nodeChunks.append((parents, utterances, np.array([self.vocabulary.intern(word) for word in words], dtype=np.int64), frames, acousticScores, languageScores))
+        self.numNodes += len(parents)
+        return nodeIds
+
+    def allocateBeams(self, numUtterances):
+        beams = dict((name, np.full((numUtterances, self.beamWidth), -1, dtype=np.int64)) for name in INT_COLUMNS)
+        beams.update((name, np.full((numUtterances, self.beamWidth), -np.inf)) for name in FLOAT_COLUMNS)
+        return beams
+
+    def decode(self, logProbs, lengths=None):
+        # logProbs: (utterances x frames x tokens) log probabilities or logits, padded behind the given lengths
+        logProbs = getLogSoftmax(logProbs)
+        if(logProbs.ndim == 2):
+            logProbs = logProbs[None]
+        numUtterances, numFrames, _ = logProbs.shape
+        lengths = np.full(numUtterances, numFrames, dtype=np.int64) if lengths is None else np.asarray(lengths, dtype=np.int64)
+        self.partialWordIds, self.partialWords, self.partialWordsKnown = {}, [''], np.ones(1, dtype=bool)
+        self.nodeChunks, self.numNodes = [], 0
+
+        utterances = np.arange(numUtterances)
+        # the roots stand for the start of the utterances, their word is never on an arc
+        roots = self.addNodes(np.full(numUtterances, -1), utterances, [SINK_WORD] * numUtterances, np.zeros(numUtterances, dtype=np.int64), np.zeros(numUtterances), np.zeros(numUtterances))
+        beams = self.allocateBeams(numUtterances)
+        initial = {'key': -1 - utterances, 'prefixId': utterances, 'logBlank': 0.0, 'logNonBlank': -np.inf, 'lastToken': -1, 'partialWord': 0,
+                   'lmState': self.languageModel.startState if self.languageModel is not None else 0, 'lmLogProb': 0.0, 'numWords': 0, 'wordNode': roots, 'nodeAcoustic': 0.0}
+        for name, value in initial.items():
+            beams[name][:, 0] = value
+        self.numPrefixes = numUtterances
+
+        for frame in range(int(lengths.max()) if numUtterances else 0):
+            rows = np.flatnonzero(lengths > frame)
+            self.step(beams, rows, logProbs[rows, frame], frame)
+        return self.finish(beams, lengths)
+
+    def decodeBatches(self, utterances, batchSize=8):
+        # utterances: an iterable of (frames x tokens) matrices, decoded batchSize at a time and yielded in order
+        batch = []
+        for logProbs in utterances:
+            batch.append(np.asarray(logProbs, dtype=np.float64))
+            if(len(batch) == batchSize):
+                yield from self.decodePadded(batch)
+                batch = []
+        if(batch):
+            yield from self.decodePadded(batch)
+
+    def decodePadded(self, batch):
+        lengths = np.array([len(logProbs) for logProbs in batch])
+        padded = np.zeros((len(batch), int(lengths.max()), self.numTokens))
+        for row, logProbs in enumerate(batch):
+            padded[row, :len(logProbs)] = logProbs
+        return self.decode(padded, lengths)
+
+    def step(self, beams, rows, frameLogProbs, frame):
+        slots = dict((name, column[rows]) for name, column in beams.items())
+        totals = np.logaddexp(slots['logBlank'], slots['logNonBlank'])
+        valid = np.isfinite(totals)
+
+        # a blank, or a repetition of the last token that CTC collapses, keeps the prefix
+        lastLogProbs = np.where(slots['lastToken'] >= 0, np.take_along_axis(frameLogProbs, np.maximum(slots['lastToken'], 0), 1), -np.inf)
+        stayRows, staySlots = np.nonzero(valid)
+        stayBlank = (totals + frameLogProbs[:, [self.blankIndex]])[stayRows, staySlots]
+        stayNonBlank = (slots['logNonBlank'] + lastLogProbs)[stayRows, staySlots]
+
+        # any other of the best tokens of the frame extends it; the last token again only after a blank
+        extendable = np.where(self.extendable, frameLogProbs, -np.inf)
+        topTokens = np.argpartition(-extendable, self.tokensPerFrame - 1, axis=1)[:, :self.tokensPerFrame]
+        topLogProbs = np.take_along_axis(extendable, topTokens, 1)
+        extendRows, extendSlots, extendRanks = np.nonzero(valid[:, :, None] & (topLogProbs >= self.tokenMinLogProb)[:, None, :])
+        extendTokens = topTokens[extendRows, extendRanks]
+        extendNonBlank = np.where(extendTokens == slots['lastToken'][extendRows, extendSlots], slots['logBlank'][extendRows, extendSlots],
+                                  totals[extendRows, extendSlots]) + topLogProbs[extendRows, extendRanks]
+
+        # candidates spelling the same prefix share its key and are merged; the kept prefix comes first, so a merged
+        # group keeps its state instead of the state of a fresh extension
+        candidateRows, candidateSlots = np.r_[stayRows, extendRows], np.r_[staySlots, extendSlots]
+        candidateTokens = np.r_[np.full(len(stayRows), -1), extendTokens]
+        keys = np.r_[slots['key'][stayRows, staySlots], slots['prefixId'][extendRows, extendSlots] * self.numTokens + extendTokens]
+        candidateBlank, candidateNonBlank = np.r_[stayBlank, np.full(len(extendRows), -np.inf)], np.r_[stayNonBlank, extendNonBlank]
+        alive = np.flatnonzero(np.isfinite(np.logaddexp(candidateBlank, candidateNonBlank)))
+        order = alive[np.argsort(keys[alive], kind='stable')]
+        groupStarts = np.flatnonzero(np.r_[True, keys[order][1:] != keys[order][:-1]])
+        logBlank = np.logaddexp.reduceat(candidateBlank[order], groupStarts)
+        logNonBlank = np.logaddexp.reduceat(candidateNonBlank[order], groupStarts)
+        representatives = order[groupStarts]
+        groupRows, tokens = candidateRows[representatives], candidateTokens[representatives]
+        groups = dict((name, column[groupRows, candidateSlots[representatives]]) for name, column in slots.items())
+        groups['logBlank'], groups['logNonBlank'] = logBlank, logNonBlank
+        isExtension = tokens >= 0
+        groups['key'] = np.where(isExtension, keys[representatives], groups['key'])
+        groups['lastToken'] = np.where(isExtension, tokens, groups['lastToken'])
+
+        # a delimiter after a partial word completes it, which the beam has to rank with its LM score
+        wordEnds = np.flatnonzero((tokens == self.delimiter) & (groups['partialWord'] > 0))
+        words = [self.partialWords[partialWord] for partialWord in groups['partialWord'][wordEnds].tolist()]
+        wordLogProbs, groups['lmState'][wordEnds] = self.scoreWords(groups['lmState'][wordEnds], words)
+        groups['lmLogProb'][wordEnds] += wordLogProbs
+        groups['numWords'][wordEnds] += 1
+        groups['partialWord'][tokens == self.delimiter] = 0
+        spelled = np.flatnonzero(isExtension & (tokens != self.delimiter))
+        groups['partialWord'][spelled] = self.getPartialWords(groups['partialWord'][spelled], tokens[spelled])
+        groupTotals = np.logaddexp(logBlank, logNonBlank)
+        # a partial word that no LM word starts with is going to be unknown, which the beam should not wait for
+        isUnknownPrefix = ~self.partialWordsKnown[groups['partialWord']]
+        scores = groupTotals + self.lmScale * (groups['lmLogProb'] + self.unknownWordOffset * isUnknownPrefix) + self.wordBonus * groups['numWords']
+
+        # the beamWidth best prefixes of every utterance
+        ranking = np.lexsort((-scores, groupRows))
+        rankedRows = groupRows[ranking]
+        rowStarts = np.flatnonzero(np.r_[True, rankedRows[1:] != rankedRows[:-1]])
+        ranks = np.arange(len(ranking)) - np.repeat(rowStarts, np.diff(np.r_[rowStarts, len(ranking)]))
+        selected, positions = ranking[ranks < self.beamWidth], ranks[ranks < self.beamWidth]
+
+        # only prefixes that made it into a beam get an id or a lattice node
+        newGroups = selected[isExtension[selected]]
+        groups['prefixId'][newGroups] = self.numPrefixes + np.arange(len(newGroups))
+        self.numPrefixes += len(newGroups)
+        isSelected = np.zeros(len(representatives), dtype=bool)
+        isSelected[selected] = True
+        keptWordEnds = isSelected[wordEnds]
+        completed = wordEnds[keptWordEnds]
+        groups['wordNode'][completed] = self.addNodes(groups['wordNode'][completed], rows[groupRows[completed]], [word for word, kept in zip(words, keptWordEnds) if kept],
+                                                      np.full(len(completed), frame), groupTotals[completed] - groups['nodeAcoustic'][completed] + self.wordBonus, wordLogProbs[keptWordEnds])
+        groups['nodeAcoustic'][completed] = groupTotals[completed]
+
+        updated = self.allocateBeams(len(rows))
+        for name, column in updated.items():
+            column[groupRows[selected], positions] = groups[name][selected]
+            beams[name][rows] = column
+
+    def finish(self, beams, lengths):
+        rows, slots = np.nonzero(np.isfinite(np.logaddexp(beams['logBlank'], beams['logNonBlank'])))
+        final = dict((name, column[rows, slots]) for name, column in beams.items())
+        totals = np.logaddexp(final['logBlank'], final['logNonBlank'])
+
+        # the partial word at the end of the utterance is complete, and the LM scores the end of the sentence. The arcs into
+        # the sink carry that word, or !NULL after a delimiter, so none of them is empty
+        wordEnds = np.flatnonzero(final['partialWord'] > 0)
+        words = [self.partialWords[partialWord] for partialWord in final['partialWord'][wordEnds].tolist()]
+        wordLogProbs, final['lmState'][wordEnds] = self.scoreWords(final['lmState'][wordEnds], words)
+        endLogProbs = self.scoreSentenceEnds(final['lmState'])
+        finalWords = np.full(len(rows), self.vocabulary.intern(SINK_WORD), dtype=np.int64)
+        finalWords[wordEnds] = [self.vocabulary.intern(word) for word in words]
+        finalAcousticScores = totals - final['nodeAcoustic']
+        finalAcousticScores[wordEnds] += self.wordBonus
+        finalLanguageScores = endLogProbs.copy()
+        finalLanguageScores[wordEnds] += wordLogProbs
+        final['numWords'][wordEnds] += 1
+        scores = totals + self.lmScale * (final['lmLogProb'] + finalLanguageScores) + self.wordBonus * final['numWords']
+
+        nodes = dict((name, np.concatenate([chunk[index] for chunk in self.nodeChunks])) for index, name in enumerate(NODE_COLUMNS))
+        # only the words on the way to a final hypothesis stay in the lattice
+        alive = np.zeros(self.numNodes, dtype=bool)
+        alive[final['wordNode']] = True
+        while(True):
+            parents = nodes['parents'][alive]
+            parents = parents[parents >= 0]
+            if(alive[parents].all()):
+                break
+            alive[parents] = True
+
+        results = []
+        for utterance in range(len(lengths)):
+            finals = np.flatnonzero(rows == utterance)
+            best = finals[np.argmax(scores[finals])]
+            bestWords = [self.vocabulary[finalWords[best]]] if finalWords[best] != self.vocabulary.intern(SINK_WORD) else []
+            node = final['wordNode'][best]
+            while(nodes['parents'][node] >= 0):
+                bestWords.append(self.vocabulary[nodes['words'][node]])
+                node = nodes['parents'][node]
+            lattice = self.buildLattice(nodes, np.flatnonzero(alive & (nodes['utterances'] == utterance)), final['wordNode'][finals], finalWords[finals],
+                                        finalAcousticScores[finals], finalLanguageScores[finals], int(lengths[utterance]))
+            results.append(CTCResult(bestWords[::-1], float(scores[best]), lattice))
+        return results
+
+    def buildLattice(self, nodes, keptNodes, finalNodes, finalWords, finalAcousticScores, finalLanguageScores, numFrames):
+        # the kept nodes were created in time order, so their order is topological with the root first; one sink follows
+        newIndices = np.full(self.numNodes, -1, dtype=np.int64)
+        newIndices[keptNodes] = np.arange(len(keptNodes))
+        sink = len(keptNodes)
+        wordNodes = keptNodes[1:]
+        edgeFrom = np.r_[newIndices[nodes['parents'][wordNodes]], newIndices[finalNodes]]
+        edgeTo = np.r_[newIndices[wordNodes], np.full(len(finalNodes), sink)]
+        edgeWords = np.r_[nodes['words'][wordNodes], finalWords]
+        acousticScores = np.r_[nodes['acousticScores'][wordNodes], finalAcousticScores]
+        languageScores = np.r_[nodes['languageScores'][wordNodes], finalLanguageScores]
+        # the acoustic score of an arc is the difference of the prefix probabilities at its two ends, which can be a gain,
+        # and the word bonus rides on it too. Every path spans all frames, so taking the same amount off every frame
+        # turns all arcs into costs without changing the ranking or the posteriors of the paths
+        frames = np.r_[nodes['frames'][keptNodes], numFrames]
+        durations = frames[edgeTo] - frames[edgeFrom]
+        hasFrames = durations > 0
+        costPerFrame = max(0.0, float(np.max(acousticScores[hasFrames] / durations[hasFrames], initial=0.0))) + MIN_ACOUSTIC_COST_PER_FRAME
+        acousticScores = acousticScores - costPerFrame * durations
+        order = np.lexsort((edgeTo, edgeFrom))
+        nodeTimes = np.rint(frames * FRAMES_PER_SECOND / float(self.framesPerSecond))
+        return Lattice(nodeTimes, edgeFrom[order], edgeTo[order], edgeWords[order], -acousticScores[order], -languageScores[order], self.vocabulary, self.lmScale)
+
+def loadTokens(vocabularyFilePath):
+    # the vocab.json of a wav2vec2 processor, mapping every token to its index
+    with open(vocabularyFilePath, 'r', encoding='utf-8') as file:
+        tokenIds = json.load(file)
+    return [token for token, _ in sorted(tokenIds.items(), key=lambda item: item[1])]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Decode CTC outputs with a prefix beam search and a word n-gram model into HTK lattices and a CTM')
+    parser.add_argument('--logits', nargs='+', default=[], help='.npy files of (frames x tokens) logits or log probabilities')
+    parser.add_argument('--synthetic', nargs='+', default=[], help='transcripts to decode from synthetic CTC output instead')
+    parser.add_argument('--tokens', default=None, help='vocab.json of the CTC model, defaults to the English wav2vec2 characters')
+    parser.add_argument('--blank', default='<pad>')
+    parser.add_argument('--word-delimiter', default=WORD_DELIMITER)
+    parser.add_argument('--arpa', default=None)
+    parser.add_argument('--lm-scale', type=float, default=0.5)
+    parser.add_argument('--word-bonus', type=float, default=0.0)
+    parser.add_argument('--beam-width', type=int, default=16)
+    parser.add_argument('--tokens-per-frame', type=int, default=8)
+    parser.add_argument('--token-min-log-prob', type=float, default=-10.0)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--frames-per-second', type=float, default=50.0)
+    parser.add_argument('--unknown-word-offset', type=float, default=-10.0, help='added to the LM log probability of words the LM does not know')
+    parser.add_argument('--lattice-dir', default=None, help='write the lattice of every utterance to this directory')
+    parser.add_argument('--ctm', default=None, help='decode the lattices with WordGraph and write the CTM to this file')
+    parser.add_argument('--pruning-threshold', type=float, default=500.0)
+    parser.add_argument('--mode', default='log semiring', choices=['log semiring', 'tropical semiring'])
+    parser.add_argument('--noise', type=float, default=1.0, help='standard deviation of the synthetic logit noise')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tokens = loadTokens(args.tokens) if args.tokens is not None else DEFAULT_TOKENS
+    decoder = CTCPrefixBeamSearch(tokens, tokens.index(args.blank), args.word_delimiter, ArpaModel.load(args.arpa) if args.arpa is not None else None, args.lm_scale,
+                                  args.word_bonus, args.beam_width, args.tokens_per_frame, args.token_min_log_prob, args.frames_per_second, args.unknown_word_offset)
+    rng = np.random.default_rng(args.seed)
+    names = [os.path.basename(path).split('.npy')[0] for path in args.logits] + ['synthetic%d' % index for index in range(len(args.synthetic))]
+    utterances = [np.load(path) for path in args.logits] + [getSyntheticLogProbs(text, tokens, rng, tokens.index(args.blank), args.word_delimiter, noise=args.noise) for text in args.synthetic]
+    if(args.lattice_dir is not None):
+        os.makedirs(args.lattice_dir, exist_ok=True)
+    resultFile = open(args.ctm, 'w') if args.ctm is not None else None
+    startTime = 0.0
+    for name, logProbs, result in zip(names, utterances, decoder.decodeBatches(utterances, args.batch_size)):
+        print(name + ': ' + ' '.join(result.words))
+        if(args.lattice_dir is not None):
+            result.lattice.write(os.path.join(args.lattice_dir, name + '.htk.gz'), name)
+        if(resultFile is not None):
+            # the utterances follow each other on one time line
+            wordGraph = WordGraph(None, startTime, '_' + name, None, None, args.pruning_threshold, None, args.mode, vocabulary=decoder.vocabulary, lattice=result.lattice)
+            resultFile.writelines(wordGraph.getCTMLines())
+            startTime = round(startTime + len(logProbs) / args.frames_per_second, 3)
+    if(resultFile is not None):
+        resultFile.close()
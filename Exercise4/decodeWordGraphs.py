@@ -3,275 +3,591 @@ import gzip
 import math
 import sys
 import os
-from operator import attrgetter
-
-class Node(object):
-
-    def __init__(self, index, time):
-        self.index = index
-        self.startTime = time
-        self.incomingEdges = []
-        self.outgoingEdges = []
-        self.forwardProb = None
-        self.backwardProb = None
-        self.endTime = None
-        self.valueForViterbiResult = 0
-
-    def addToIncomingEdges(self, edge):
-        self.incomingEdges.append(edge)
-
-    def addToOutgoingEdges(self, edge):
-        self.outgoingEdges.append(edge)
-
-    def setForwardProb(self, p):
-        self.forwardProb = p
-
-    def setBackwardProb(self, p):
-        self.backwardProb = p
-
-    def setEndTime(self):
-        if(self.outgoingEdges):
-            self.endTime = getattr(max(self.outgoingEdges, key=attrgetter('endTime')),'endTime')
-        else:
-            self.endTime = self.startTime
-
-class Edge(object):
-
-    def __init__(self, index, nodeFrom, nodeTo, word, acousticScore, languageScore, lmScale):
-        self.index = index
-        self.nodeFrom = nodeFrom
-        self.nodeTo = nodeTo
-        self.word = word
-        self.acousticScore = acousticScore
-        self.languageScore = languageScore
-        self.weight = self.acousticScore + lmScale * self.languageScore
-        self.posteriorProb = None
-        self.startTime = None
-        self.endTime = None
-        self.confidenceMeasure = float('inf')
-
-    def setNegativeLogPosteriorProb(self, posteriorProb):
-        self.posteriorProb = posteriorProb
-
-    def setStartEndTimes(self, nodes):
-        self.startTime = nodes[self.nodeFrom].startTime
-        self.endTime = nodes[self.nodeTo].startTime
+import numpy as np
+from latticeParser import LatticeParser, FRAMES_PER_SECOND
+from framePosteriors import FrameWordPosteriors
+from arrayUtils import gatherSegments
+from nBest import NBestEnumerator
+from confusionNetwork import ConfusionNetwork
+from runStats import RunStats
+from vocabulary import Vocabulary
+
+CTM_NAME = 'QRBC_ENG_GB_20110106_104800_BBC_PHONEIN_POD'
+
+def getCTMHeaderLines(code, startTime, endTime):
+    return [";; <name> <track> <start> <duration> <word>\n",
+            ";; " + CTM_NAME + "/" + CTM_NAME + code + " (" + str(startTime) + "-" + str(round(startTime + endTime/float(FRAMES_PER_SECOND), 3)) + ")\n"]
+
+def getCTMWordLine(startTime, duration, word):
+    return CTM_NAME + " 1 " + str(startTime) + " " + str(duration) + " " + word + "\n"
+
+class Lattice(object):
+
+    COLUMNS = ('nodeTimes', 'edgeFrom', 'edgeTo', 'edgeWords', 'acousticScores', 'languageScores', 'outgoingOffsets', 'outgoingEdges', 'incomingOffsets', 'incomingEdges')
+
+    def __init__(self, nodeTimes, edgeFrom, edgeTo, edgeWords, acousticScores, languageScores, words, lmScale, outgoing=None, incoming=None):
+        self.nodeTimes = np.asarray(nodeTimes, dtype=np.int32)
+        self.edgeFrom = np.asarray(edgeFrom, dtype=np.int32)
+        self.edgeTo = np.asarray(edgeTo, dtype=np.int32)
+        self.edgeWords = np.asarray(edgeWords, dtype=np.int32)
+        self.acousticScores = np.asarray(acousticScores, dtype=np.float64)
+        self.languageScores = np.asarray(languageScores, dtype=np.float64)
+        self.words = words
+        self.lmScale = lmScale
+        self.numNodes = len(self.nodeTimes)
+        self.numEdges = len(self.edgeFrom)
+        self.outgoingOffsets, self.outgoingEdges = outgoing if outgoing is not None else self.buildAdjacency(self.edgeFrom)
+        self.incomingOffsets, self.incomingEdges = incoming if incoming is not None else self.buildAdjacency(self.edgeTo)
+        self.levels = None
+        self.forwardSchedule = None
+        self.backwardSchedule = None
+
+    @classmethod
+    def fromColumns(cls, columns, words, lmScale):
+        return cls(columns['nodeTimes'], columns['edgeFrom'], columns['edgeTo'], columns['edgeWords'], columns['acousticScores'], columns['languageScores'], words, lmScale,
+                   outgoing=(columns['outgoingOffsets'], columns['outgoingEdges']), incoming=(columns['incomingOffsets'], columns['incomingEdges']))
+
+    @classmethod
+    def load(cls, latticeFilePath, vocabulary, latticeCache=None):
+        cached = latticeCache.load(latticeFilePath) if latticeCache is not None else None
+        if(cached is not None):
+            columns, metadata = cached
+            # the cached ids index the words of the lattice itself, which are translated to the vocabulary here
+            columns = dict(columns)
+            columns['edgeWords'] = vocabulary.internAll(metadata['words'])[columns['edgeWords']]
+            return cls.fromColumns(columns, vocabulary, metadata['lmScale'])
+        columns, words, latticeLmScale = LatticeParser(vocabulary=vocabulary).parse(latticeFilePath)
+        lattice = cls(columns['nodeTimes'], columns['edgeFrom'], columns['edgeTo'], columns['edgeWords'], columns['acousticScores'], columns['languageScores'], words, latticeLmScale)
+        if(latticeCache is not None):
+            # only the words of this lattice are stored, so the entry does not grow with the vocabulary
+            wordIds, localEdgeWords = np.unique(lattice.edgeWords, return_inverse=True)
+            columns = dict(lattice.getColumns(), edgeWords=localEdgeWords.reshape(-1).astype(np.int32))
+            latticeCache.store(latticeFilePath, columns, {'words': [vocabulary[wordId] for wordId in wordIds.tolist()], 'lmScale': latticeLmScale})
+        return lattice
+
+    def getColumns(self):
+        return {name: getattr(self, name) for name in Lattice.COLUMNS}
+
+    def getHTKLines(self, utterance):
+        # the layout of the bundled lattices, which LatticeParser reads back to the same columns; scores are written
+        # with the shortest repr that parses to the same float
+        yield "VERSION=1.0\nUTTERANCE=%s\nlmscale=%r\n\n# Lattice Size\nNODES=%d\nLINKS=%d\n\n# Nodes\n" % (utterance, float(self.lmScale), self.numNodes, self.numEdges)
+        for node, time in enumerate((self.nodeTimes / float(FRAMES_PER_SECOND)).tolist()):
+            yield "I=%d t=%.2f\n" % (node, time)
+        yield "\n# Links\n"
+        for edge, (nodeFrom, nodeTo, word, acousticScore, languageScore) in enumerate(zip(self.edgeFrom.tolist(), self.edgeTo.tolist(), self.edgeWords.tolist(), (-self.acousticScores).tolist(), (-self.languageScores).tolist())):
+            yield "J=%d S=%d E=%d W=\"%s\" v=0 a=%r l=%r\n" % (edge, nodeFrom, nodeTo, self.words[word], acousticScore, languageScore)
+
+    def write(self, latticeFilePath, utterance):
+        with gzip.open(latticeFilePath, 'wt', compresslevel=1) as file:
+            file.writelines(self.getHTKLines(utterance))
+        return latticeFilePath
+
+    def buildAdjacency(self, nodeOfEdge):
+        offsets = np.zeros(self.numNodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(nodeOfEdge, minlength=self.numNodes), out=offsets[1:])
+        edges = np.argsort(nodeOfEdge, kind='stable').astype(np.int32)
+        return offsets, edges
+
+    def getWeights(self, lmScale, acousticScale=1.0):
+        if(np.ndim(lmScale) == 0 and np.ndim(acousticScale) == 0):
+            return acousticScale * self.acousticScores + lmScale * self.languageScores
+        # vectors of K scales give an (edges x K) matrix, one column per pair of scales
+        lmScales, acousticScales = np.broadcast_arrays(np.asarray(lmScale, dtype=np.float64), np.asarray(acousticScale, dtype=np.float64))
+        return np.multiply.outer(self.acousticScores, acousticScales) + np.multiply.outer(self.languageScores, lmScales)
+
+    def getEdgeStartTimes(self):
+        return self.nodeTimes[self.edgeFrom]
+
+    def getEdgeEndTimes(self):
+        return self.nodeTimes[self.edgeTo]
+
+    def sortNodesTopologically(self):
+        remainingInDegree = np.diff(self.incomingOffsets)
+        frontier = np.flatnonzero(remainingInDegree == 0).astype(np.int32)
+        levels = []
+        numSorted = 0
+        while(frontier.size):
+            levels.append(frontier)
+            numSorted += frontier.size
+            edges, _ = gatherSegments(self.outgoingOffsets, self.outgoingEdges, frontier)
+            successors, counts = np.unique(self.edgeTo[edges], return_counts=True)
+            remainingInDegree[successors] -= counts
+            frontier = successors[remainingInDegree[successors] == 0]
+        assert numSorted == self.numNodes, "Lattice contains a cycle"
+        self.levels = levels
+        self.forwardSchedule = self.buildSchedule(levels, self.incomingOffsets, self.incomingEdges, self.edgeFrom, 0)
+        self.backwardSchedule = self.buildSchedule(levels[::-1], self.outgoingOffsets, self.outgoingEdges, self.edgeTo, self.numNodes - 1)
+
+    def getReachableNodes(self, schedule, initialNode, keepEdges):
+        reachable = np.zeros(self.numNodes, dtype=bool)
+        reachable[initialNode] = True
+        for nodes, edges, otherNodes, segmentStarts in schedule:
+            reachable[nodes] = np.logical_or.reduceat(reachable[otherNodes] & keepEdges[edges], segmentStarts)
+        return reachable
+
+    def getSubgraph(self, keepEdges):
+        keepNodes = self.getReachableNodes(self.forwardSchedule, 0, keepEdges) & self.getReachableNodes(self.backwardSchedule, self.numNodes - 1, keepEdges)
+        keptNodes = np.flatnonzero(keepNodes)
+        keptEdges = np.flatnonzero(keepEdges & keepNodes[self.edgeFrom] & keepNodes[self.edgeTo])
+        newNodeIndices = np.cumsum(keepNodes) - 1
+        subgraph = Lattice(self.nodeTimes[keptNodes], newNodeIndices[self.edgeFrom[keptEdges]], newNodeIndices[self.edgeTo[keptEdges]], self.edgeWords[keptEdges],
+                           self.acousticScores[keptEdges], self.languageScores[keptEdges], self.words, self.lmScale)
+        return subgraph, keptNodes, keptEdges
+
+    def buildSchedule(self, levels, offsets, adjacentEdges, otherNode, initialNode):
+        hasEdges = np.diff(offsets) > 0
+        schedule = []
+        for nodes in levels:
+            nodes = nodes[hasEdges[nodes] & (nodes != initialNode)]
+            if(nodes.size):
+                edges, segmentStarts = gatherSegments(offsets, adjacentEdges, nodes)
+                schedule.append((nodes, edges, otherNode[edges], segmentStarts))
+        return schedule
+
+def getParameterKey(value):
+    # scales given as arrays or lists are compared by value, everything else by equality
+    if(isinstance(value, (list, tuple, np.ndarray))):
+        return tuple(np.ravel(value).tolist())
+    return value
 
 class WordGraph(object):
 
-    def __init__(self, latticeFilePath, startTime, code, resultFilePath, confMeasFilePath, pruningThreshold, lmScale, mode):
+    # every stage: the method computing it, the parameters it reads and the stages it uses. Nothing is computed before it
+    # is asked for, and a result is reused until one of these changes, so e.g. a new pruningThreshold only prunes again
+    STAGES = {
+        'parsedLattice': ('parseLattice', (), ()),
+        'sortedLattice': ('sortNodesTopologically', (), ('parsedLattice',)),
+        'lattice': ('rescoreWithLanguageModel', ('rescorer', 'rescoringLmScale'), ('sortedLattice',)),
+        'weights': ('calculateWeights', ('lmScale',), ('lattice',)),
+        'forwardBackward': ('runForwardBackwardAlgorithm', ('mode',), ('lattice', 'weights')),
+        'sweep': ('runMultiScaleForwardBackward', ('mode', 'sweepLmScales', 'sweepAcousticScales'), ('lattice',)),
+        'timeWordPosteriors': ('calculateTimeFrameWordPosteriors', (), ('lattice', 'forwardBackward')),
+        'confidences': ('calculateMeanConfidenceMeasures', (), ('lattice', 'timeWordPosteriors')),
+        'rescoredWeights': ('rescoreWordGraph', ('confidenceRescoring', 'mode'), ('lattice', 'weights')),
+        'rescoredForwardBackward': ('runRescoredForwardBackward', ('confidenceRescoring', 'mode'), ('lattice', 'rescoredWeights')),
+        'bestPath': ('decodeWordGraph', (), ('lattice', 'rescoredWeights')),
+        'prunedGraph': ('pruneWordGraph', ('pruningThreshold', 'maxArcsPerFrame'), ('lattice', 'rescoredForwardBackward', 'bestPath')),
+        'confusionNetwork': ('buildConfusionNetwork', (), ('prunedGraph',)),
+    }
+
+    def __init__(self, latticeFilePath, startTime, code, resultFilePath, confMeasFilePath, pruningThreshold, lmScale, mode, latticeCache=None, maxArcsPerFrame=None, statsFilePath=None, traceMemory=False, rescorer=None, vocabulary=None, sweepLmScales=None, sweepAcousticScales=1.0, lattice=None, confidenceRescoring=False):
+        self.latticeFilePath = latticeFilePath
+        self.residentLattice = lattice
         self.mode = mode
-        self.nodes = []
-        self.edges = []
-        self.encodedResults = []
-        self.lmScale = lmScale 
-        self.numNodes = None
-        self.numEdges = None
-        self.fullPathProb = None
-        self.startTime = startTime
-        self.bestNegativeLogPosteriorProb = None
-        self.timeWordPosteriors = None
+        # a lattice given in memory brings the vocabulary its word ids belong to
+        if(vocabulary is None):
+            vocabulary = lattice.words if lattice is not None else Vocabulary()
+        self.vocabulary = vocabulary
+        self.rescorer = rescorer
+        self.latticeCache = latticeCache
+        self.maxArcsPerFrame = maxArcsPerFrame
+        self.lmScale = lmScale
+        self.sweepLmScales = sweepLmScales
+        self.sweepAcousticScales = sweepAcousticScales
         self.pruningThreshold = pruningThreshold
+        self.confidenceRescoring = confidenceRescoring
+        self.consensus = False
+        self.startTime = startTime
         self.code = code
+        # output paths are only the defaults of the writers, which have to be called explicitly
         self.resultFilePath = resultFilePath
         self.confMeasFilePath = confMeasFilePath
-        self.confMeasFilePath = confMeasFilePath
-        self.parseLattice(latticeFilePath)
-#        self.sortNodesTopologically() needs to be implemented
-        self.setNodesEndTime()
-        self.endTime = self.nodes[-1].endTime
-        self.runForwardBackwardAlgorithm()
-        self.calculateTimeFrameWordPosteriors()
-        self.calculateMeanConfidenceMeasures()
-#        Rescoring makes the score worse in my case
-#        self.rescoreWordGraph()
-        self.pruneWordGraph()
-        self.decodeWordGraph()
-        self.writeResultsToCTMFile()
-        self.writeConfidenceMeasuresToFile()
-        for edge in self.edges:
-            assert edge.startTime == self.nodes[edge.nodeFrom].startTime
-
-    def setNodesEndTime(self):
-        for node in self.nodes:
-            node.setEndTime()
-
-    def getWordGraphDensity(self):
-        return self.numEdges/float(self.words)
-
-    def parseLattice(self, latticeFilePath):
-        with gzip.open(latticeFilePath, 'rb') as file:
-            for line in file:
-                line = self.convertToRegString(line)
-                lineType = self.getLineType(line)
-                if(lineType == 'edge'):
-                    edge = self.parseEdge(line)
-                    edge.setStartEndTimes(self.nodes)
-                    self.nodes[edge.nodeFrom].addToOutgoingEdges(edge)
-                    self.nodes[edge.nodeTo].addToIncomingEdges(edge)
-                    self.edges.append(edge)
-                elif(lineType == 'node'):
-                     self.nodes.append(self.parseNode(line))
-                elif(lineType == 'lmScale'):
-                    if(self.lmScale == None):
-                        self.lmScale = self.parseLmScale(line)
-        self.numNodes = len(self.nodes)
-        self.numEdges = len(self.edges)
-
-    def convertToRegString(self, line):
-        return str(line[:-1],'utf-8')
-
-    def getLineType(self, line):
-        if(line.startswith('J=')):
-            return 'edge'
-        elif(line.startswith('I=')):
-            return 'node'
-        elif(line.startswith('lmscale=')):
-            return 'lmScale'
-        else:
-            return None
+        self.statsFilePath = statsFilePath
+        self.stats = RunStats(latticeFilePath, traceMemory)
+        self.results = {}
+        self.numComputedResults = 0
+
+    def getResult(self, name):
+        methodName, parameters, dependencies = self.STAGES[name]
+        # the stages it uses are brought up to date first, outside of the timer of this stage
+        key = tuple(self.getResultVersion(dependency) for dependency in dependencies) + tuple(getParameterKey(getattr(self, parameter)) for parameter in parameters)
+        memo = self.results.get(name)
+        if(memo is None or memo[0] != key):
+            with self.stats.stage(methodName):
+                value = getattr(self, methodName)()
+            self.numComputedResults += 1
+            memo = self.results[name] = (key, value, self.numComputedResults)
+        return memo[1]
+
+    def getResultVersion(self, name):
+        self.getResult(name)
+        return self.results[name][2]
+
+    @property
+    def rescoringLmScale(self):
+        return self.lmScale if self.rescorer is not None else None
+
+    @property
+    def endTime(self):
+        # the final node has no outgoing edges, so the lattice ends at its time
+        return int(self.getResult('lattice').nodeTimes[-1])
+
+    @property
+    def numNodesBeforePruning(self):
+        return self.getResult('lattice').numNodes
+
+    @property
+    def numEdgesBeforePruning(self):
+        return self.getResult('lattice').numEdges
+
+    # the properties below describe the pruned word graph, unlike the 'lattice' stage, which is not pruned
+
+    @property
+    def prunedLattice(self):
+        return self.getResult('prunedGraph')[0]
+
+    @property
+    def numPrunedNodes(self):
+        return self.prunedLattice.numNodes
+
+    @property
+    def numPrunedEdges(self):
+        return self.prunedLattice.numEdges
+
+    @property
+    def weights(self):
+        return self.getResult('rescoredWeights')[self.getResult('prunedGraph')[2]]
+
+    @property
+    def forwardProbs(self):
+        return self.getResult('rescoredForwardBackward')[0][self.getResult('prunedGraph')[1]]
+
+    @property
+    def backwardProbs(self):
+        return self.getResult('rescoredForwardBackward')[1][self.getResult('prunedGraph')[1]]
+
+    @property
+    def posteriorProbs(self):
+        return self.getResult('rescoredForwardBackward')[3][self.getResult('prunedGraph')[2]]
+
+    @property
+    def confidenceMeasures(self):
+        return self.getResult('confidences')[self.getResult('prunedGraph')[2]]
+
+    @property
+    def fullPathProb(self):
+        return self.getResult('rescoredForwardBackward')[2]
+
+    @property
+    def bestNegativeLogPosteriorProb(self):
+        return float(self.getResult('rescoredForwardBackward')[3].min())
+
+    @property
+    def timeWordPosteriors(self):
+        return self.getResult('timeWordPosteriors')
+
+    @property
+    def encodedResults(self):
+        wordIds, startTimes, endTimes, confidences = self.getHypothesis(withConfidences=True)
+        words = self.getResult('lattice').words
+        return [self.encodeWord(words[wordId], startTime, endTime, float(confidence)) for wordId, startTime, endTime, confidence in zip(wordIds, startTimes, endTimes, confidences)]
+
+    @property
+    def encodedWordIds(self):
+        return self.getHypothesis()[0]
+
+    @property
+    def sweepFullPathProbs(self):
+        return self.getResult('sweep')[0] if self.sweepLmScales is not None else None
+
+    @property
+    def sweepPosteriorProbs(self):
+        return self.getResult('sweep')[1] if self.sweepLmScales is not None else None
+
+    @property
+    def sweepEncodedResults(self):
+        return self.getResult('sweep')[2] if self.sweepLmScales is not None else []
+
+    @property
+    def sweepEncodedWordIds(self):
+        return self.getResult('sweep')[3] if self.sweepLmScales is not None else []
+
+    def getWordGraphDensity(self, numWords):
+        return self.numPrunedEdges/float(numWords)
+
+    def parseLattice(self):
+        lattice = self.residentLattice if self.residentLattice is not None else Lattice.load(self.latticeFilePath, self.vocabulary, self.latticeCache)
+        if(self.lmScale == None):
+            self.lmScale = lattice.lmScale
+        self.stats.count(words=len(lattice.words))
+        return lattice
+
+    def sortNodesTopologically(self):
+        # a lattice kept in memory across decodings is only sorted the first time
+        lattice = self.getResult('parsedLattice')
+        if(lattice.levels is None):
+            lattice.sortNodesTopologically()
+        return lattice
+
+    def rescoreWithLanguageModel(self):
+        lattice = self.getResult('sortedLattice')
+        if(self.rescorer is None):
+            return lattice
+        cache = self.rescorer.languageModel.cache
+        hits, misses = cache.hits, cache.misses
+        rescored, _ = self.rescorer.rescore(lattice, self.lmScale)
+        self.stats.count(edgesBeforeRescoring=lattice.numEdges, languageModelCacheHits=cache.hits - hits, languageModelCacheMisses=cache.misses - misses)
+        return rescored
+
+    def calculateWeights(self):
+        return self.getResult('lattice').getWeights(self.lmScale)
 
-    def parseEdge(self, line):
-        lineArray = [x[2:] for x in line.split()] 
-        assert self.lmScale is not None, 'lmScale should be defined before the edges in the lattice file'
-        return Edge(index=int(lineArray[0]), nodeFrom=int(lineArray[1]), nodeTo=int(lineArray[2]), word=lineArray[3], acousticScore=-float(lineArray[5]), languageScore=-float(lineArray[6]), lmScale=self.lmScale)
+    def runForwardBackwardAlgorithm(self):
+        return self.calculateForwardBackward(self.getResult('lattice'), self.getResult('weights'))
 
-    def parseNode(self, line):
-        lineArray = [x[2:] for x in line.split()] 
-        return Node(index=int(lineArray[0]), time=int(100*(lineArray[1])))
-        
-    def parseLmScale(self, line): 
-        return float(line.split('=')[1])
+    def calculateForwardBackward(self, lattice, weights):
+        # returns the forward and backward scores of the nodes, the score of all paths and the posteriors of the edges
+        forwardProbs = self.calculateProbability(lattice, lattice.forwardSchedule, 0, weights)
+        backwardProbs = self.calculateProbability(lattice, lattice.backwardSchedule, lattice.numNodes - 1, weights)
+        assert math.isclose(backwardProbs[0], forwardProbs[-1], abs_tol=1e-6), "Probability should be the same!"
+        fullPathProb = float(backwardProbs[0])
 
-    def runForwardBackwardAlgorithm(self):
-        self.nodes[0].forwardProb = 0 
-        self.calculateProbability(self.nodes, 'forwardProb', 'incomingEdges', 'nodeFrom')
-        self.nodes[-1].backwardProb = 0 
-        self.calculateProbability(self.nodes[::-1], 'backwardProb', 'outgoingEdges', 'nodeTo')
-        assert math.isclose(self.nodes[0].backwardProb, self.nodes[-1].forwardProb, abs_tol=1e-6), "Probability should be the same!"
-        self.fullPathProb = self.nodes[0].backwardProb
-
-        bestNegativeLogPosteriorProb = float('inf')
         if self.mode == 'log semiring':
-            fullPathProb = self.fullPathProb
+            normalization = fullPathProb
         elif self.mode == 'tropical semiring':
-            fullPathProb = 0
-
-        for edge in self.edges:
-            negativeLogPosteriorProb = self.nodes[edge.nodeFrom].forwardProb + edge.weight + self.nodes[edge.nodeTo].backwardProb - fullPathProb
-            edge.setNegativeLogPosteriorProb(negativeLogPosteriorProb)
-            if(negativeLogPosteriorProb < bestNegativeLogPosteriorProb):
-                bestNegativeLogPosteriorProb = negativeLogPosteriorProb
-        self.bestNegativeLogPosteriorProb = bestNegativeLogPosteriorProb
-
-    def calculateProbability(self, nodes, probabilityType, nameOfEdgesList, nodeType):
-        for node in nodes[1:]:
-            value = float('inf') 
+            normalization = 0
+
+        posteriorProbs = forwardProbs[lattice.edgeFrom] + weights + backwardProbs[lattice.edgeTo] - normalization
+        return forwardProbs, backwardProbs, fullPathProb, posteriorProbs
+
+    def runMultiScaleForwardBackward(self):
+        # every pair of scales shares the topology and the schedules, so K decodings become one pass over (edges x K) weights.
+        # It works on the unpruned lattice, as an edge pruned at the main scale can be on the best path of another one
+        lattice = self.getResult('lattice')
+        weights = lattice.getWeights(self.sweepLmScales, self.sweepAcousticScales)
+        forwardProbs = self.calculateProbability(lattice, lattice.forwardSchedule, 0, weights)
+        backwardProbs = self.calculateProbability(lattice, lattice.backwardSchedule, lattice.numNodes - 1, weights)
+        assert np.allclose(backwardProbs[0], forwardProbs[-1], rtol=1e-12, atol=1e-6), "Probability should be the same!"
+        fullPathProbs = backwardProbs[0]
+        posteriorProbs = forwardProbs[lattice.edgeFrom] + weights + backwardProbs[lattice.edgeTo] - (fullPathProbs if self.mode == 'log semiring' else 0)
+
+        _, backpointers = self.calculateViterbi(lattice, lattice.forwardSchedule, 0, weights)
+        encodedResults, encodedWordIds = [], []
+        for column in range(weights.shape[1]):
+            edges = self.traceBack(lattice, backpointers[:, column])
+            encodedWordIds.append(lattice.edgeWords[edges])
+            encodedResults.append(self.encodeEdges(lattice, edges, posteriorProbs[:, column]))
+        self.stats.count(sweepScales=weights.shape[1])
+        return fullPathProbs, posteriorProbs, encodedResults, encodedWordIds
+
+    def calculateProbability(self, lattice, schedule, initialNode, weights):
+        probabilities = np.full((lattice.numNodes,) + weights.shape[1:], np.inf)
+        probabilities[initialNode] = 0
+        for nodes, edges, otherNodes, segmentStarts in schedule:
+            values = self.reduceSegments(probabilities[otherNodes] + weights[edges], segmentStarts)
+            assert np.all(values > 0), "negative log probability cannot be < 0"
+            probabilities[nodes] = values
+        return probabilities
+
+    def calculateViterbi(self, lattice, schedule, initialNode, weights):
+        scores = np.full((lattice.numNodes,) + weights.shape[1:], np.inf)
+        scores[initialNode] = 0
+        bestEdges = np.full(scores.shape, -1, dtype=np.int64)
+        for nodes, edges, otherNodes, segmentStarts in schedule:
+            values = scores[otherNodes] + weights[edges]
+            bestValues = np.minimum.reduceat(values, segmentStarts)
+            segments = np.repeat(np.arange(len(nodes)), np.diff(np.r_[segmentStarts, len(values)]))
+            # ties go to the first edge of a node, in every column
+            positions = np.arange(len(values)).reshape((-1,) + (1,) * (values.ndim - 1))
+            firstCandidates = np.minimum.reduceat(np.where(values == bestValues[segments], positions, len(values)), segmentStarts)
+            scores[nodes] = bestValues
+            bestEdges[nodes] = edges[firstCandidates]
+        return scores, bestEdges
+
+    def reduceSegments(self, values, segmentStarts):
+        if self.mode == 'log semiring':
+            return np.maximum(0, -np.logaddexp.reduceat(-values, segmentStarts))
+        elif self.mode == 'tropical semiring':
+            return np.minimum.reduceat(values, segmentStarts)
 
-            for edge in getattr(node, nameOfEdgesList):
-                edgeNode = self.nodes[getattr(edge, nodeType)]
-                value = self.getValueSum(value, getattr(edgeNode, probabilityType) + edge.weight)     
-                assert value > 0, "negative log probability cannot be < 0" 
-            setattr(node, probabilityType, value)
+    def accumulate(self, values, axis):
+        if self.mode == 'log semiring':
+            return -np.logaddexp.accumulate(-values, axis=axis)
+        elif self.mode == 'tropical semiring':
+            return np.minimum.accumulate(values, axis=axis)
 
     def getValueSum(self, value, summedProb):
         if self.mode == 'log semiring':
-            if value == float('inf'):
-                return summedProb 
-            else:
-                return max(0, - (math.log(1 + math.exp(-abs(summedProb - value))) - min(summedProb, value)))
+            return np.maximum(0, -np.logaddexp(-value, -summedProb))
         elif self.mode == 'tropical semiring':
-            return min(value, summedProb)
-    
+            return np.minimum(value, summedProb)
+
+    def calculateTimeFrameWordPosteriors(self):
+        lattice, posteriorProbs = self.getResult('lattice'), self.getResult('forwardBackward')[3]
+        timeWordPosteriors = FrameWordPosteriors.fromIntervals(lattice.getEdgeStartTimes(), lattice.getEdgeEndTimes(), lattice.edgeWords, posteriorProbs, self.endTime, len(lattice.words), self.reduceSegments)
+        wordsPerFrame = np.diff(timeWordPosteriors.frameOffsets)
+        self.stats.count(frames=self.endTime, meanWordsPerFrame=float(wordsPerFrame.mean()) if len(wordsPerFrame) else 0.0,
+                         maxWordsPerFrame=int(wordsPerFrame.max()) if len(wordsPerFrame) else 0)
+        return timeWordPosteriors
+
     def calculateMeanConfidenceMeasures(self):
-        for edge in self.edges:
-            start = int(round(100*edge.startTime))
-            end = int(round(100*edge.endTime))
-            for time in range(start, end):
-                edge.confidenceMeasure = self.getValueSum(self.timeWordPosteriors[time][edge.word], edge.confidenceMeasure)
-            edge.confidenceMeasure += math.log(end - start)
+        lattice = self.getResult('lattice')
+        starts = lattice.getEdgeStartTimes()
+        durations = lattice.getEdgeEndTimes() - starts
+        summedPosteriors = self.getResult('timeWordPosteriors').sumOverRanges(lattice.edgeWords, starts, starts + durations, self.accumulate, self.getValueSum)
+        return summedPosteriors + np.log(np.maximum(durations, 1))
 
     def rescoreWordGraph(self):
-        for edge in self.edges:
-            edge.weight = max(edge.confidenceMeasure,0)
-        self.runForwardBackwardAlgorithm()
+        # opt-in: the confidences replace the weights of pruning and decoding. It made the WER worse on the bundled lattices
+        if(not self.confidenceRescoring):
+            return self.getResult('weights')
+        return np.maximum(self.getResult('confidences'), 0)
 
-    def calculateTimeFrameWordPosteriors(self):
-        numTimeInstances = int(self.endTime * 100)
-        timeWordPosteriors = [None] * numTimeInstances 
-
-        for timeInstance in range(numTimeInstances): 
-            timeWordPosteriors[timeInstance] = self.fillTimeFrameDictionary(timeInstance/100.0)
-        self.timeWordPosteriors = timeWordPosteriors
-
-    def fillTimeFrameDictionary(self, timeInstance):
-        d = {} 
-        edgesAtTimeInstance = []
-        for node in self.nodes:
-            if(node.startTime <= timeInstance and node.endTime > timeInstance):
-                edgesAtTimeInstance += node.outgoingEdges
-        for edge in edgesAtTimeInstance: 
-            if(edge.word in d):
-                d[edge.word] = self.getValueSum(edge.posteriorProb, d[edge.word])
-            else:
-                d[edge.word] = edge.posteriorProb
-        return d
+    def runRescoredForwardBackward(self):
+        if(not self.confidenceRescoring):
+            return self.getResult('forwardBackward')
+        return self.calculateForwardBackward(self.getResult('lattice'), self.getResult('rescoredWeights'))
 
     def pruneWordGraph(self):
-        for idx, edge in enumerate(self.edges):
-            threshold = self.bestNegativeLogPosteriorProb + self.pruningThreshold
-            if(edge.posteriorProb > threshold):
-                del self.edges[idx]
-        self.numEdges = len(self.edges)
-
-    def decodeWordGraph(self): # Proper viterbi search should be done here! 
-        node = self.nodes[0]
-        while(len(node.outgoingEdges) is not 0):
-            bestEdge = min(node.outgoingEdges, key=attrgetter('posteriorProb'))
-            node = self.nodes[bestEdge.nodeTo]
-            startTime = bestEdge.startTime + self.startTime
-            timeDiff = bestEdge.endTime - bestEdge.startTime  
-            self.encodedResults.append((bestEdge.word[1:-1], round(startTime/float(100), 3), round(timeDiff/float(100), 3), bestEdge.confidenceMeasure))
-
-    def writeConfidenceMeasuresToFile(self):
-        with open(self.confMeasFilePath, 'a') as confMeasFile:
-            for tupleResult in self.encodedResults:
-                confMeasFile.write('Word: ' + tupleResult[0] + '| Confidence Measure: ' + str(tupleResult[3]) + '\n')
-
-    def writeResultsToCTMFile(self):
-        with open(self.resultFilePath, 'a') as resultFile:
-            resultFile.write(";; <name> <track> <start> <duration> <word>\n")
-            resultFile.write(";; QRBC_ENG_GB_20110106_104800_BBC_PHONEIN_POD/QRBC_ENG_GB_20110106_104800_BBC_PHONEIN_POD"+self.code+" ("+str(self.startTime/float(100))+"-" + str(self.endTime/float(100)) +")\n")
-            for tupleResult in self.encodedResults:
-                if(tupleResult[0] != "!NULL" and tupleResult[0] != "[SILENCE]" and tupleResult[0] != "[NOISE]"):
-                    resultFile.write("QRBC_ENG_GB_20110106_104800_BBC_PHONEIN_POD 1 " + str(tupleResult[1]) + " " + str(tupleResult[2]) + " " + tupleResult[0] + "\n")
-            
+        # returns the pruned lattice with the nodes and edges of the unpruned lattice it kept
+        lattice, posteriorProbs = self.getResult('lattice'), self.getResult('rescoredForwardBackward')[3]
+        keepEdges = posteriorProbs <= float(posteriorProbs.min()) + self.pruningThreshold
+        if(self.maxArcsPerFrame is not None):
+            keepEdges &= self.getArcsPerFrameMask(lattice, posteriorProbs, self.maxArcsPerFrame)
+        keepEdges[self.getResult('bestPath')] = True
+        prunedLattice, keptNodes, keptEdges = lattice.getSubgraph(keepEdges)
+        prunedLattice.sortNodesTopologically()
+        self.stats.count(nodesBeforePruning=lattice.numNodes, edgesBeforePruning=lattice.numEdges, nodes=prunedLattice.numNodes, edges=prunedLattice.numEdges,
+                         edgesPruned=lattice.numEdges - prunedLattice.numEdges, levels=len(prunedLattice.levels))
+        return prunedLattice, keptNodes, keptEdges
+
+    def getArcsPerFrameMask(self, lattice, posteriorProbs, maxArcsPerFrame):
+        starts = lattice.getEdgeStartTimes()
+        order = np.lexsort((posteriorProbs, starts))
+        sortedStarts = starts[order]
+        frameStarts = np.flatnonzero(np.r_[True, sortedStarts[1:] != sortedStarts[:-1]])
+        ranks = np.arange(len(order)) - np.repeat(frameStarts, np.diff(np.r_[frameStarts, len(order)]))
+        mask = np.zeros(len(order), dtype=bool)
+        mask[order[ranks < maxArcsPerFrame]] = True
+        return mask
+
+    def getBestPathEdges(self):
+        # the best path in the numbering of the pruned lattice, which always keeps it
+        return np.searchsorted(self.getResult('prunedGraph')[2], self.getResult('bestPath'))
+
+    def traceBack(self, lattice, backpointers):
+        edges = []
+        node = lattice.numNodes - 1
+        while(backpointers[node] >= 0):
+            edges.append(backpointers[node])
+            node = lattice.edgeFrom[edges[-1]]
+        assert node == 0, "Last node should be reachable from the first node"
+        return np.array(edges[::-1], dtype=np.int64)
+
+    def decodeWordGraph(self):
+        # the best path needs no posteriors, so a 1-best CTM is only parsing and one Viterbi pass
+        lattice = self.getResult('lattice')
+        _, backpointers = self.calculateViterbi(lattice, lattice.forwardSchedule, 0, self.getResult('rescoredWeights'))
+        edges = self.traceBack(lattice, backpointers)
+        self.stats.count(decodedWords=len(edges))
+        return edges
+
+    def buildConfusionNetwork(self):
+        prunedLattice, _, keptEdges = self.getResult('prunedGraph')
+        _, _, fullPathProb, posteriorProbs = self.getResult('rescoredForwardBackward')
+        # tropical posteriors are the scores of the best path through an edge; relative to the best path of all they are
+        # max-marginals, which are 1 on the best path like the posteriors of the log semiring
+        if(self.mode == 'tropical semiring'):
+            posteriorProbs = posteriorProbs - fullPathProb
+        return ConfusionNetwork.fromLattice(prunedLattice, posteriorProbs[keptEdges], self.getBestPathEdges(), self.reduceSegments)
+
+    def getConfusionNetwork(self):
+        return self.getResult('confusionNetwork')
+
+    def decodeConsensus(self):
+        # from now on the consensus is the decoded result, with slot posteriors (probabilities, not negative log scores) as confidences
+        self.consensus = True
+        network = self.getResult('confusionNetwork')
+        self.stats.count(decodedWords=len(network.getConsensus()))
+        return network
+
+    def getHypothesis(self, withConfidences=False):
+        # word ids, start and end frames and, only if asked for, confidences of the decoded words
+        if(self.consensus):
+            network = self.getResult('confusionNetwork')
+            entries = network.getConsensus()
+            return network.entryWords[entries], network.entryStarts[entries], network.entryEnds[entries], network.entryPosteriors[entries] if withConfidences else None
+        lattice, edges = self.getResult('lattice'), self.getResult('bestPath')
+        confidences = self.getResult('confidences')[edges] if withConfidences else None
+        return lattice.edgeWords[edges], lattice.nodeTimes[lattice.edgeFrom[edges]], lattice.nodeTimes[lattice.edgeTo[edges]], confidences
+
+    def getNBestHypotheses(self, n):
+        lattice, weights, confidences = self.prunedLattice, self.weights, self.confidenceMeasures
+        costToGo, nextEdges = self.calculateViterbi(lattice, lattice.backwardSchedule, lattice.numNodes - 1, weights)
+        enumerator = NBestEnumerator(lattice, weights, costToGo, nextEdges, 0, lattice.numNodes - 1)
+        wordSequences = set()
+        for cost, edges in enumerator.iteratePaths():
+            wordIds = lattice.edgeWords[edges]
+            wordSequence = tuple(wordIds[~self.vocabulary.isFiller(wordIds)].tolist())
+            if(wordSequence not in wordSequences):
+                wordSequences.add(wordSequence)
+                yield cost, self.encodeEdges(lattice, edges, confidences)
+                if(len(wordSequences) == n):
+                    return
+
+    def encodeEdges(self, lattice, edges, confidences):
+        return [self.encodeWord(lattice.words[lattice.edgeWords[edge]], lattice.nodeTimes[lattice.edgeFrom[edge]], lattice.nodeTimes[lattice.edgeTo[edge]], float(confidences[edge]))
+                for edge in edges]
+
+    def encodeWord(self, word, wordStartTime, wordEndTime, confidence):
+        startTime = self.startTime + wordStartTime/float(FRAMES_PER_SECOND)
+        timeDiff = (wordEndTime - wordStartTime)/float(FRAMES_PER_SECOND)
+        return (word, round(startTime, 3), round(timeDiff, 3), confidence)
+
+    def getConfidenceMeasureLines(self):
+        return ['Word: ' + tupleResult[0] + '| Confidence Measure: ' + str(tupleResult[3]) + '\n' for tupleResult in self.encodedResults]
+
+    def getCTMLines(self, sweepIndex=None):
+        # with a sweep index, the best path of that pair of sweep scales instead of the decoded result
+        lines = getCTMHeaderLines(self.code, self.startTime, self.endTime)
+        if(sweepIndex is not None):
+            encodedWordIds, encodedResults = self.sweepEncodedWordIds[sweepIndex], self.sweepEncodedResults[sweepIndex]
+        else:
+            encodedWordIds, startTimes, endTimes, _ = self.getHypothesis()
+            words = self.getResult('lattice').words
+            encodedResults = [self.encodeWord(words[wordId], startTime, endTime, None) for wordId, startTime, endTime in zip(encodedWordIds, startTimes, endTimes)]
+        for tupleResult, filler in zip(encodedResults, self.vocabulary.isFiller(encodedWordIds)):
+            if(not filler):
+                lines.append(getCTMWordLine(tupleResult[1], tupleResult[2], tupleResult[0]))
+        return lines
+
+    def writeConfidenceMeasuresToFile(self, confMeasFilePath=None):
+        with self.stats.stage('writeConfidenceMeasuresToFile'):
+            lines = self.getConfidenceMeasureLines()
+            with open(confMeasFilePath or self.confMeasFilePath, 'a') as confMeasFile:
+                confMeasFile.writelines(lines)
+
+    def writeResultsToCTMFile(self, resultFilePath=None):
+        with self.stats.stage('writeResultsToCTMFile'):
+            lines = self.getCTMLines()
+            with open(resultFilePath or self.resultFilePath, 'a') as resultFile:
+                resultFile.writelines(lines)
+
+    def writeStats(self, statsFilePath=None):
+        self.stats.writeJSONLine(statsFilePath or self.statsFilePath)
+
     def printInformation(self):
-        print("Num nodes",self.numNodes)
-        print("Num edges", self.numEdges)
-        print("Incoming Edges First Node",[ x.index for x in self.nodes[0].incomingEdges])
-        print("Outgoing Edges First Node",[ x.index for x in self.nodes[0].outgoingEdges])
-        print("Incoming Edges Last Node",[ x.index for x in self.nodes[-1].incomingEdges])
-        print("Outgoing Edges Last Node",[ x.index for x in self.nodes[-1].outgoingEdges])
+        lattice = self.prunedLattice
+        print("Num nodes",self.numPrunedNodes)
+        print("Num edges", self.numPrunedEdges)
+        print("Incoming Edges First Node",lattice.incomingEdges[lattice.incomingOffsets[0]:lattice.incomingOffsets[1]].tolist())
+        print("Outgoing Edges First Node",lattice.outgoingEdges[lattice.outgoingOffsets[0]:lattice.outgoingOffsets[1]].tolist())
+        print("Incoming Edges Last Node",lattice.incomingEdges[lattice.incomingOffsets[-2]:lattice.incomingOffsets[-1]].tolist())
+        print("Outgoing Edges Last Node",lattice.outgoingEdges[lattice.outgoingOffsets[-2]:lattice.outgoingOffsets[-1]].tolist())
 
 
 if __name__ == "__main__":
+    from batchDecoder import readManifest, decodeBatch
+
     pruningThreshold = float(sys.argv[1])
     lmScale = float(sys.argv[2])
     numWords = int(sys.argv[3])
 
-    open('results.ctm', 'a').close()
-    os.remove('results.ctm')
-    open('confidenceMeasures.txt', 'a').close()
-    os.remove('confidenceMeasures.txt')
-
     print("---------START DECODING---------")
-    wg1 = WordGraph('lattice.1.htk.gz', 1.151, '_0000001151_0000014843', 'results.ctm', 'confidenceMeasures.txt', pruningThreshold, lmScale, 'log semiring')
-    wg2 = WordGraph('lattice.2.htk.gz', 16.353 , '_0000016353_0000024761', 'results.ctm', 'confidenceMeasures.txt', pruningThreshold, lmScale, 'log semiring')
-    wg3 = WordGraph('lattice.3.htk.gz', 24.761, '_0000024761_0000044466', 'results.ctm', 'confidenceMeasures.txt', pruningThreshold, lmScale, 'log semiring')
-    wg4 = WordGraph('lattice.4.htk.gz', 44.466, '_0000044466_0000063151', 'results.ctm', 'confidenceMeasures.txt', pruningThreshold, lmScale, 'log semiring')
-    wg5 = WordGraph('lattice.5.htk.gz', 63.151, '_0000063151_0000078481', 'results.ctm', 'confidenceMeasures.txt', pruningThreshold, lmScale, 'log semiring')
-   
-    print("Word Graph Density",(wg1.numEdges + wg2.numEdges + wg3.numEdges + wg4.numEdges + wg5.numEdges)/float(numWords))
+    results = decodeBatch(readManifest('segments.txt'), 'results.ctm', 'confidenceMeasures.txt', pruningThreshold, lmScale, 'log semiring', os.environ.get('LATTICE_CACHE_DIR', '.latticeCache'))
+
+    print("Word Graph Density before pruning", sum(result.numEdgesBeforePruning for result in results)/float(numWords))
+    print("Word Graph Density", sum(result.numEdges for result in results)/float(numWords))
     print("Pruning threshold", pruningThreshold)
     print("---------DONE----------")
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import traceback
+import zlib
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from batchDecoder import getVocabulary
+from decodeWordGraphs import WordGraph
+from latticeCache import LatticeCache
+from runStats import RunStats
+
+OUTPUTS = ('ctm', 'confidences', 'density', 'stats')
+MODES = ('log semiring', 'tropical semiring')
+MAX_REQUEST_BYTES = 1 << 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+# the word graphs resident in a worker process
+residentWordGraphs = None
+
+class RequestError(Exception):
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+def getResidentBytes(value, seen=None):
+    # the bytes of the arrays a word graph keeps, which is what makes up its size; the python objects around them
+    # are small in comparison. Arrays shared by several stages are counted once
+    seen = set() if seen is None else seen
+    if(id(value) in seen):
+        return 0
+    seen.add(id(value))
+    if(isinstance(value, np.ndarray)):
+        return value.nbytes
+    if(isinstance(value, (list, tuple))):
+        return sum(getResidentBytes(item, seen) for item in value)
+    if(isinstance(value, dict)):
+        return sum(getResidentBytes(item, seen) for item in value.values())
+    if(hasattr(value, '__dict__') and not isinstance(value, type)):
+        return getResidentBytes(vars(value), seen)
+    return 0
+
+class ResidentWordGraphs(object):
+
+    # the word graphs of the lattices decoded last, with all stages they have computed, least recently used first.
+    # A lattice decoded again with new parameters only reruns the stages these change. Graphs are dropped from the
+    # front until the arrays of the others fit into maxBytes; the graph just decoded always stays
+    def __init__(self, maxBytes, cacheDir=None):
+        self.maxBytes = maxBytes
+        self.cacheDir = cacheDir
+        self.latticeCache = LatticeCache(cacheDir) if cacheDir is not None else None
+        self.wordGraphs = OrderedDict()
+        self.numBytes = 0
+        self.numHits = 0
+        self.numMisses = 0
+        self.numEvictions = 0
+
+    def getSource(self, latticeFilePath):
+        stat = os.stat(latticeFilePath)
+        return stat.st_size, stat.st_mtime_ns
+
+    def get(self, latticeFilePath):
+        # a lattice file that changed since it was parsed is parsed again
+        source = self.getSource(latticeFilePath)
+        entry = self.wordGraphs.pop(latticeFilePath, None)
+        resident = entry is not None and entry[1] == source
+        if(resident):
+            self.numHits += 1
+        else:
+            if(entry is not None):
+                self.numBytes -= entry[2]
+            self.numMisses += 1
+            entry = (WordGraph(latticeFilePath, 0.0, '', None, None, None, None, MODES[0], self.latticeCache, vocabulary=getVocabulary(self.cacheDir)), source, 0)
+        self.wordGraphs[latticeFilePath] = entry
+        return entry[0], resident
+
+    def update(self, latticeFilePath):
+        wordGraph, source, numBytes = self.wordGraphs[latticeFilePath]
+        # the vocabulary is shared by all word graphs of the worker
+        newBytes = getResidentBytes(wordGraph.results, {id(wordGraph.vocabulary)})
+        self.wordGraphs[latticeFilePath] = (wordGraph, source, newBytes)
+        self.numBytes += newBytes - numBytes
+        while(self.numBytes > self.maxBytes and len(self.wordGraphs) > 1):
+            _, (_, _, evictedBytes) = self.wordGraphs.popitem(last=False)
+            self.numBytes -= evictedBytes
+            self.numEvictions += 1
+
+    def getStatus(self):
+        return {'pid': os.getpid(), 'wordGraphs': len(self.wordGraphs), 'bytes': self.numBytes, 'maxBytes': self.maxBytes,
+                'hits': self.numHits, 'misses': self.numMisses, 'evictions': self.numEvictions}
+
+def initializeWorker(maxBytes, cacheDir):
+    global residentWordGraphs
+    residentWordGraphs = ResidentWordGraphs(maxBytes, cacheDir)
+
+def decodeRequest(request):
+    try:
+        startWall = time.perf_counter()
+        wordGraph, resident = residentWordGraphs.get(request['lattice'])
+        # the stats of a resident graph would grow with every request, so every decode gets its own
+        wordGraph.stats = RunStats(request['lattice'])
+        wordGraph.startTime, wordGraph.code = request['startTime'], request['code']
+        wordGraph.lmScale, wordGraph.pruningThreshold, wordGraph.mode = request['lmScale'], request['pruningThreshold'], request['mode']
+        wordGraph.maxArcsPerFrame, wordGraph.consensus = request['maxArcsPerFrame'], request['consensus']
+        response = {'lattice': request['name'], 'resident': resident}
+        if('ctm' in request['outputs']):
+            response['ctm'] = ''.join(wordGraph.getCTMLines())
+        if('confidences' in request['outputs']):
+            response['confidences'] = ''.join(wordGraph.getConfidenceMeasureLines())
+        if('density' in request['outputs']):
+            response['numEdges'], response['numEdgesBeforePruning'] = wordGraph.numPrunedEdges, wordGraph.numEdgesBeforePruning
+        residentWordGraphs.update(request['lattice'])
+        if('stats' in request['outputs']):
+            response['stats'] = wordGraph.stats.toDict()
+        response['wallTime'] = time.perf_counter() - startWall
+        return 200, response
+    except Exception:
+        # a lattice that failed half way is not kept, its next request starts over
+        residentWordGraphs.wordGraphs.pop(request['lattice'], None)
+        residentWordGraphs.numBytes = sum(entry[2] for entry in residentWordGraphs.wordGraphs.values())
+        # the traceback goes to the log of the server, the client only learns that decoding failed
+        print('Decoding ' + request['lattice'] + ' failed:\n' + traceback.format_exc(), file=sys.stderr)
+        return 500, {'lattice': request['name'], 'error': 'decoding failed'}
+
+def getWorkerStatus():
+    return residentWordGraphs.getStatus()
+
+class DecodingServer(object):
+
+    # answers HTTP requests on localhost or a Unix socket. POST /decode takes a JSON object
+    #   {"lattice": path, "lmScale": float, "pruningThreshold": float, "mode": "log semiring", "startTime": 0.0, "code": "",
+    #    "maxArcsPerFrame": null, "consensus": false, "outputs": ["ctm", "confidences", "density", "stats"]}
+    # and GET /status reports the resident word graphs. Every lattice always goes to the same worker process, so its
+    # word graph stays resident there and requests for it are decoded one after another
+    def __init__(self, latticeDir='.', numWorkers=None, maxBytes=1 << 30, cacheDir=None):
+        self.latticeDir = latticeDir
+        self.numWorkers = max(1, numWorkers or os.cpu_count() or 1)
+        self.maxBytes = maxBytes
+        self.cacheDir = cacheDir
+        self.executors = []
+        self.numRequests = 0
+
+    def start(self):
+        # each worker gets its share of the memory, since its lattices are resident in it alone
+        self.executors = [ProcessPoolExecutor(1, initializer=initializeWorker, initargs=(self.maxBytes // self.numWorkers, self.cacheDir)) for _ in range(self.numWorkers)]
+
+    def shutdown(self):
+        for executor in self.executors:
+            executor.shutdown()
+
+    def getExecutor(self, latticeFilePath):
+        return self.executors[zlib.crc32(latticeFilePath.encode('utf-8')) % len(self.executors)]
+
+    def parseDecodeRequest(self, body):
+        try:
+            request = json.loads(body.decode('utf-8'))
+        except ValueError as error:
+            raise RequestError(400, 'invalid JSON: %s' % error)
+        if(not isinstance(request, dict) or not isinstance(request.get('lattice'), str)):
+            raise RequestError(400, 'a decode request is a JSON object with a "lattice" path')
+        # only lattices under the lattice directory are served, whatever the path or its symbolic links point to
+        latticeDir = os.path.realpath(self.latticeDir)
+        latticeFilePath = os.path.realpath(os.path.join(latticeDir, request['lattice']))
+        if(os.path.commonpath([latticeDir, latticeFilePath]) != latticeDir):
+            raise RequestError(400, 'lattice paths should stay inside the lattice directory')
+        if(not os.path.isfile(latticeFilePath)):
+            raise RequestError(404, 'no lattice ' + request['lattice'])
+        try:
+            parsed = {'lattice': latticeFilePath, 'name': request['lattice'], 'lmScale': float(request['lmScale']), 'pruningThreshold': float(request['pruningThreshold']),
+                      'mode': request.get('mode', MODES[0]), 'startTime': float(request.get('startTime', 0.0)), 'code': str(request.get('code', '')),
+                      'maxArcsPerFrame': int(request['maxArcsPerFrame']) if request.get('maxArcsPerFrame') is not None else None,
+                      'consensus': bool(request.get('consensus', False)), 'outputs': list(request.get('outputs', ['ctm']))}
+        except KeyError as error:
+            raise RequestError(400, 'missing %s' % error)
+        except (TypeError, ValueError) as error:
+            raise RequestError(400, str(error))
+        if(parsed['mode'] not in MODES):
+            raise RequestError(400, 'mode should be one of ' + ', '.join(MODES))
+        unknownOutputs = set(parsed['outputs']) - set(OUTPUTS)
+        if(unknownOutputs):
+            raise RequestError(400, 'unknown outputs ' + ', '.join(sorted(unknownOutputs)) + ', should be some of ' + ', '.join(OUTPUTS))
+        return parsed
+
+    async def decode(self, body):
+        request = self.parseDecodeRequest(body)
+        self.numRequests += 1
+        return await asyncio.get_running_loop().run_in_executor(self.getExecutor(request['lattice']), decodeRequest, request)
+
+    async def getStatus(self):
+        loop = asyncio.get_running_loop()
+        workers = await asyncio.gather(*[loop.run_in_executor(executor, getWorkerStatus) for executor in self.executors])
+        return 200, {'requests': self.numRequests, 'workers': list(workers)}
+
+    async def route(self, method, path, body):
+        if(path == '/decode'):
+            if(method != 'POST'):
+                raise RequestError(405, 'POST a JSON request to /decode')
+            return await self.decode(body)
+        if(path == '/status'):
+            return await self.getStatus()
+        raise RequestError(404, 'no ' + path + ', use POST /decode or GET /status')
+
+    async def readRequest(self, reader):
+        # HTTP/1.1 with a Content-Length body, all any JSON client sends; None once the client has closed the connection
+        requestLine = await reader.readline()
+        if(not requestLine.strip()):
+            return None
+        method, path, version = requestLine.decode('latin-1').split()
+        headers = {}
+        while(True):
+            line = (await reader.readline()).decode('latin-1').strip()
+            if(not line):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', '0'))
+        if(length > MAX_REQUEST_BYTES):
+            raise RequestError(413, 'requests are at most %d bytes' % MAX_REQUEST_BYTES)
+        body = await reader.readexactly(length) if length else b''
+        keepAlive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+        return method, path.split('?')[0], body, keepAlive
+
+    def writeResponse(self, writer, status, response, keepAlive):
+        body = json.dumps(response).encode('utf-8')
+        writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n'
+                      % (status, REASONS[status], len(body), 'keep-alive' if keepAlive else 'close')).encode('latin-1') + body)
+
+    async def handleConnection(self, reader, writer):
+        try:
+            while(True):
+                keepAlive = False
+                try:
+                    request = await self.readRequest(reader)
+                    if(request is None):
+                        break
+                    method, path, body, keepAlive = request
+                    status, response = await self.route(method, path, body)
+                except RequestError as error:
+                    status, response = error.status, {'error': str(error)}
+                except (ValueError, asyncio.IncompleteReadError):
+                    status, response = 400, {'error': 'malformed HTTP request'}
+                self.writeResponse(writer, status, response, keepAlive)
+                await writer.drain()
+                if(not keepAlive):
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, unixSocketPath=None):
+        self.start()
+        try:
+            # the workers are forked now, before any connection is open, or they would inherit its socket and keep it
+            # open after the server has closed it
+            await self.getStatus()
+            if(unixSocketPath is not None):
+                if(os.path.exists(unixSocketPath)):
+                    os.remove(unixSocketPath)
+                server = await asyncio.start_unix_server(self.handleConnection, unixSocketPath)
+            else:
+                server = await asyncio.start_server(self.handleConnection, host, port)
+            print('Serving on', unixSocketPath or '%s:%d' % (host, port), 'with', self.numWorkers, 'workers', file=sys.stderr)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve decodings of lattices over HTTP, keeping the word graphs of recent lattices in memory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', default=None, help='listen on this Unix socket instead of host and port')
+    parser.add_argument('--lattice-dir', default='.', help='lattice paths of requests are relative to this directory')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-memory-mb', type=float, default=1024.0, help='memory of all resident word graphs together')
+    parser.add_argument('--cache-dir', default=os.environ.get('LATTICE_CACHE_DIR', '.latticeCache'))
+    args = parser.parse_args()
+
+    server = DecodingServer(args.lattice_dir, args.workers, int(args.max_memory_mb * (1 << 20)), args.cache_dir)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,105 @@
+import numpy as np
+from arrayUtils import expandRanges, reduceByKey
+
+class FrameWordPosteriors(object):
+
+    def __init__(self, frameOffsets, words, values, numWords):
+        self.frameOffsets = frameOffsets
+        self.words = words
+        self.values = values
+        self.numWords = numWords
+        self.numFrames = len(frameOffsets) - 1
+        self.entryKeys = self.getEntryFrames() * numWords + words
+        self.wordMajorKeys = None
+        self.wordRangeTable = None
+
+    @classmethod
+    def fromIntervals(cls, starts, ends, words, values, numFrames, numWords, reduceSegments):
+        span = numFrames + 1
+        starts, ends, words = starts.astype(np.int64), ends.astype(np.int64), words.astype(np.int64)
+        nonEmpty = ends > starts
+
+        # edges sharing word, start and end collapse into one interval
+        intervalKeys, values = reduceByKey((words[nonEmpty] * span + starts[nonEmpty]) * span + ends[nonEmpty], values[nonEmpty], reduceSegments)
+        ends = intervalKeys % span
+        starts = intervalKeys // span % span
+        words = intervalKeys // (span * span)
+
+        # start and end events of each word cut its timeline into segments with a constant set of active intervals
+        events = np.unique(np.concatenate([words * span + starts, words * span + ends]))
+        firstSegments = np.searchsorted(events, words * span + starts)
+        segmentCounts = np.searchsorted(events, words * span + ends) - firstSegments
+        segments, segmentValues = reduceByKey(expandRanges(firstSegments, segmentCounts), np.repeat(values, segmentCounts), reduceSegments)
+
+        segmentWords = events[segments] // span
+        segmentStarts = events[segments] % span
+        segmentLengths = events[segments + 1] % span - segmentStarts
+        frames = expandRanges(segmentStarts, segmentLengths)
+        frameWords = np.repeat(segmentWords, segmentLengths)
+        order = np.argsort(frames * numWords + frameWords, kind='stable')
+
+        frameOffsets = np.zeros(numFrames + 1, dtype=np.int64)
+        np.cumsum(np.bincount(frames, minlength=numFrames), out=frameOffsets[1:])
+        return cls(frameOffsets, frameWords[order].astype(np.int32), np.repeat(segmentValues, segmentLengths)[order], numWords)
+
+    def getEntryFrames(self):
+        return np.repeat(np.arange(self.numFrames, dtype=np.int64), np.diff(self.frameOffsets))
+
+    def getFrame(self, frame):
+        entries = slice(self.frameOffsets[frame], self.frameOffsets[frame + 1])
+        return dict(zip(self.words[entries].tolist(), self.values[entries].tolist()))
+
+    def lookup(self, frames, words):
+        keys = frames.astype(np.int64) * self.numWords + words
+        if(not len(self.entryKeys)):
+            return np.full(len(keys), np.inf)
+        positions = np.minimum(np.searchsorted(self.entryKeys, keys), len(self.entryKeys) - 1)
+        found = self.entryKeys[positions] == keys
+        return np.where(found, self.values[positions], np.inf)
+
+    def getWordRangeTable(self, accumulate, combine):
+        if(self.wordRangeTable is None):
+            wordMajorKeys = self.words.astype(np.int64) * self.numFrames + self.getEntryFrames()
+            order = np.argsort(wordMajorKeys, kind='stable')
+            self.wordMajorKeys = wordMajorKeys[order]
+            self.wordRangeTable = RangeSumTable(self.values[order], accumulate, combine)
+        return self.wordRangeTable
+
+    def sumOverRanges(self, words, starts, ends, accumulate, combine):
+        table = self.getWordRangeTable(accumulate, combine)
+        sums = np.full(len(words), np.inf)
+        nonEmpty = ends > starts
+        words, starts, ends = words[nonEmpty].astype(np.int64), starts[nonEmpty], ends[nonEmpty]
+        first = np.searchsorted(self.wordMajorKeys, words * self.numFrames + starts)
+        last = first + (ends - starts) - 1
+        assert np.all(self.wordMajorKeys[last] == words * self.numFrames + ends - 1), "word should be active in every frame of the range"
+        sums[nonEmpty] = table.query(first, last)
+        return sums
+
+    def getRangeSum(self, word, start, end, accumulate, combine):
+        return float(self.sumOverRanges(np.array([word]), np.array([start]), np.array([end]), accumulate, combine)[0])
+
+class RangeSumTable(object):
+
+    # disjoint sparse table: every level stores cumulative sums running outwards from the middle of each block,
+    # so any range is the combination of two table entries and nothing is ever subtracted
+    def __init__(self, values, accumulate, combine):
+        self.combine = combine
+        self.numLevels = max(1, (len(values) - 1).bit_length())
+        size = 1 << self.numLevels
+        self.values = np.full(size, np.inf)
+        self.values[:len(values)] = values
+        self.levels = np.empty((self.numLevels + 1, size))
+        self.levels[0] = self.values
+        for level in range(1, self.numLevels + 1):
+            blocks = self.values.reshape(-1, 2, 1 << (level - 1))
+            suffixes = accumulate(blocks[:, 0, ::-1], axis=1)[:, ::-1]
+            prefixes = accumulate(blocks[:, 1, :], axis=1)
+            self.levels[level] = np.stack([suffixes, prefixes], axis=1).reshape(-1)
+
+    def query(self, first, last):
+        sums = self.values[first]
+        differ = first != last
+        level = np.frexp((first[differ] ^ last[differ]).astype(np.float64))[1]
+        sums[differ] = self.combine(self.levels[level, first[differ]], self.levels[level, last[differ]])
+        return sums
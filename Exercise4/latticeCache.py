@@ -0,0 +1,86 @@
+import json
+import os
+import hashlib
+import struct
+import numpy as np
+from vocabulary import Vocabulary
+
+MAGIC = b'HTKLATC2'
+HEADER = struct.Struct('<8sQ')
+ALIGNMENT = 64
+VOCABULARY_FILE = 'vocabulary.json'
+
+class LatticeCache(object):
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def getCachePath(self, latticeFilePath):
+        sourcePath = os.path.abspath(latticeFilePath)
+        key = hashlib.sha1(sourcePath.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cacheDir, os.path.basename(latticeFilePath) + '.' + key + '.lat')
+
+    def getSource(self, latticeFilePath):
+        stat = os.stat(latticeFilePath)
+        return {'path': os.path.abspath(latticeFilePath), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    def getVocabularyPath(self):
+        return os.path.join(self.cacheDir, VOCABULARY_FILE)
+
+    def loadVocabulary(self):
+        vocabularyPath = self.getVocabularyPath()
+        return Vocabulary.load(vocabularyPath) if os.path.exists(vocabularyPath) else Vocabulary()
+
+    def storeVocabulary(self, vocabulary):
+        vocabulary.save(self.getVocabularyPath())
+
+    def load(self, latticeFilePath):
+        cachePath = self.getCachePath(latticeFilePath)
+        if(not os.path.exists(cachePath)):
+            return None
+        loaded = readColumnFile(cachePath)
+        if(loaded is None or loaded[1]['source'] != self.getSource(latticeFilePath)):
+            return None
+        columns, header = loaded
+        return columns, header['metadata']
+
+    def store(self, latticeFilePath, columns, metadata):
+        writeColumnFile(self.getCachePath(latticeFilePath), columns, {'source': self.getSource(latticeFilePath), 'metadata': metadata})
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def readColumnFile(filePath, magic=MAGIC):
+    # the columns are memory-mapped, so opening a file costs the same whatever its size
+    with open(filePath, 'rb') as file:
+        fileMagic, headerLength = HEADER.unpack(file.read(HEADER.size))
+        if(fileMagic != magic):
+            return None
+        header = json.loads(file.read(headerLength).decode('utf-8'))
+    dataStart = align(HEADER.size + headerLength)
+    columns = {}
+    for name, dtype, offset, length in header['columns']:
+        if(length == 0):
+            columns[name] = np.zeros(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(filePath, dtype=dtype, mode='r', offset=dataStart + offset, shape=(length,))
+    return columns, header
+
+def writeColumnFile(filePath, columns, header, magic=MAGIC):
+    layout = []
+    offset = 0
+    for name, column in columns.items():
+        layout.append((name, column.dtype.str, offset, len(column)))
+        offset = align(offset + column.nbytes)
+    header = json.dumps(dict(header, columns=layout)).encode('utf-8')
+    dataStart = align(HEADER.size + len(header))
+
+    temporaryPath = filePath + '.' + str(os.getpid()) + '.tmp'
+    with open(temporaryPath, 'wb') as file:
+        file.write(HEADER.pack(magic, len(header)))
+        file.write(header)
+        for (name, dtype, offset, length), column in zip(layout, columns.values()):
+            file.seek(dataStart + offset)
+            file.write(np.ascontiguousarray(column).tobytes())
+    os.replace(temporaryPath, filePath)
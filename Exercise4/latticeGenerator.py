@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import numpy as np
+from latticeParser import FRAMES_PER_SECOND
+
+FILLERS = ('[SILENCE]', '[NOISE]')
+
+class LatticeGenerator(object):
+
+    # random word graphs with the layout of the bundled lattices: node 0 is the only source, the last node the only sink,
+    # nodes are numbered in time order and the links are sorted by start node and never go back in time
+    def __init__(self, numNodes, branchingFactor=10.0, durationSeconds=None, vocabularySize=1000, minWordSeconds=0.1, maxWordSeconds=0.6, fillerRate=0.1, lmScale=50.0, seed=0):
+        assert numNodes >= 2, "A lattice needs at least a start and an end node"
+        self.numNodes = numNodes
+        self.branchingFactor = branchingFactor
+        self.durationSeconds = durationSeconds if durationSeconds is not None else max(1.0, numNodes/1000.0)
+        self.vocabularySize = vocabularySize
+        self.minWordFrames = max(1, int(round(minWordSeconds * FRAMES_PER_SECOND)))
+        self.maxWordFrames = max(self.minWordFrames, int(round(maxWordSeconds * FRAMES_PER_SECOND)))
+        self.fillerRate = fillerRate
+        self.lmScale = lmScale
+        self.seed = seed
+
+    @classmethod
+    def forNumEdges(cls, numEdges, branchingFactor=10.0, **options):
+        return cls(max(2, int(round(numEdges / branchingFactor))), branchingFactor, **options)
+
+    def getWords(self):
+        return list(FILLERS) + ['w' + str(word) for word in range(self.vocabularySize)] + ['!NULL']
+
+    def generate(self):
+        rng = np.random.default_rng(self.seed)
+        numNodes = self.numNodes
+        numFrames = max(2, int(round(self.durationSeconds * FRAMES_PER_SECOND)))
+        nodeTimes = np.empty(numNodes, dtype=np.int64)
+        nodeTimes[0] = 0
+        nodeTimes[1:-1] = np.sort(rng.integers(1, numFrames, numNodes - 2))
+        nodeTimes[-1] = numFrames
+
+        # every node gets a predecessor and a successor, so all of them lie on a path from the source to the sink;
+        # links span minWordFrames to maxWordFrames where the node times allow it, which keeps the graph as shallow as real lattices
+        nodes = np.arange(1, numNodes)
+        firstPredecessors = np.searchsorted(nodeTimes, nodeTimes[nodes] - self.maxWordFrames, 'left')
+        lastPredecessors = np.maximum(np.searchsorted(nodeTimes, nodeTimes[nodes] - self.minWordFrames, 'right'), 1)
+        firstPredecessors = np.minimum(firstPredecessors, lastPredecessors - 1)
+        predecessors = firstPredecessors + (rng.random(len(nodes)) * (lastPredecessors - firstPredecessors)).astype(np.int64)
+
+        nodesFrom = np.r_[np.arange(numNodes - 1), rng.integers(0, numNodes - 1, max(0, int(round(numNodes * self.branchingFactor)) - 2 * (numNodes - 1)))]
+        firstSuccessors = np.minimum(np.searchsorted(nodeTimes, nodeTimes[nodesFrom] + self.minWordFrames, 'left'), numNodes - 1)
+        lastSuccessors = np.maximum(np.searchsorted(nodeTimes, nodeTimes[nodesFrom] + self.maxWordFrames, 'right'), firstSuccessors + 1)
+        successors = firstSuccessors + (rng.random(len(nodesFrom)) * (lastSuccessors - firstSuccessors)).astype(np.int64)
+
+        edgeFrom = np.r_[predecessors, nodesFrom]
+        edgeTo = np.r_[nodes, successors]
+        order = np.lexsort((edgeTo, edgeFrom))
+        edgeFrom, edgeTo = edgeFrom[order], edgeTo[order]
+        numEdges = len(edgeFrom)
+
+        # Zipf-like word frequencies, fillers at a fixed rate and !NULL on the links into the sink like in the real lattices
+        ranks = np.minimum(rng.zipf(1.3, numEdges), self.vocabularySize) - 1
+        edgeWords = np.where(rng.random(numEdges) < self.fillerRate, rng.integers(0, len(FILLERS), numEdges), len(FILLERS) + ranks)
+        edgeWords[edgeTo == numNodes - 1] = len(FILLERS) + self.vocabularySize
+        durations = nodeTimes[edgeTo] - nodeTimes[edgeFrom]
+        acousticScores = -(50.0 * durations + rng.normal(0.0, 2.0, numEdges) * np.sqrt(durations))
+        languageScores = -rng.exponential(4.0, numEdges) - 1.0 * (edgeWords >= len(FILLERS))
+        return nodeTimes, edgeFrom, edgeTo, edgeWords, acousticScores, languageScores
+
+    def getLines(self):
+        nodeTimes, edgeFrom, edgeTo, edgeWords, acousticScores, languageScores = self.generate()
+        words = ['"' + word + '"' for word in self.getWords()]
+        yield "VERSION=1.0\nUTTERANCE=SYNTHETIC_%d_%d\nlmscale=%g\n\n# Lattice Size\nNODES=%d\nLINKS=%d\n\n# Nodes\n" % (self.numNodes, self.seed, self.lmScale, len(nodeTimes), len(edgeFrom))
+        for node, time in enumerate((nodeTimes / float(FRAMES_PER_SECOND)).tolist()):
+            yield "I=%d t=%.2f\n" % (node, time)
+        yield "\n# Links\n"
+        for edge, (nodeFrom, nodeTo, word, acousticScore, languageScore) in enumerate(zip(edgeFrom.tolist(), edgeTo.tolist(), edgeWords.tolist(), acousticScores.tolist(), languageScores.tolist())):
+            yield "J=%d S=%d E=%d W=%s v=0 a=%.3f l=%.5f\n" % (edge, nodeFrom, nodeTo, words[word], acousticScore, languageScore)
+
+    def write(self, latticeFilePath):
+        with gzip.open(latticeFilePath, 'wt', compresslevel=1) as file:
+            file.writelines(self.getLines())
+        return latticeFilePath
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a random HTK lattice')
+    parser.add_argument('output', help='path of the gzipped lattice')
+    parser.add_argument('--nodes', type=int, default=None)
+    parser.add_argument('--edges', type=int, default=10000, help='approximate number of links, used when --nodes is not given')
+    parser.add_argument('--branching', type=float, default=10.0, help='links per node')
+    parser.add_argument('--duration', type=float, default=None, help='seconds, defaults to ten nodes per frame like the bundled lattices')
+    parser.add_argument('--min-word-duration', type=float, default=0.1)
+    parser.add_argument('--vocabulary', type=int, default=1000)
+    parser.add_argument('--max-word-duration', type=float, default=0.6)
+    parser.add_argument('--lm-scale', type=float, default=50.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    options = dict(durationSeconds=args.duration, vocabularySize=args.vocabulary, minWordSeconds=args.min_word_duration, maxWordSeconds=args.max_word_duration, lmScale=args.lm_scale, seed=args.seed)
+    if(args.nodes is not None):
+        generator = LatticeGenerator(args.nodes, args.branching, **options)
+    else:
+        generator = LatticeGenerator.forNumEdges(args.edges, args.branching, **options)
+    generator.write(args.output)
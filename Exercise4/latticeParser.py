@@ -0,0 +1,207 @@
+import gzip
+import queue
+import re
+import threading
+import numpy as np
+from vocabulary import Vocabulary, stripQuotes
+
+FRAMES_PER_SECOND = 100
+BLOCK_SIZE = 1 << 20
+
+LM_SCALE_PATTERN = re.compile(rb'^lmscale=(\S+)', re.M)
+NUM_NODES_PATTERN = re.compile(rb'^NODES=(\d+)', re.M)
+NUM_EDGES_PATTERN = re.compile(rb'^LINKS=(\d+)', re.M)
+NODE_PATTERN = re.compile(rb'^I=(\d+)\s+t=(\S+)', re.M)
+EDGE_PATTERN = re.compile(rb'^J=(\d+)\s+S=(\d+)\s+E=(\d+)\s+W=(\S+)\s+(?:v=\S+\s+)?a=(\S+)\s+l=(\S+)', re.M)
+NODE_LINE_START = re.compile(rb'^I=', re.M)
+EDGE_LINE_START = re.compile(rb'^J=', re.M)
+WORD_FIELD = re.compile(rb'W=(\S+)')
+NODE_KEYS = [b'I=', b't=']
+EDGE_KEYS = [[b'J=', b'S=', b'E=', b'W=', b'v=', b'a=', b'l='], [b'J=', b'S=', b'E=', b'W=', b'a=', b'l=']]
+
+class BlockReader(threading.Thread):
+
+    def __init__(self, latticeFilePath, blockSize=BLOCK_SIZE, maxPendingBlocks=4):
+        super().__init__(daemon=True)
+        self.latticeFilePath = latticeFilePath
+        self.blockSize = blockSize
+        self.blocks = queue.Queue(maxsize=maxPendingBlocks)
+        self.error = None
+        self.stopped = False
+
+    def run(self):
+        try:
+            with gzip.open(self.latticeFilePath, 'rb') as file:
+                while(not self.stopped):
+                    block = file.read(self.blockSize)
+                    if(not block):
+                        break
+                    self.blocks.put(block)
+        except Exception as error:
+            self.error = error
+        finally:
+            self.blocks.put(None)
+
+    def __iter__(self):
+        tail = b''
+        while(True):
+            block = self.blocks.get()
+            if(block is None):
+                break
+            block = tail + block
+            lastNewline = block.rfind(b'\n')
+            if(lastNewline < 0):
+                tail = block
+                continue
+            tail = block[lastNewline + 1:]
+            yield block[:lastNewline + 1]
+        if(self.error is not None):
+            raise self.error
+        if(tail):
+            yield tail + b'\n'
+
+    def stop(self):
+        self.stopped = True
+        while(self.is_alive()):
+            try:
+                self.blocks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+class LatticeParser(object):
+
+    def __init__(self, blockSize=BLOCK_SIZE, vocabulary=None):
+        self.blockSize = blockSize
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.lmScale = None
+        self.numNodes = None
+        self.numEdges = None
+        self.headerParsed = False
+
+    def parse(self, latticeFilePath):
+        columns = None
+        for recordType, records in self.iterateRecords(latticeFilePath):
+            if(columns is None):
+                assert self.numNodes is not None and self.numEdges is not None, 'NODES= and LINKS= should be defined before the nodes in the lattice file'
+                columns = self.allocateColumns()
+            if(recordType == 'nodes'):
+                indices, times = records
+                columns['nodeTimes'][indices] = times
+            else:
+                indices, nodesFrom, nodesTo, words, acousticScores, languageScores = records
+                columns['edgeFrom'][indices] = nodesFrom
+                columns['edgeTo'][indices] = nodesTo
+                columns['edgeWords'][indices] = words
+                columns['acousticScores'][indices] = acousticScores
+                columns['languageScores'][indices] = languageScores
+        if(columns is None):
+            columns = self.allocateColumns()
+        return columns, self.getWords(), self.lmScale
+
+    def iterateRecords(self, latticeFilePath):
+        reader = BlockReader(latticeFilePath, self.blockSize)
+        reader.start()
+        try:
+            for block in reader:
+                if(not self.headerParsed):
+                    self.parseHeader(block)
+                edgesStart = EDGE_LINE_START.search(block)
+                nodes = self.parseNodes(block if edgesStart is None else block[:edgesStart.start()])
+                if(nodes is not None):
+                    yield 'nodes', nodes
+                edges = self.parseEdges(block[edgesStart.start():]) if edgesStart is not None else None
+                if(edges is not None):
+                    yield 'edges', edges
+        finally:
+            reader.stop()
+
+    def getWords(self):
+        return self.vocabulary
+
+    def allocateColumns(self):
+        return {
+            'nodeTimes': np.empty(self.numNodes, dtype=np.int32),
+            'edgeFrom': np.empty(self.numEdges, dtype=np.int32),
+            'edgeTo': np.empty(self.numEdges, dtype=np.int32),
+            'edgeWords': np.empty(self.numEdges, dtype=np.int32),
+            'acousticScores': np.empty(self.numEdges, dtype=np.float64),
+            'languageScores': np.empty(self.numEdges, dtype=np.float64),
+        }
+
+    def parseHeader(self, block):
+        nodesStart = NODE_LINE_START.search(block)
+        header = block[:nodesStart.start()] if nodesStart else block
+        lmScale = LM_SCALE_PATTERN.search(header)
+        numNodes = NUM_NODES_PATTERN.search(header)
+        numEdges = NUM_EDGES_PATTERN.search(header)
+        if(lmScale):
+            self.lmScale = float(lmScale.group(1))
+        if(numNodes is not None and numEdges is not None):
+            self.numNodes = int(numNodes.group(1))
+            self.numEdges = int(numEdges.group(1))
+        self.headerParsed = nodesStart is not None or EDGE_LINE_START.search(block) is not None
+
+    def parseNodes(self, region):
+        records = self.getRecords(region, NODE_LINE_START, b'\nI=')
+        if(not records):
+            return None
+        values = self.tokenizeRecords(records, NODE_KEYS, records.count(b'\nI=') + 1)
+        if(values is not None):
+            indices, times = values[:, 0], values[:, 1]
+        else:
+            indices, times = self.toColumns(NODE_PATTERN.findall(records))
+            times = times.astype(np.float64)
+        return indices.astype(np.int64), np.rint(FRAMES_PER_SECOND * times).astype(np.int32)
+
+    def parseEdges(self, region):
+        records = self.getRecords(region, EDGE_LINE_START, b'\nJ=')
+        if(not records):
+            return None
+        words = WORD_FIELD.findall(records)
+        firstLineKeys = [token[:2] for token in records[:records.find(b'\n')].split()]
+        values = None
+        if(firstLineKeys in EDGE_KEYS):
+            values = self.tokenizeRecords(WORD_FIELD.sub(b'', records), [key for key in firstLineKeys if key != b'W='], len(words))
+        if(values is not None):
+            indices, nodesFrom, nodesTo, acousticScores, languageScores = values[:, 0], values[:, 1], values[:, 2], values[:, -2], values[:, -1]
+            words = np.array(words)
+        else:
+            indices, nodesFrom, nodesTo, words, acousticScores, languageScores = self.toColumns(EDGE_PATTERN.findall(records))
+            acousticScores, languageScores = acousticScores.astype(np.float64), languageScores.astype(np.float64)
+        return (indices.astype(np.int64), nodesFrom.astype(np.int32), nodesTo.astype(np.int32), self.internWords(words),
+                -acousticScores, -languageScores)
+
+    def getRecords(self, region, lineStart, lastLineStart):
+        start = lineStart.search(region)
+        if(start is None):
+            return b''
+        end = region.find(b'\n', max(start.start(), region.rfind(lastLineStart) + 1))
+        return region[start.start():end if end >= 0 else len(region)]
+
+    def stripKeys(self, records):
+        # blanks out the key= prefixes, which are all one letter long, and nothing else: the letters of the keys may
+        # also be part of a value like 1E5
+        characters = np.frombuffer(records, dtype=np.uint8).copy()
+        separators = np.flatnonzero(characters == ord('='))
+        characters[separators] = characters[separators - 1] = ord(' ')
+        return characters.tobytes()
+
+    def tokenizeRecords(self, records, keys, numRecords):
+        try:
+            values = np.fromstring(self.stripKeys(records), dtype=np.float64, sep=' ')
+        except ValueError:
+            return None
+        if(values.size != numRecords * len(keys)):
+            return None
+        return values.reshape(numRecords, len(keys))
+
+    def toColumns(self, records):
+        return [np.array(column) for column in zip(*records)]
+
+    def internWords(self, words):
+        # only the distinct words of a block are decoded, in order of first appearance so the ids do not depend on the block size
+        uniqueWords, firstIndices, inverse = np.unique(words, return_index=True, return_inverse=True)
+        ids = np.empty(len(uniqueWords), dtype=np.int32)
+        for position in np.argsort(firstIndices, kind='stable'):
+            ids[position] = self.vocabulary.intern(stripQuotes(bytes(uniqueWords[position]).decode('utf-8')))
+        return ids[inverse.reshape(-1)]
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from batchDecoder import readManifest, getVocabulary
+from decodeWordGraphs import WordGraph, Lattice
+from latticeCache import LatticeCache
+
+def getTopologicalOrder(lattice):
+    # the nodes in the order of their levels, and the position of every node in it. Node indices of a lattice need not
+    # be topological, only the first node has to be the source and the last one the sink
+    if(lattice.levels is None):
+        lattice.sortNodesTopologically()
+    order = np.concatenate(lattice.levels)
+    positions = np.empty(lattice.numNodes, dtype=np.int64)
+    positions[order] = np.arange(lattice.numNodes)
+    return order, positions
+
+def getCutPoints(lattice, positions):
+    # a node lies on every path from the source to the sink exactly when no edge jumps over its position in a
+    # topological order, i.e. when no node before it has an edge to a node after it; returns these positions
+    maxEdgeTo = np.full(lattice.numNodes, -1, dtype=np.int64)
+    np.maximum.at(maxEdgeTo, positions[lattice.edgeFrom], positions[lattice.edgeTo])
+    reach = np.maximum.accumulate(maxEdgeTo)
+    return np.flatnonzero(np.r_[True, reach[:-1] <= np.arange(1, lattice.numNodes)])
+
+def getShardBoundaries(lattice, positions, numShards):
+    # the cut points closest to equal numbers of edges; edges never jump over a cut point, so all edges leaving
+    # the nodes before one end at it at the latest. Boundaries are positions in the topological order
+    cutPoints = getCutPoints(lattice, positions)
+    edgesBefore = np.searchsorted(np.sort(positions[lattice.edgeFrom]), cutPoints)
+    targets = np.arange(1, numShards) * lattice.numEdges / float(numShards)
+    interior = cutPoints[np.clip(np.searchsorted(edgesBefore, targets), 0, len(cutPoints) - 1)]
+    return np.unique(np.r_[0, interior, lattice.numNodes - 1]), len(cutPoints)
+
+def getShard(lattice, order, positions, firstPosition, lastPosition):
+    # the sub-lattice between two cut points, with its nodes numbered in topological order so the first and last are
+    # its only source and sink. Node times stay absolute, so time frames and confidences of the shard are those of
+    # the whole lattice. Returns the nodes and edges of the lattice the shard is made of as well
+    nodes = order[firstPosition:lastPosition + 1]
+    edgePositions = positions[lattice.edgeFrom]
+    edges = np.flatnonzero((edgePositions >= firstPosition) & (edgePositions < lastPosition))
+    shard = Lattice(lattice.nodeTimes[nodes], edgePositions[edges] - firstPosition, positions[lattice.edgeTo[edges]] - firstPosition, lattice.edgeWords[edges],
+                    lattice.acousticScores[edges], lattice.languageScores[edges], lattice.words, lattice.lmScale)
+    return shard, nodes, edges
+
+def decodeShard(task):
+    shard, lmScale, mode = task
+    wordGraph = WordGraph(None, 0.0, '', None, None, 0.0, lmScale, mode, lattice=shard)
+    forwardProbs, backwardProbs, fullPathProb, posteriorProbs = wordGraph.getResult('forwardBackward')
+    return forwardProbs, backwardProbs, fullPathProb, posteriorProbs, wordGraph.getResult('confidences'), wordGraph.getResult('bestPath')
+
+class ShardedWordGraph(WordGraph):
+
+    # a word graph whose forward-backward, confidences and best path are computed on the shards between cut points,
+    # in the worker processes of an executor, and stitched back into the arrays of the whole lattice. Every path passes
+    # all cut points, so the score of a path is the sum of the scores of its pieces: the forward score of a node is
+    # its score in its shard plus the full path scores of all shards before it, and in the log semiring the edge
+    # posteriors of a shard already are the global ones. Everything after that (pruning, CTM, consensus) is unchanged
+    STAGES = dict(WordGraph.STAGES,
+                  shards=('decodeShards', ('mode', 'lmScale', 'numShards'), ('lattice',)),
+                  forwardBackward=('runForwardBackwardAlgorithm', (), ('shards',)),
+                  confidences=('calculateMeanConfidenceMeasures', (), ('shards',)),
+                  bestPath=('decodeWordGraph', (), ('shards',)))
+
+    def __init__(self, latticeFilePath, startTime, code, pruningThreshold, lmScale, mode, numShards, executor=None, latticeCache=None, vocabulary=None, lattice=None):
+        WordGraph.__init__(self, latticeFilePath, startTime, code, None, None, pruningThreshold, lmScale, mode, latticeCache, vocabulary=vocabulary, lattice=lattice)
+        self.numShards = numShards
+        self.executor = executor
+
+    def decodeShards(self):
+        lattice = self.getResult('lattice')
+        order, positions = getTopologicalOrder(lattice)
+        boundaries, numCutPoints = getShardBoundaries(lattice, positions, self.numShards)
+        shards = [getShard(lattice, order, positions, firstPosition, lastPosition) for firstPosition, lastPosition in zip(boundaries[:-1], boundaries[1:])]
+        tasks = [(shard, self.lmScale, self.mode) for shard, _, _ in shards]
+        results = list(self.executor.map(decodeShard, tasks) if self.executor is not None else map(decodeShard, tasks))
+
+        shardFullPathProbs = np.array([result[2] for result in results])
+        fullPathProb = float(shardFullPathProbs.sum())
+        scoresBefore = np.r_[0, np.cumsum(shardFullPathProbs)[:-1]]
+        scoresAfter = fullPathProb - scoresBefore - shardFullPathProbs
+        forwardProbs, backwardProbs = np.empty(lattice.numNodes), np.empty(lattice.numNodes)
+        posteriorProbs, confidences = np.empty(lattice.numEdges), np.empty(lattice.numEdges)
+        bestPath = []
+        for (_, nodes, edges), result, scoreBefore, scoreAfter in zip(shards, results, scoresBefore, scoresAfter):
+            shardForwardProbs, shardBackwardProbs, _, shardPosteriorProbs, shardConfidences, shardBestPath = result
+            forwardProbs[nodes] = shardForwardProbs + scoreBefore
+            backwardProbs[nodes] = shardBackwardProbs + scoreAfter
+            # tropical posteriors are not normalized, they are the score of the best path through the edge
+            offset = scoreBefore + scoreAfter if self.mode == 'tropical semiring' else 0
+            posteriorProbs[edges] = shardPosteriorProbs + offset
+            confidences[edges] = shardConfidences + offset
+            bestPath.append(edges[shardBestPath])
+        bestPath = np.concatenate(bestPath)
+        self.stats.count(cutPoints=numCutPoints, shards=len(shards), maxShardEdges=max(len(edges) for _, _, edges in shards), decodedWords=len(bestPath))
+        return (forwardProbs, backwardProbs, fullPathProb, posteriorProbs), confidences, bestPath, len(shards)
+
+    @property
+    def numShardsMade(self):
+        # a lattice is never split between cut points, so it has fewer shards than asked for when it has few of them
+        return self.getResult('shards')[3]
+
+    def runForwardBackwardAlgorithm(self):
+        return self.getResult('shards')[0]
+
+    def calculateMeanConfidenceMeasures(self):
+        return self.getResult('shards')[1]
+
+    def decodeWordGraph(self):
+        return self.getResult('shards')[2]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Decode the lattices of a manifest one after another, each split at its cut points and decoded by several workers')
+    parser.add_argument('manifest')
+    parser.add_argument('pruningThreshold', type=float)
+    parser.add_argument('lmScale', type=float)
+    parser.add_argument('--ctm', default='results.ctm')
+    parser.add_argument('--confidence-measures', default=None)
+    parser.add_argument('--mode', default='log semiring', choices=['log semiring', 'tropical semiring'])
+    parser.add_argument('--shards', type=int, default=None, help='defaults to the number of workers')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache-dir', default=os.environ.get('LATTICE_CACHE_DIR', '.latticeCache'))
+    args = parser.parse_args()
+
+    numWorkers = max(1, args.workers or os.cpu_count() or 1)
+    latticeCache = LatticeCache(args.cache_dir) if args.cache_dir is not None else None
+    vocabulary = getVocabulary(args.cache_dir)
+    numSeedWords = len(vocabulary)
+    confMeasFile = open(args.confidence_measures, 'w') if args.confidence_measures is not None else None
+    with ProcessPoolExecutor(numWorkers) as executor, open(args.ctm, 'w') as resultFile:
+        for segment in readManifest(args.manifest):
+            wordGraph = ShardedWordGraph(segment.latticeFilePath, segment.startTime, segment.code, args.pruningThreshold, args.lmScale, args.mode,
+                                         args.shards or numWorkers, executor if numWorkers > 1 else None, latticeCache, vocabulary)
+            resultFile.writelines(wordGraph.getCTMLines())
+            if(confMeasFile is not None):
+                confMeasFile.writelines(wordGraph.getConfidenceMeasureLines())
+            print(segment.latticeFilePath, "cut points", wordGraph.stats.counters['cutPoints'], "shards", wordGraph.numShardsMade,
+                  "largest shard", wordGraph.stats.counters['maxShardEdges'], "of", wordGraph.numEdgesBeforePruning, "edges", file=sys.stderr)
+            if(wordGraph.numShardsMade < wordGraph.numShards):
+                print(segment.latticeFilePath, "could only be split into", wordGraph.numShardsMade, "of", wordGraph.numShards, "shards at its cut points", file=sys.stderr)
+    if(confMeasFile is not None):
+        confMeasFile.close()
+    if(latticeCache is not None and len(vocabulary) > numSeedWords):
+        latticeCache.storeVocabulary(vocabulary)
@@ -0,0 +1,101 @@
+import numpy as np
+from arpaModel import ROOT
+from arrayUtils import gatherSegments
+from decodeWordGraphs import Lattice
+
+class LatticeRescorer(object):
+
+    # replaces the l= scores by the scores of an n-gram model; a node is split into one copy per LM history that reaches it,
+    # where histories that predict the same way share one trie state, so the lattice only grows where the model needs it.
+    # Copies scoring worse than beam behind the best copy of their node, or beyond the maxStatesPerNode best, are dropped
+    def __init__(self, languageModel, beam=float('inf'), maxStatesPerNode=None):
+        self.languageModel = languageModel
+        self.beam = beam
+        self.maxStatesPerNode = maxStatesPerNode
+
+    def getLanguageModelWords(self, vocabulary):
+        # fillers leave the history alone and cost nothing; the remaining words are mapped once per vocabulary entry, not per edge
+        wordIds = self.languageModel.getWordIds(vocabulary.words)
+        wordIds[vocabulary.getFillerMask()] = -2
+        return wordIds
+
+    def rescore(self, lattice, lmScale):
+        assert lattice.levels is not None, "Lattice should be sorted topologically before it is rescored"
+        model = self.languageModel
+        endNode = lattice.numNodes - 1
+        edgeWordIds = self.getLanguageModelWords(lattice.words)[lattice.edgeWords]
+        nodeLevels = np.empty(lattice.numNodes, dtype=np.int64)
+        for level, nodes in enumerate(lattice.levels):
+            nodeLevels[nodes] = level
+        numStates = len(model.states) + 1
+
+        expandedNodes, arcs = [], []
+        pending = [[] for _ in lattice.levels]
+        pending[nodeLevels[0]].append((np.array([0]), np.array([model.startState]), np.array([-1]), np.array([-1]), np.zeros(1), np.zeros(1)))
+        numExpanded = 0
+        for level in range(len(lattice.levels)):
+            if(not pending[level]):
+                continue
+            targets, states, expandedFrom, edges, lmScores, scores = [np.concatenate(column) for column in zip(*pending[level])]
+            pending[level] = None
+
+            # arcs reaching the same (node, state) share one expanded node, which keeps the best arc score as its Viterbi score
+            keys, inverse = np.unique(targets * numStates + states, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            bestScores = np.full(len(keys), np.inf)
+            np.minimum.at(bestScores, inverse, scores)
+            keep = self.getSurvivors(keys // numStates, bestScores)
+            expandedIds = np.full(len(keys), -1, dtype=np.int64)
+            expandedIds[keep] = numExpanded + np.arange(keep.sum())
+            numExpanded += int(keep.sum())
+            nodes, nodeStates, nodeScores = keys[keep] // numStates, keys[keep] % numStates, bestScores[keep]
+            expandedNodes.append(nodes)
+            arcTo = expandedIds[inverse]
+            hasArc = (edges >= 0) & (arcTo >= 0)
+            arcs.append((expandedFrom[hasArc], arcTo[hasArc], edges[hasArc], lmScores[hasArc]))
+
+            outgoing, segmentStarts = gatherSegments(lattice.outgoingOffsets, lattice.outgoingEdges, nodes)
+            if(not len(outgoing)):
+                continue
+            owners = np.repeat(np.arange(len(nodes)), np.diff(np.r_[segmentStarts, len(outgoing)]))
+            arcStates, arcWords, arcTargets = nodeStates[owners], edgeWordIds[outgoing], lattice.edgeTo[outgoing].astype(np.int64)
+            arcLmScores, nextStates = np.zeros(len(outgoing)), arcStates.copy()
+            isWord = arcWords != -2
+            if(isWord.any()):
+                arcLmScores[isWord], nextStates[isWord] = model.score(arcStates[isWord], arcWords[isWord])
+            isFinal = arcTargets == endNode
+            if(isFinal.any() and model.endWord >= 0):
+                endScores, _ = model.score(nextStates[isFinal], np.full(int(isFinal.sum()), model.endWord))
+                arcLmScores[isFinal] += endScores
+            nextStates[isFinal] = ROOT
+            arcScores = nodeScores[owners] + lattice.acousticScores[outgoing] + lmScale * arcLmScores
+            arcIds = expandedIds[keep][owners]
+            targetLevels = nodeLevels[arcTargets]
+            for targetLevel in np.unique(targetLevels):
+                selected = targetLevels == targetLevel
+                pending[targetLevel].append((arcTargets[selected], nextStates[selected], arcIds[selected], outgoing[selected], arcLmScores[selected], arcScores[selected]))
+
+        expandedNodes = np.concatenate(expandedNodes)
+        arcFrom, arcTo, arcEdges, arcLmScores = [np.concatenate(column) for column in zip(*arcs)]
+        order = np.lexsort((arcTo, arcFrom))
+        arcFrom, arcTo, arcEdges, arcLmScores = arcFrom[order], arcTo[order], arcEdges[order], arcLmScores[order]
+        assert expandedNodes[-1] == endNode and np.sum(expandedNodes == endNode) == 1, "Every history should end in the one final state"
+        expanded = Lattice(lattice.nodeTimes[expandedNodes], arcFrom, arcTo, lattice.edgeWords[arcEdges], lattice.acousticScores[arcEdges], arcLmScores, lattice.words, lattice.lmScale)
+        expanded.sortNodesTopologically()
+        # copies whose successors were all dropped are dead ends
+        expanded, _, keptArcs = expanded.getSubgraph(np.ones(expanded.numEdges, dtype=bool))
+        expanded.sortNodesTopologically()
+        return expanded, arcEdges[keptArcs]
+
+    def getSurvivors(self, nodes, scores):
+        keep = np.ones(len(nodes), dtype=bool)
+        if(self.beam == float('inf') and self.maxStatesPerNode is None):
+            return keep
+        order = np.lexsort((scores, nodes))
+        sortedNodes = nodes[order]
+        firsts = np.flatnonzero(np.r_[True, sortedNodes[1:] != sortedNodes[:-1]])
+        groupStarts = np.repeat(firsts, np.diff(np.r_[firsts, len(order)]))
+        keep[order] = scores[order] <= scores[order][groupStarts] + self.beam
+        if(self.maxStatesPerNode is not None):
+            keep[order] &= np.arange(len(order)) - groupStarts < self.maxStatesPerNode
+        return keep
@@ -0,0 +1,122 @@
+import heapq
+import numpy as np
+
+class PathHeapNode(object):
+
+    __slots__ = ('key', 'sidetrack', 'left', 'right', 'rank')
+
+    def __init__(self, key, sidetrack, left=None, right=None):
+        self.key = key
+        self.sidetrack = sidetrack
+        self.left = left
+        self.right = right
+        self.rank = (right.rank if right is not None else 0) + 1
+
+def meld(first, second):
+    if(first is None):
+        return second
+    if(second is None):
+        return first
+    if(second.key < first.key):
+        first, second = second, first
+    left, right = first.left, meld(first.right, second)
+    if(left is None or left.rank < right.rank):
+        left, right = right, left
+    return PathHeapNode(first.key, first.sidetrack, left, right)
+
+class NBestEnumerator(object):
+
+    # Eppstein-style enumeration: every path is the shortest-path tree plus a sequence of sidetrack edges,
+    # and the candidates are explored lazily through persistent heaps of sidetracks along the tree paths
+    def __init__(self, lattice, weights, costToGo, nextEdges, startNode, endNode):
+        self.lattice = lattice
+        self.weights = weights
+        self.costToGo = costToGo
+        self.nextEdges = nextEdges
+        self.startNode = startNode
+        self.endNode = endNode
+
+        edges = np.arange(lattice.numEdges)
+        delta = weights + costToGo[lattice.edgeTo] - costToGo[lattice.edgeFrom]
+        isSidetrack = np.isfinite(delta) & (nextEdges[lattice.edgeFrom] != edges)
+        sidetracks = edges[isSidetrack]
+        order = np.lexsort((delta[sidetracks], lattice.edgeFrom[sidetracks]))
+        self.sidetracks = sidetracks[order]
+        self.sidetrackDelta = delta[self.sidetracks].tolist()
+        self.sidetrackTails = lattice.edgeFrom[self.sidetracks]
+        self.sidetrackOffsets = np.zeros(lattice.numNodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.sidetrackTails, minlength=lattice.numNodes), out=self.sidetrackOffsets[1:])
+        self.pathHeaps = {}
+
+    def getTreeSuccessor(self, node):
+        edge = self.nextEdges[node]
+        return int(self.lattice.edgeTo[edge]) if edge >= 0 else -1
+
+    def getPathHeap(self, node):
+        pending = []
+        while(node >= 0 and node not in self.pathHeaps):
+            pending.append(node)
+            node = self.getTreeSuccessor(node)
+        heap = self.pathHeaps.get(node)
+        for node in reversed(pending):
+            first = int(self.sidetrackOffsets[node])
+            if(first < self.sidetrackOffsets[node + 1]):
+                heap = meld(heap, PathHeapNode(self.sidetrackDelta[first], first))
+            self.pathHeaps[node] = heap
+        return heap
+
+    def getChildren(self, element):
+        if(isinstance(element, PathHeapNode)):
+            children = [child for child in (element.left, element.right) if child is not None]
+            position = element.sidetrack
+        else:
+            children = []
+            position = element
+        tail = self.sidetrackTails[position]
+        if(position + 1 < self.sidetrackOffsets[tail + 1]):
+            children.append(position + 1)
+        return children
+
+    def getSidetrack(self, element):
+        return element.sidetrack if isinstance(element, PathHeapNode) else element
+
+    def iteratePaths(self):
+        bestCost = float(self.costToGo[self.startNode])
+        if(not np.isfinite(bestCost)):
+            return
+        yield bestCost, self.getEdges(None)
+        candidates = []
+        counter = 0
+        root = self.getPathHeap(self.startNode)
+        if(root is not None):
+            heapq.heappush(candidates, (bestCost + root.key, counter, root, None))
+        while(candidates):
+            cost, _, element, prefix = heapq.heappop(candidates)
+            sidetrack = self.getSidetrack(element)
+            path = (sidetrack, prefix)
+            yield cost, self.getEdges(path)
+            for child in self.getChildren(element):
+                counter += 1
+                heapq.heappush(candidates, (cost - self.sidetrackDelta[sidetrack] + self.sidetrackDelta[self.getSidetrack(child)], counter, child, prefix))
+            root = self.getPathHeap(int(self.lattice.edgeTo[self.sidetracks[sidetrack]]))
+            if(root is not None):
+                counter += 1
+                heapq.heappush(candidates, (cost + root.key, counter, root, path))
+
+    def getEdges(self, path):
+        sidetracks = []
+        while(path is not None):
+            sidetracks.append(int(self.sidetracks[path[0]]))
+            path = path[1]
+        edges = []
+        node = self.startNode
+        for sidetrack in sidetracks[::-1] + [None]:
+            target = self.endNode if sidetrack is None else int(self.lattice.edgeFrom[sidetrack])
+            while(node != target):
+                edge = int(self.nextEdges[node])
+                edges.append(edge)
+                node = int(self.lattice.edgeTo[edge])
+            if(sidetrack is not None):
+                edges.append(sidetrack)
+                node = int(self.lattice.edgeTo[sidetrack])
+        return edges
@@ -0,0 +1,92 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def getPeakRss():
+    # kilobytes on Linux; None where the resource module is not available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None
+
+class StageStats(object):
+
+    def __init__(self, name, wallTime, cpuTime, peakRss, peakTracedBytes):
+        self.name = name
+        self.wallTime = wallTime
+        self.cpuTime = cpuTime
+        self.peakRss = peakRss
+        self.peakTracedBytes = peakTracedBytes
+
+    def toDict(self):
+        return {'name': self.name, 'wallTime': self.wallTime, 'cpuTime': self.cpuTime, 'peakRss': self.peakRss, 'peakTracedBytes': self.peakTracedBytes}
+
+class RunStats(object):
+
+    # peakRss is the high-water mark of the whole process after the stage, peakTracedBytes the peak of the stage itself,
+    # which is only measured while tracemalloc is tracing since it slows every allocation down
+    def __init__(self, latticeFilePath, traceMemory=False):
+        self.latticeFilePath = latticeFilePath
+        self.stages = []
+        self.activeStages = []
+        self.counters = {}
+        if(traceMemory and not tracemalloc.is_tracing()):
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        # stages nest when e.g. a writer asks for results that are only computed then: the time of the inner stage only
+        # counts for it, and the peak memory seen by the outer stage before the inner one reset it is kept
+        tracing = tracemalloc.is_tracing()
+        active = {'childWallTime': 0.0, 'childCpuTime': 0.0, 'peakTraced': 0}
+        if(tracing):
+            if(self.activeStages):
+                self.activeStages[-1]['peakTraced'] = max(self.activeStages[-1]['peakTraced'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            startTraced = tracemalloc.get_traced_memory()[0]
+        self.activeStages.append(active)
+        startWall, startCpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wallTime, cpuTime = time.perf_counter() - startWall, time.process_time() - startCpu
+            self.activeStages.pop()
+            peakTracedBytes = None
+            if(tracing):
+                active['peakTraced'] = max(active['peakTraced'], tracemalloc.get_traced_memory()[1])
+                peakTracedBytes = active['peakTraced'] - startTraced
+            if(self.activeStages):
+                parent = self.activeStages[-1]
+                parent['childWallTime'] += wallTime
+                parent['childCpuTime'] += cpuTime
+                parent['peakTraced'] = max(parent['peakTraced'], active['peakTraced'])
+            self.stages.append(StageStats(name, wallTime - active['childWallTime'], cpuTime - active['childCpuTime'], getPeakRss(), peakTracedBytes))
+
+    def count(self, **counters):
+        self.counters.update(counters)
+
+    def getStage(self, name):
+        for stage in self.stages:
+            if(stage.name == name):
+                return stage
+        return None
+
+    def getTotalWallTime(self):
+        return sum(stage.wallTime for stage in self.stages)
+
+    def getTotalCpuTime(self):
+        return sum(stage.cpuTime for stage in self.stages)
+
+    def toDict(self):
+        return {'lattice': self.latticeFilePath, 'wallTime': self.getTotalWallTime(), 'cpuTime': self.getTotalCpuTime(),
+                'stages': [stage.toDict() for stage in self.stages], 'counters': self.counters}
+
+    def toJSONLine(self):
+        return json.dumps(self.toDict(), sort_keys=True) + '\n'
+
+    def writeJSONLine(self, statsFilePath):
+        with open(statsFilePath, 'a') as statsFile:
+            statsFile.write(self.toJSONLine())
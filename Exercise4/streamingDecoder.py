@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import argparse
+import heapq
+import sys
+from decodeWordGraphs import getCTMHeaderLines, getCTMWordLine
+from latticeParser import LatticeParser, FRAMES_PER_SECOND
+from vocabulary import Vocabulary
+
+class TraceNode(object):
+
+    __slots__ = ('word', 'startTime', 'endTime', 'previous', 'depth')
+
+    def __init__(self, word, startTime, endTime, previous):
+        self.word = word
+        self.startTime = startTime
+        self.endTime = endTime
+        self.previous = previous
+        self.depth = previous.depth + 1 if previous is not None else 1
+
+class StreamingDecoder(object):
+
+    # time-synchronous Viterbi over the edges in file order: only the tokens of nodes that have not been expanded yet
+    # and lie within the time window are kept, and words are written as soon as every surviving token agrees on them
+    def __init__(self, latticeFilePath, startTime, code, resultFile, lmScale=None, windowSeconds=5.0, tracebackSeconds=1.0, vocabulary=None):
+        self.latticeFilePath = latticeFilePath
+        self.startTime = startTime
+        self.code = code
+        self.resultFile = resultFile
+        self.lmScale = lmScale
+        self.windowFrames = int(round(windowSeconds * FRAMES_PER_SECOND))
+        self.tracebackFrames = int(round(tracebackSeconds * FRAMES_PER_SECOND))
+        self.parser = LatticeParser(vocabulary=vocabulary if vocabulary is not None else Vocabulary())
+        self.nodeTimes = None
+        self.started = False
+        self.words = self.parser.getWords()
+        self.isFiller = []
+        self.tokens = {}
+        self.tokenTimes = []
+        self.currentNode = -1
+        self.currentTime = 0
+        self.lastTracebackTime = 0
+        self.lastEmitted = None
+        self.numEmittedWords = 0
+        self.maxActiveTokens = 0
+
+    def decode(self):
+        for recordType, records in self.parser.iterateRecords(self.latticeFilePath):
+            if(recordType == 'nodes'):
+                self.addNodes(*records)
+            else:
+                if(not self.started):
+                    self.startDecoding()
+                self.processEdges(*records)
+                self.traceBack()
+        return self.finish()
+
+    def addNodes(self, indices, times):
+        if(self.nodeTimes is None):
+            assert self.parser.numNodes is not None, 'NODES= should be defined before the nodes in the lattice file'
+            self.nodeTimes = [0] * self.parser.numNodes
+        for index, time in zip(indices.tolist(), times.tolist()):
+            self.nodeTimes[index] = time
+
+    def startDecoding(self):
+        self.started = True
+        if(self.lmScale is None):
+            self.lmScale = self.parser.lmScale
+        self.resultFile.writelines(getCTMHeaderLines(self.code, self.startTime, self.nodeTimes[-1]))
+        self.tokens[0] = (0.0, None)
+        heapq.heappush(self.tokenTimes, (self.nodeTimes[0], 0))
+
+    def updateWords(self):
+        # a list lookup is cheaper than indexing the mask inside the per-edge loop
+        self.isFiller = self.words.getFillerMask().tolist()
+
+    def processEdges(self, indices, nodesFrom, nodesTo, words, acousticScores, languageScores):
+        if(len(self.isFiller) < len(self.words)):
+            self.updateWords()
+        weights = (acousticScores + self.lmScale * languageScores).tolist()
+        nodeTimes = self.nodeTimes
+        tokens = self.tokens
+        token = tokens.get(self.currentNode)
+        for nodeFrom, nodeTo, word, weight in zip(nodesFrom.tolist(), nodesTo.tolist(), words.tolist(), weights):
+            if(nodeFrom != self.currentNode):
+                if(nodeFrom < self.currentNode):
+                    raise ValueError('streaming decoding needs the edges grouped by ascending start node')
+                self.expandNode(nodeFrom)
+                token = tokens.get(nodeFrom)
+            if(nodeTo <= nodeFrom):
+                raise ValueError('streaming decoding needs every edge to end in a node with a higher index')
+            if(token is None):
+                continue
+            score = token[0] + weight
+            previous = tokens.get(nodeTo)
+            if(previous is None or score < previous[0]):
+                trace = token[1]
+                if(not self.isFiller[word]):
+                    trace = TraceNode(word, nodeTimes[nodeFrom], nodeTimes[nodeTo], trace)
+                if(previous is None):
+                    heapq.heappush(self.tokenTimes, (nodeTimes[nodeTo], nodeTo))
+                tokens[nodeTo] = (score, trace)
+
+    def expandNode(self, node):
+        # every incoming edge of a node comes from a lower index, so the token of the node is final once it is expanded
+        # and the token of the previously expanded node is no longer needed. The frontier is largest right before that
+        self.maxActiveTokens = max(self.maxActiveTokens, len(self.tokens))
+        self.tokens.pop(self.currentNode, None)
+        self.currentNode = node
+        if(node not in self.tokens):
+            return
+        self.currentTime = max(self.currentTime, self.nodeTimes[node])
+        while(self.tokenTimes and self.tokenTimes[0][0] < self.currentTime - self.windowFrames):
+            _, oldNode = heapq.heappop(self.tokenTimes)
+            if(oldNode != node):
+                self.tokens.pop(oldNode, None)
+        if(self.currentTime >= self.lastTracebackTime + self.tracebackFrames):
+            self.traceBack()
+
+    def traceBack(self):
+        self.lastTracebackTime = self.currentTime
+        traces = [trace for _, trace in self.tokens.values()]
+        if(not traces or any(trace is None for trace in traces)):
+            return
+        depth = min(trace.depth for trace in traces)
+        traces = set(self.getAncestor(trace, depth) for trace in traces)
+        while(len(traces) > 1):
+            traces = set(trace.previous for trace in traces)
+        ancestor = traces.pop()
+        if(ancestor is not None):
+            self.emit(ancestor)
+            # everything before the common ancestor is written, so the shared history can be released
+            ancestor.previous = None
+
+    def getAncestor(self, trace, depth):
+        while(trace.depth > depth):
+            trace = trace.previous
+        return trace
+
+    def emit(self, trace):
+        finalized = []
+        while(trace is not None and trace is not self.lastEmitted):
+            finalized.append(trace)
+            trace = trace.previous
+        if(not finalized):
+            return
+        self.lastEmitted = finalized[0]
+        lines = []
+        for trace in reversed(finalized):
+            startTime = self.startTime + trace.startTime/float(FRAMES_PER_SECOND)
+            duration = (trace.endTime - trace.startTime)/float(FRAMES_PER_SECOND)
+            lines.append(getCTMWordLine(round(startTime, 3), round(duration, 3), self.words[trace.word]))
+        self.resultFile.writelines(lines)
+        self.resultFile.flush()
+        self.numEmittedWords += len(lines)
+
+    def finish(self):
+        endNode = len(self.nodeTimes) - 1 if self.nodeTimes is not None else -1
+        if(endNode not in self.tokens):
+            raise ValueError('Last node should be reachable from the first node within the time window')
+        self.maxActiveTokens = max(self.maxActiveTokens, len(self.tokens))
+        score, trace = self.tokens[endNode]
+        self.emit(trace)
+        self.tokens = {}
+        self.tokenTimes = []
+        return score
+
+def decodeManifest(segments, resultFilePath, lmScale=None, windowSeconds=5.0, tracebackSeconds=1.0):
+    with open(resultFilePath, 'w') as resultFile:
+        for segment in segments:
+            decoder = StreamingDecoder(segment.latticeFilePath, segment.startTime, segment.code, resultFile, lmScale, windowSeconds, tracebackSeconds)
+            decoder.decode()
+            print(segment.latticeFilePath, "words", decoder.numEmittedWords, "max active tokens", decoder.maxActiveTokens)
+
+if __name__ == "__main__":
+    from batchDecoder import readManifest
+
+    parser = argparse.ArgumentParser(description='Decode the lattices of a manifest time-synchronously, writing words to the CTM file as soon as they are final')
+    parser.add_argument('manifest')
+    parser.add_argument('--lm-scale', type=float, default=None, help='defaults to the lmscale of each lattice')
+    parser.add_argument('--ctm', default='results.ctm')
+    parser.add_argument('--window', type=float, default=5.0, help='seconds a token may lag behind the latest expanded node before it is dropped')
+    parser.add_argument('--traceback-interval', type=float, default=1.0, help='seconds between partial tracebacks')
+    args = parser.parse_args()
+
+    try:
+        decodeManifest(readManifest(args.manifest), args.ctm, args.lm_scale, args.window, args.traceback_interval)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,85 @@
+import itertools
+import math
+import pytest
+from arpaModel import ArpaModel, LOG10
+
+ARPA = '''
+\\data\\
+ngram 1=6
+ngram 2=6
+ngram 3=2
+
+\\1-grams:
+-1.0 <s> -0.5
+-0.7 </s>
+-2.0 <unk>
+-0.6 a -0.3
+-0.8 b -0.2
+-1.1 c
+
+\\2-grams:
+-0.2 <s> a -0.1
+-0.9 <s> b
+-0.4 a b -0.25
+-0.3 a </s>
+-0.5 b c
+-0.6 b a
+
+\\3-grams:
+-0.1 <s> a b
+-0.05 a b c
+
+\\end\\
+'''
+
+def getNGrams():
+    nGrams = {}
+    for line in ARPA.splitlines():
+        fields = line.split()
+        if(len(fields) >= 2 and not line.startswith('ngram') and not line.startswith('\\')):
+            order = next(order for order in (3, 2, 1) if len(fields) >= order + 1 and all(not field.lstrip('-').replace('.', '').isdigit() for field in fields[1:order + 1]))
+            nGrams[tuple(fields[1:order + 1])] = (float(fields[0]), float(fields[order + 1]) if len(fields) > order + 1 else 0.0)
+    return nGrams
+
+def getNaiveLog10Prob(nGrams, history, word):
+    # the textbook backoff recursion on the full history
+    if(history + (word,) in nGrams):
+        return nGrams[history + (word,)][0]
+    if(not history):
+        return None
+    return nGrams.get(history, (0.0, 0.0))[1] + getNaiveLog10Prob(nGrams, history[1:], word)
+
+@pytest.fixture
+def model(tmp_path):
+    arpaFilePath = tmp_path / 'test.arpa'
+    arpaFilePath.write_text(ARPA)
+    return ArpaModel.fromArpaFile(str(arpaFilePath))
+
+def test_sentences_score_like_naive_backoff(model):
+    nGrams = getNGrams()
+    for length in range(4):
+        for words in itertools.product(['a', 'b', 'c', 'x'], repeat=length):
+            history, expected = ('<s>',), 0.0
+            for word in list(words) + ['</s>']:
+                word = word if word in model.wordIds else '<unk>'
+                expected += getNaiveLog10Prob(nGrams, history, word)
+                history = (history + (word,))[-2:]
+            assert model.scoreSentence(words) == pytest.approx(-LOG10 * expected), words
+
+def test_backoff_weights(model):
+    # "b a c": c after "b a" backs off to the unigram, through the backoff of "b a" (none) and of "a" (-0.3)
+    state = model.startState
+    scores = []
+    for word in ['b', 'a', 'c']:
+        score, nextState = model.score([state], model.getWordIds([word]))
+        scores.append(float(score[0]))
+        state = int(nextState[0])
+    assert scores == pytest.approx([-LOG10 * -0.9, -LOG10 * -0.6, -LOG10 * (-0.3 - 1.1)])
+
+def test_unknown_words_score_as_unk(model):
+    unknownWord = model.getWordIds(['never seen'])[0]
+    assert unknownWord == model.wordIds['<unk>']
+    # after "<s> a" there is neither "<s> a <unk>" nor "a <unk>", so it backs off through both
+    state = int(model.score([model.startState], model.getWordIds(['a']))[1][0])
+    assert float(model.score([state], [unknownWord])[0][0]) == pytest.approx(-LOG10 * (-0.1 - 0.3 - 2.0))
+    assert math.isclose(model.scoreSentence(['never seen']), model.scoreSentence(['<unk>']))
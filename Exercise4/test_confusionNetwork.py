@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+from decodeWordGraphs import WordGraph
+
+@pytest.mark.parametrize('mode', ['log semiring', 'tropical semiring'])
+def test_consensus(mode, slotLattice):
+    wordGraph = WordGraph(None, 0.0, '', None, None, 100.0, 1.0, mode, lattice=slotLattice)
+    network = wordGraph.decodeConsensus()
+    assert [network.words[word] for word in network.entryWords[network.getConsensus()]] == ['A', 'C']
+    assert np.all((network.entryPosteriors > 0) & (network.entryPosteriors <= 1))
+    assert [line.split()[-1] for line in wordGraph.getCTMLines()[2:]] == ['A', 'C']
+
+def test_tropical_posteriors_are_max_marginals(slotLattice):
+    wordGraph = WordGraph(None, 0.0, '', None, None, 100.0, 1.0, 'tropical semiring', lattice=slotLattice)
+    network = wordGraph.decodeConsensus()
+    # the best path through B costs 1 more than the best path of all
+    assert network.getSlot(0) == [('A', 1.0), ('B', pytest.approx(np.exp(-1.0)))]
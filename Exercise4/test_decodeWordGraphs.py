@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from decodeWordGraphs import WordGraph
+
+@pytest.mark.parametrize('mode', ['log semiring', 'tropical semiring'])
+def test_confidence_rescoring_is_opt_in(mode, branchingLattice):
+    wordGraph = WordGraph(None, 0.0, '', None, None, np.inf, 1.0, mode, lattice=branchingLattice)
+    lattice = wordGraph.getResult('lattice')
+    assert np.array_equal(wordGraph.weights, lattice.getWeights(1.0))
+    bestPath = wordGraph.getResult('bestPath').tolist()
+
+    # the confidences of the first pass become the weights of pruning and decoding
+    wordGraph.confidenceRescoring = True
+    confidences = wordGraph.getResult('confidences')
+    rescoredWeights = np.maximum(confidences, 0)
+    assert np.array_equal(wordGraph.weights, rescoredWeights)
+    assert np.array_equal(wordGraph.confidenceMeasures, confidences)
+    _, backpointers = wordGraph.calculateViterbi(lattice, lattice.forwardSchedule, 0, rescoredWeights)
+    assert wordGraph.getResult('bestPath').tolist() == wordGraph.traceBack(lattice, backpointers).tolist()
+    assert wordGraph.fullPathProb == pytest.approx(wordGraph.calculateForwardBackward(lattice, rescoredWeights)[2])
+
+    wordGraph.confidenceRescoring = False
+    assert wordGraph.getResult('bestPath').tolist() == bestPath
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from framePosteriors import RangeSumTable
+
+SEMIRINGS = {
+    'sum': (lambda values, axis: np.add.accumulate(values, axis=axis), np.add, lambda values: np.sum(values)),
+    'log': (lambda values, axis: -np.logaddexp.accumulate(-values, axis=axis), lambda a, b: -np.logaddexp(-a, -b), lambda values: -np.logaddexp.reduce(-values)),
+    'min': (lambda values, axis: np.minimum.accumulate(values, axis=axis), np.minimum, lambda values: np.min(values)),
+}
+
+@pytest.mark.parametrize('semiring', sorted(SEMIRINGS))
+@pytest.mark.parametrize('numValues', [1, 2, 8, 37])
+def test_range_sums_match_naive_sums(semiring, numValues):
+    accumulate, combine, reduce = SEMIRINGS[semiring]
+    values = np.random.default_rng(numValues).uniform(0.5, 5.0, numValues)
+    table = RangeSumTable(values, accumulate, combine)
+    # every range, so also every length-1 range and every range crossing a block boundary
+    first, last = np.triu_indices(numValues)
+    expected = [reduce(values[start:end + 1]) for start, end in zip(first, last)]
+    assert np.allclose(table.query(first, last), expected)
+
+def test_ranges_across_block_boundaries():
+    accumulate, combine, _ = SEMIRINGS['sum']
+    values = np.arange(1.0, 38.0)
+    table = RangeSumTable(values, accumulate, combine)
+    first, last = np.array([7, 15, 31, 0, 3, 36]), np.array([8, 16, 32, 36, 3, 36])
+    assert table.query(first, last).tolist() == [values[start:end + 1].sum() for start, end in zip(first, last)]
@@ -0,0 +1,46 @@
+import gzip
+import numpy as np
+from decodeWordGraphs import WordGraph
+from latticeParser import LatticeParser
+
+LATTICE = b'''VERSION=1.0
+UTTERANCE=test
+lmscale=12.00
+NODES=3
+LINKS=3
+I=0 t=0.00
+I=1 t=0.25
+I=2 t=0.50
+J=0 S=0 E=1 W=SIL v=0 a=-1E2 l=-0
+J=1 S=1 E=2 W=EASE v=0 a=-2.5E1 l=-3.5e-01
+J=2 S=0 E=2 W=SEAL v=0 a=-1.5E1 l=-4
+'''
+
+def parse(tmp_path, text):
+    latticeFilePath = str(tmp_path / 'test.htk.gz')
+    with gzip.open(latticeFilePath, 'wb') as file:
+        file.write(text)
+    return LatticeParser().parse(latticeFilePath)
+
+def test_uppercase_exponents(tmp_path):
+    columns, words, lmScale = parse(tmp_path, LATTICE)
+    assert lmScale == 12.0
+    assert columns['nodeTimes'].tolist() == [0, 25, 50]
+    assert columns['edgeFrom'].tolist() == [0, 1, 0]
+    assert columns['edgeTo'].tolist() == [1, 2, 2]
+    assert [words[word] for word in columns['edgeWords']] == ['SIL', 'EASE', 'SEAL']
+    assert np.allclose(columns['acousticScores'], [100.0, 25.0, 15.0])
+    assert np.allclose(columns['languageScores'], [0.0, 0.35, 4.0])
+
+def test_lattice_without_header_lmscale(tmp_path):
+    # weights are computed later with the LM scale of the caller, so the header does not need one
+    columns, words, lmScale = parse(tmp_path, LATTICE.replace(b'lmscale=12.00\n', b''))
+    assert lmScale is None
+    assert np.allclose(columns['acousticScores'], [100.0, 25.0, 15.0])
+
+def test_decode_lattice_without_header_lmscale(tmp_path):
+    latticeFilePath = str(tmp_path / 'test.htk.gz')
+    with gzip.open(latticeFilePath, 'wb') as file:
+        file.write(LATTICE.replace(b'lmscale=12.00\n', b''))
+    wordGraph = WordGraph(latticeFilePath, 0.0, '', None, None, 100.0, 1.0, 'log semiring')
+    assert [line.split()[-1] for line in wordGraph.getCTMLines()[2:]] == ['SEAL']
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from decodeWordGraphs import WordGraph
+from latticeSharding import ShardedWordGraph, getCutPoints, getTopologicalOrder
+
+def test_cut_points_follow_the_topological_order(reverseNumberedLattice):
+    order, positions = getTopologicalOrder(reverseNumberedLattice)
+    assert order[getCutPoints(reverseNumberedLattice, positions)].tolist() == [0, 3, 2, 1, 4]
+
+@pytest.mark.parametrize('mode', ['log semiring', 'tropical semiring'])
+def test_sharded_decoding_matches_unsharded(mode, reverseNumberedLattice):
+    wordGraph = WordGraph(None, 0.0, '', None, None, 100.0, 1.0, mode, lattice=reverseNumberedLattice)
+    shardedWordGraph = ShardedWordGraph(None, 0.0, '', 100.0, 1.0, mode, 3, lattice=reverseNumberedLattice)
+    assert shardedWordGraph.getCTMLines() == wordGraph.getCTMLines()
+    assert [line.split()[-1] for line in wordGraph.getCTMLines()[2:]] == ['A', 'C', 'E']
+    for name in ('forwardProbs', 'backwardProbs', 'posteriorProbs', 'confidenceMeasures'):
+        assert np.allclose(getattr(shardedWordGraph, name), getattr(wordGraph, name))
+
+def test_shards_are_limited_by_the_cut_points(reverseNumberedLattice):
+    # five cut points make at most four shards
+    shardedWordGraph = ShardedWordGraph(None, 0.0, '', 100.0, 1.0, 'log semiring', 10, lattice=reverseNumberedLattice)
+    assert shardedWordGraph.numShardsMade == 4
+    assert shardedWordGraph.stats.counters['shards'] == 4
+    assert ShardedWordGraph(None, 0.0, '', 100.0, 1.0, 'log semiring', 2, lattice=reverseNumberedLattice).numShardsMade == 2
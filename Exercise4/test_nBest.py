@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from decodeWordGraphs import WordGraph
+from nBest import NBestEnumerator
+
+def getAllPaths(lattice, weights, node=0):
+    # every path from node to the last node with its cost, by brute force
+    if(node == lattice.numNodes - 1):
+        return [(0.0, [])]
+    paths = []
+    for edge in np.flatnonzero(lattice.edgeFrom == node).tolist():
+        paths.extend((cost + weights[edge], [edge] + edges) for cost, edges in getAllPaths(lattice, weights, int(lattice.edgeTo[edge])))
+    return paths
+
+@pytest.mark.parametrize('lmScale', [0.0, 1.0, 3.0])
+def test_paths_come_in_order_of_cost(branchingLattice, lmScale):
+    lattice = branchingLattice
+    wordGraph = WordGraph(None, 0.0, '', None, None, 100.0, lmScale, 'tropical semiring', lattice=lattice)
+    lattice = wordGraph.getResult('lattice')
+    weights = wordGraph.getResult('weights')
+    costToGo, nextEdges = wordGraph.calculateViterbi(lattice, lattice.backwardSchedule, lattice.numNodes - 1, weights)
+    enumerated = list(NBestEnumerator(lattice, weights, costToGo, nextEdges, 0, lattice.numNodes - 1).iteratePaths())
+    expected = getAllPaths(lattice, weights)
+
+    costs = [cost for cost, _ in enumerated]
+    assert costs == sorted(costs)
+    assert np.allclose(costs, sorted(cost for cost, _ in expected))
+    # every path exactly once, with the cost of its edges
+    assert sorted(tuple(edges) for _, edges in enumerated) == sorted(tuple(edges) for _, edges in expected)
+    for cost, edges in enumerated:
+        assert cost == pytest.approx(weights[edges].sum())
+    assert enumerated[0][1] == wordGraph.getResult('bestPath').tolist()
+
+def test_n_best_hypotheses(branchingLattice):
+    wordGraph = WordGraph(None, 0.0, '', None, None, 100.0, 1.0, 'log semiring', lattice=branchingLattice)
+    # no word is a filler, so every path is a hypothesis of its own
+    expected = sorted(cost for cost, _ in getAllPaths(wordGraph.prunedLattice, wordGraph.weights))[:3]
+    hypotheses = list(wordGraph.getNBestHypotheses(3))
+    assert np.allclose([cost for cost, _ in hypotheses], expected)
+    assert [word for word, _, _, _ in hypotheses[0][1]] == ['A', 'C', 'E', 'G', 'J']
@@ -0,0 +1,28 @@
+import time
+import tracemalloc
+from runStats import RunStats
+
+def test_nested_stages_are_timed_once():
+    stats = RunStats('test')
+    startWall = time.perf_counter()
+    with stats.stage('outer'):
+        time.sleep(0.02)
+        with stats.stage('inner'):
+            time.sleep(0.05)
+    wallTime = time.perf_counter() - startWall
+    assert stats.getStage('inner').wallTime >= 0.05
+    assert 0.02 <= stats.getStage('outer').wallTime < 0.05
+    assert stats.getTotalWallTime() <= wallTime
+
+def test_nested_stage_keeps_outer_peak():
+    stats = RunStats('test', traceMemory=True)
+    try:
+        with stats.stage('outer'):
+            block = bytearray(1 << 22)
+            del block
+            with stats.stage('inner'):
+                pass
+    finally:
+        tracemalloc.stop()
+    assert stats.getStage('outer').peakTracedBytes >= 1 << 22
+    assert stats.getStage('inner').peakTracedBytes < 1 << 22
@@ -0,0 +1,24 @@
+import gzip
+import io
+from streamingDecoder import StreamingDecoder
+
+def writeFanLattice(tmp_path, numBranches):
+    # node 0 fans out to nodes 1..numBranches, which all join again in the last node
+    lastNode = numBranches + 1
+    lines = ['VERSION=1.0', 'UTTERANCE=test', 'lmscale=1.00', 'NODES=%d' % (lastNode + 1), 'LINKS=%d' % (2 * numBranches)]
+    lines += ['I=%d t=%.2f' % (node, 0.1 * min(node, 1) + 0.1 * (node == lastNode)) for node in range(lastNode + 1)]
+    edges = [(0, branch, 'W%d' % branch, abs(branch - 3)) for branch in range(1, numBranches + 1)]
+    edges += [(branch, lastNode, '!NULL', 0) for branch in range(1, numBranches + 1)]
+    lines += ['J=%d S=%d E=%d W=%s v=0 a=-%d l=0' % ((index,) + edge) for index, edge in enumerate(edges)]
+    latticeFilePath = str(tmp_path / 'test.htk.gz')
+    with gzip.open(latticeFilePath, 'wt') as file:
+        file.write('\n'.join(lines) + '\n')
+    return latticeFilePath
+
+def test_max_active_tokens_is_the_largest_frontier(tmp_path):
+    # after node 0 is expanded every branch holds a token next to it, which is gone by the end of the block
+    resultFile = io.StringIO()
+    decoder = StreamingDecoder(writeFanLattice(tmp_path, 6), 0.0, 'test', resultFile)
+    assert decoder.decode() == 0.0
+    assert decoder.maxActiveTokens == 7
+    assert resultFile.getvalue().split()[-1] == 'W3'
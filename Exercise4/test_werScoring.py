@@ -0,0 +1,42 @@
+import os
+import numpy as np
+from werScoring import WERScorer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCLITE_OUTPUT = os.path.join(HERE, 'test', 'example.ctm')
+
+def getCounts(counts):
+    return [counts.numCorrect, counts.numSubstitutions, counts.numDeletions, counts.numInsertions]
+
+def readSegmentScores():
+    # the "Scores: (#C #S #D #I)" line of every segment in sclite's pra output, in the order of the stm
+    with open(SCLITE_OUTPUT + '.pra', 'r') as file:
+        return [[int(field) for field in line.split()[-4:]] for line in file if line.startswith('Scores:')]
+
+def readSpeakerScores():
+    # the speaker rows of sclite's raw summary: # Snt # Wrd | Corr Sub Del Ins Err S.Err
+    scores = {}
+    with open(SCLITE_OUTPUT + '.raw', 'r') as file:
+        for line in file:
+            fields = line.replace('|', ' ').split()
+            if(len(fields) == 9 and fields[1].isdigit()):
+                scores[fields[0]] = [int(field) for field in fields[1:]]
+    return scores
+
+def test_scores_match_sclite():
+    report = WERScorer.load(os.path.join(HERE, 'transcriptions.stm')).scoreFile(os.path.join(HERE, 'example.ctm'))
+    assert [getCounts(counts) for counts in report.segmentCounts] == readSegmentScores()
+    speakerScores = readSpeakerScores()
+    total = speakerScores.pop('Sum')
+    for speaker, counts in report.speakerCounts.items():
+        assert [counts.numSentences, counts.numWords] + getCounts(counts) + [counts.getNumErrors(), counts.numSentenceErrors] == speakerScores.pop(speaker)
+    assert not speakerScores
+    assert [report.total.numSentences, report.total.numWords] + getCounts(report.total) + [report.total.getNumErrors(), report.total.numSentenceErrors] == total
+
+def test_align_counts_edits():
+    # "a b c d" against "a x c d e": one substitution and one insertion
+    assert getCounts(WERScorer.align(np.array([0, 1, 2, 3]), np.array([0, 5, 2, 3, 4]))) == [3, 1, 0, 1]
+    assert getCounts(WERScorer.align(np.array([0, 1, 2]), np.array([], dtype=np.int64))) == [0, 0, 3, 0]
+    assert getCounts(WERScorer.align(np.array([], dtype=np.int64), np.array([0, 1]))) == [0, 0, 0, 2]
+    # a deletion and an insertion cost less than two substitutions
+    assert getCounts(WERScorer.align(np.array([0, 1, 2]), np.array([1, 2, 3]))) == [2, 0, 1, 1]
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from batchDecoder import readManifest, getVocabulary
+from decodeWordGraphs import WordGraph, Lattice
+from latticeCache import LatticeCache
+from werScoring import WERScorer
+
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+# every lattice a worker process has parsed stays in memory for all later candidates it decodes
+lattices = {}
+
+class TuningResult(object):
+
+    def __init__(self, lmScale, pruningThreshold, report, wordGraphDensity, ctmLines):
+        self.lmScale = lmScale
+        self.pruningThreshold = pruningThreshold
+        self.report = report
+        self.wordGraphDensity = wordGraphDensity
+        self.ctmLines = ctmLines
+
+    def getKey(self):
+        # fewer errors first, then the sparser word graph
+        return (self.report.total.getNumErrors(), self.wordGraphDensity)
+
+    def getLine(self):
+        return 'lmScale %g pruningThreshold %g WER %.1f (%d errors) Word Graph Density %.2f' % (self.lmScale, self.pruningThreshold, self.report.getWER(), self.report.total.getNumErrors(), self.wordGraphDensity)
+
+def getLattice(latticeFilePath, cacheDir):
+    if(latticeFilePath not in lattices):
+        lattice = Lattice.load(latticeFilePath, getVocabulary(cacheDir), LatticeCache(cacheDir) if cacheDir is not None else None)
+        lattice.sortNodesTopologically()
+        lattices[latticeFilePath] = lattice
+    return lattices[latticeFilePath]
+
+def decodeCandidate(task):
+    segment, lmScale, pruningThreshold, mode, cacheDir, consensus = task
+    wordGraph = WordGraph(segment.latticeFilePath, segment.startTime, segment.code, None, None, pruningThreshold, lmScale, mode,
+                          vocabulary=getVocabulary(cacheDir), lattice=getLattice(segment.latticeFilePath, cacheDir))
+    if(consensus):
+        wordGraph.decodeConsensus()
+    return wordGraph.getCTMLines(), wordGraph.numPrunedEdges
+
+class DecodingTuner(object):
+
+    # searches the LM scale and the pruning threshold for the lowest WER without leaving Python: the references are
+    # read once, hypotheses are scored in memory, and the workers decode every candidate from the lattices they keep
+    def __init__(self, segments, scorer, mode='log semiring', cacheDir=None, consensus=False, numWorkers=None):
+        self.segments = segments
+        self.scorer = scorer
+        self.mode = mode
+        self.cacheDir = cacheDir
+        self.consensus = consensus
+        self.numWords = scorer.score([]).total.numWords
+        self.executor = ProcessPoolExecutor(max(1, numWorkers or os.cpu_count() or 1))
+        self.results = {}
+
+    def close(self):
+        self.executor.shutdown()
+
+    def evaluate(self, candidates):
+        # all segments of all new candidates are decoded as one batch of tasks, so the workers stay busy across candidates
+        candidates = [candidate for candidate in dict.fromkeys(candidates) if candidate not in self.results]
+        tasks = [(segment, lmScale, pruningThreshold, self.mode, self.cacheDir, self.consensus) for lmScale, pruningThreshold in candidates for segment in self.segments]
+        decoded = list(self.executor.map(decodeCandidate, tasks))
+        for index, (lmScale, pruningThreshold) in enumerate(candidates):
+            segmentResults = decoded[index * len(self.segments):(index + 1) * len(self.segments)]
+            ctmLines = [line for lines, _ in segmentResults for line in lines]
+            result = TuningResult(lmScale, pruningThreshold, self.scorer.score(ctmLines), sum(numEdges for _, numEdges in segmentResults) / float(self.numWords), ctmLines)
+            self.results[(lmScale, pruningThreshold)] = result
+            print(result.getLine())
+        return [self.results[candidate] for candidate in candidates]
+
+    def getBest(self):
+        return min(self.results.values(), key=TuningResult.getKey)
+
+    def gridSearch(self, lmScales, pruningThresholds):
+        self.evaluate([(lmScale, pruningThreshold) for lmScale in lmScales for pruningThreshold in pruningThresholds])
+        return self.getBest()
+
+    def goldenSectionSearch(self, low, high, pruningThreshold, tolerance=1.0):
+        # the WER is a step function of the LM scale, so this finds a local optimum at best; ties keep the lower interval
+        def getKey(lmScale):
+            return self.results[(lmScale, pruningThreshold)].getKey()
+        lower, upper = high - GOLDEN_RATIO * (high - low), low + GOLDEN_RATIO * (high - low)
+        self.evaluate([(lower, pruningThreshold), (upper, pruningThreshold)])
+        while(high - low > tolerance):
+            if(getKey(lower) <= getKey(upper)):
+                high, upper = upper, lower
+                lower = high - GOLDEN_RATIO * (high - low)
+                self.evaluate([(lower, pruningThreshold)])
+            else:
+                low, lower = lower, upper
+                upper = low + GOLDEN_RATIO * (high - low)
+                self.evaluate([(upper, pruningThreshold)])
+        return min((self.results[(lmScale, pruningThreshold)] for lmScale in (lower, upper)), key=TuningResult.getKey)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tune the LM scale and the pruning threshold on the lattices of a manifest against an STM reference')
+    parser.add_argument('--manifest', default='segments.txt')
+    parser.add_argument('--stm', default='transcriptions.stm')
+    parser.add_argument('--search', default='golden', choices=['golden', 'grid'])
+    parser.add_argument('--lm-scales', type=float, nargs='+', default=[1.0, 100.0], help='the interval of a golden-section search, or the values of a grid search')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='width of the LM scale interval at which a golden-section search stops')
+    parser.add_argument('--pruning-thresholds', type=float, nargs='+', default=[500.0], help='tried with the best LM scale of a golden-section search, or in every grid point')
+    parser.add_argument('--mode', default='log semiring', choices=['log semiring', 'tropical semiring'])
+    parser.add_argument('--consensus', action='store_true', help='score the consensus decoding, which unlike the best path depends on pruning')
+    parser.add_argument('--cache-dir', default=os.environ.get('LATTICE_CACHE_DIR', '.latticeCache'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--ctm', default=None, help='write the CTM of the best candidate to this file')
+    args = parser.parse_args()
+
+    tuner = DecodingTuner(readManifest(args.manifest), WERScorer.load(args.stm), args.mode, args.cache_dir, args.consensus, args.workers)
+    if(args.search == 'grid'):
+        best = tuner.gridSearch(args.lm_scales, args.pruning_thresholds)
+    else:
+        assert len(args.lm_scales) == 2, "A golden-section search needs the two ends of the LM scale interval"
+        best = tuner.goldenSectionSearch(args.lm_scales[0], args.lm_scales[1], args.pruning_thresholds[0], args.tolerance)
+        tuner.evaluate([(best.lmScale, pruningThreshold) for pruningThreshold in args.pruning_thresholds])
+        best = min((tuner.results[(best.lmScale, pruningThreshold)] for pruningThreshold in args.pruning_thresholds), key=TuningResult.getKey)
+    tuner.close()
+
+    print("================================")
+    print("Best " + best.getLine())
+    for line in best.report.getSummaryLines():
+        print(line)
+    if(args.ctm is not None):
+        with open(args.ctm, 'w') as ctmFile:
+            ctmFile.writelines(best.ctmLines)
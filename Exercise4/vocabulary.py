@@ -0,0 +1,66 @@
+import json
+import os
+import numpy as np
+
+FILLER_WORDS = ('!NULL', '[SILENCE]', '[NOISE]')
+
+class Vocabulary(object):
+
+    # dense word ids shared by every lattice parsed with it, so per-word data can live in arrays indexed by id;
+    # words are stored without the quotes of the W= field and ids are never reused or reordered
+    def __init__(self, words=(), fillerWords=FILLER_WORDS):
+        self.words = []
+        self.wordIds = {}
+        self.fillerWords = tuple(fillerWords)
+        self.fillerIds = set()
+        self.fillerMask = np.zeros(0, dtype=bool)
+        for word in words:
+            self.intern(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, wordId):
+        return self.words[wordId]
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def intern(self, word):
+        wordId = self.wordIds.get(word)
+        if(wordId is None):
+            wordId = self.wordIds[word] = len(self.words)
+            self.words.append(word)
+            if(word in self.fillerWords):
+                self.fillerIds.add(wordId)
+        return wordId
+
+    def internAll(self, words):
+        return np.array([self.intern(word) for word in words], dtype=np.int32)
+
+    def getWordId(self, word, default=-1):
+        return self.wordIds.get(word, default)
+
+    def getFillerMask(self):
+        if(len(self.fillerMask) < len(self.words)):
+            self.fillerMask = np.zeros(len(self.words), dtype=bool)
+            self.fillerMask[list(self.fillerIds)] = True
+        return self.fillerMask
+
+    def isFiller(self, wordIds):
+        return self.getFillerMask()[wordIds]
+
+    @classmethod
+    def load(cls, vocabularyFilePath):
+        with open(vocabularyFilePath, 'r') as file:
+            content = json.load(file)
+        return cls(content['words'], content['fillerWords'])
+
+    def save(self, vocabularyFilePath):
+        temporaryPath = vocabularyFilePath + '.' + str(os.getpid()) + '.tmp'
+        with open(temporaryPath, 'w') as file:
+            json.dump({'words': self.words, 'fillerWords': list(self.fillerWords)}, file)
+        os.replace(temporaryPath, vocabularyFilePath)
+
+def stripQuotes(word):
+    return word[1:-1] if len(word) >= 2 and word[0] == '"' and word[-1] == '"' else word
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import argparse
+import numpy as np
+
+# sclite's default alignment weights
+SUBSTITUTION_COST = 4
+DELETION_COST = 3
+INSERTION_COST = 3
+IGNORED_SEGMENT = 'ignore_time_segment_in_scoring'
+INTER_SEGMENT_GAP = 'inter_segment_gap'
+
+class ErrorCounts(object):
+
+    def __init__(self, numSentences=0, numWords=0, numCorrect=0, numSubstitutions=0, numDeletions=0, numInsertions=0, numSentenceErrors=0):
+        self.numSentences = numSentences
+        self.numWords = numWords
+        self.numCorrect = numCorrect
+        self.numSubstitutions = numSubstitutions
+        self.numDeletions = numDeletions
+        self.numInsertions = numInsertions
+        self.numSentenceErrors = numSentenceErrors
+
+    def add(self, other):
+        self.numSentences += other.numSentences
+        self.numWords += other.numWords
+        self.numCorrect += other.numCorrect
+        self.numSubstitutions += other.numSubstitutions
+        self.numDeletions += other.numDeletions
+        self.numInsertions += other.numInsertions
+        self.numSentenceErrors += other.numSentenceErrors
+        return self
+
+    def getNumErrors(self):
+        return self.numSubstitutions + self.numDeletions + self.numInsertions
+
+    def getWER(self):
+        return 100.0 * self.getNumErrors() / max(self.numWords, 1)
+
+    def getPercentages(self):
+        # the columns of a sclite summary line: Corr Sub Del Ins Err S.Err
+        numWords, numSentences = max(self.numWords, 1), max(self.numSentences, 1)
+        return (100.0 * self.numCorrect / numWords, 100.0 * self.numSubstitutions / numWords, 100.0 * self.numDeletions / numWords,
+                100.0 * self.numInsertions / numWords, self.getWER(), 100.0 * self.numSentenceErrors / numSentences)
+
+    def getSummaryLine(self, name):
+        return '| %-22s | %4d %6d | %5.1f  %5.1f  %5.1f  %5.1f  %5.1f  %5.1f |' % ((name, self.numSentences, self.numWords) + self.getPercentages())
+
+class ReferenceSegment(object):
+
+    def __init__(self, fileName, channel, speaker, startTime, endTime, words):
+        self.fileName = fileName
+        self.channel = channel
+        self.speaker = speaker
+        self.startTime = startTime
+        self.endTime = endTime
+        self.words = words
+
+class ScoreReport(object):
+
+    def __init__(self, segmentCounts, speakerCounts, total):
+        self.segmentCounts = segmentCounts
+        self.speakerCounts = speakerCounts
+        self.total = total
+
+    def getWER(self):
+        return self.total.getWER()
+
+    def getSummaryLines(self):
+        lines = [counts.getSummaryLine(speaker) for speaker, counts in sorted(self.speakerCounts.items())]
+        return lines + [self.total.getSummaryLine('Sum/Avg')]
+
+class WERScorer(object):
+
+    # scores CTM hypotheses against an STM reference like sclite does by default: words are compared without case,
+    # a hypothesis word belongs to the segment of its file and channel that contains the middle of the word, and
+    # every segment is aligned by weighted edit distance. Words outside of all segments count as insertions
+    def __init__(self, segments):
+        self.segments = segments
+        self.wordIds = {}
+        self.referenceIds = [self.getWordIds(segment.words) for segment in segments]
+        self.channels = {}
+        for index, segment in enumerate(segments):
+            self.channels.setdefault((segment.fileName, segment.channel), []).append(index)
+        for key, indices in self.channels.items():
+            indices.sort(key=lambda index: segments[index].startTime)
+            self.channels[key] = (np.array(indices), np.array([segments[index].startTime for index in indices]), np.array([segments[index].endTime for index in indices]))
+
+    @classmethod
+    def load(cls, stmFilePath):
+        segments = []
+        with open(stmFilePath, 'r', encoding='utf-8') as file:
+            for line in file:
+                if(line.startswith(';;') or not line.strip()):
+                    continue
+                fields = line.split()
+                words = fields[5:]
+                if(words and words[0].startswith('<')):
+                    words = words[1:]
+                segments.append(ReferenceSegment(fields[0].lower(), fields[1], fields[2].lower(), float(fields[3]), float(fields[4]), [word.lower() for word in words]))
+        return cls(segments)
+
+    def getWordIds(self, words):
+        return np.array([self.wordIds.setdefault(word, len(self.wordIds)) for word in words], dtype=np.int64)
+
+    def score(self, ctmLines):
+        hypotheses = [[] for _ in self.segments]
+        numGapWords = 0
+        for line in ctmLines:
+            if(line.startswith(';;') or not line.strip()):
+                continue
+            fields = line.split()
+            channel = self.channels.get((fields[0].lower(), fields[1]))
+            middle = float(fields[2]) + float(fields[3]) / 2
+            position = np.searchsorted(channel[1], middle, 'right') - 1 if channel is not None else -1
+            if(position < 0 or middle > channel[2][position]):
+                numGapWords += 1
+            else:
+                hypotheses[channel[0][position]].append((middle, fields[4].lower()))
+
+        segmentCounts, speakerCounts, total = [], {}, ErrorCounts()
+        for segment, referenceIds, hypothesis in zip(self.segments, self.referenceIds, hypotheses):
+            if(segment.words == [IGNORED_SEGMENT]):
+                segmentCounts.append(None)
+                continue
+            counts = self.align(referenceIds, self.getWordIds([word for _, word in sorted(hypothesis)]))
+            segmentCounts.append(counts)
+            speakerCounts.setdefault(segment.speaker, ErrorCounts()).add(counts)
+            total.add(counts)
+        if(numGapWords):
+            gapCounts = ErrorCounts(numInsertions=numGapWords)
+            speakerCounts[INTER_SEGMENT_GAP] = gapCounts
+            total.add(gapCounts)
+        return ScoreReport(segmentCounts, speakerCounts, total)
+
+    def scoreFile(self, ctmFilePath):
+        with open(ctmFilePath, 'r', encoding='utf-8') as file:
+            return self.score(file)
+
+    @classmethod
+    def align(cls, reference, hypothesis):
+        # one row of the cost matrix per reference word: substitutions and deletions only need the previous row, and the
+        # insertions along the row are a running minimum of cost - INSERTION_COST * column, shifted back afterwards
+        numReference, numHypothesis = len(reference), len(hypothesis)
+        columns = np.arange(numHypothesis + 1) * INSERTION_COST
+        costs = np.empty((numReference + 1, numHypothesis + 1), dtype=np.int64)
+        costs[0] = columns
+        for row in range(1, numReference + 1):
+            candidates = np.empty(numHypothesis + 1, dtype=np.int64)
+            candidates[0] = costs[row - 1, 0] + DELETION_COST
+            candidates[1:] = np.minimum(costs[row - 1, :-1] + np.where(hypothesis == reference[row - 1], 0, SUBSTITUTION_COST), costs[row - 1, 1:] + DELETION_COST)
+            costs[row] = np.minimum.accumulate(candidates - columns) + columns
+
+        counts = ErrorCounts(numSentences=1, numWords=numReference)
+        row, column = numReference, numHypothesis
+        while(row > 0 or column > 0):
+            if(row > 0 and column > 0 and costs[row, column] == costs[row - 1, column - 1] + (0 if hypothesis[column - 1] == reference[row - 1] else SUBSTITUTION_COST)):
+                if(hypothesis[column - 1] == reference[row - 1]):
+                    counts.numCorrect += 1
+                else:
+                    counts.numSubstitutions += 1
+                row, column = row - 1, column - 1
+            elif(row > 0 and costs[row, column] == costs[row - 1, column] + DELETION_COST):
+                counts.numDeletions += 1
+                row -= 1
+            else:
+                counts.numInsertions += 1
+                column -= 1
+        counts.numSentenceErrors = int(counts.getNumErrors() > 0)
+        return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Score CTM files against an STM reference and print the sclite summary by speaker')
+    parser.add_argument('ctm', nargs='+')
+    parser.add_argument('--stm', default='transcriptions.stm')
+    args = parser.parse_args()
+
+    scorer = WERScorer.load(args.stm)
+    for ctmFilePath in args.ctm:
+        print(ctmFilePath)
+        for line in scorer.scoreFile(ctmFilePath).getSummaryLines():
+            print(line)
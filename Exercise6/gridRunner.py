@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import argparse
+import itertools
+import math
+import os
+import subprocess
+import sys
+import time
+from plotTraining import Results
+
+RWTHLM = os.environ.get('RWTHLM', '/work/asr2/irie/adv-asr-exercise/rwthlm')
+RESULTS_FILE = 'results.txt'
+BEST_PERPLEXITY_FILE = 'bestPerplexity.txt'
+
+class Configuration(object):
+
+    def __init__(self, architecture, batchSize, maxEpoch, learningRate):
+        self.architecture = architecture
+        self.batchSize = batchSize
+        self.maxEpoch = maxEpoch
+        self.learningRate = learningRate
+
+    def getName(self):
+        # the folder name of train_lm.sh, so earlier runs of the shell scripts count as done
+        return 'results_%s_%s_%s_%s' % (self.architecture, self.batchSize, self.maxEpoch, self.learningRate)
+
+    def getResultsDir(self, modelsDir):
+        return os.path.join(modelsDir, self.getName())
+
+    def getBestPerplexity(self, modelsDir):
+        # a run is complete once it has written a best perplexity that can be read back
+        bestPerplexityPath = os.path.join(self.getResultsDir(modelsDir), BEST_PERPLEXITY_FILE)
+        if(not os.path.exists(bestPerplexityPath)):
+            return None
+        try:
+            with open(bestPerplexityPath, 'r') as file:
+                return float(file.read())
+        except ValueError:
+            return None
+
+class TrainingJob(object):
+
+    # one trainer process whose results.txt is read as it grows, so a run whose dev perplexity stalls can be stopped early
+    def __init__(self, configuration, modelsDir, trainer, numThreads, patience, minImprovement):
+        self.configuration = configuration
+        self.resultsDir = configuration.getResultsDir(modelsDir)
+        self.modelFilePath = os.path.join(modelsDir, 'name-' + configuration.getName())
+        self.trainer = trainer
+        self.numThreads = numThreads
+        self.patience = patience
+        self.minImprovement = minImprovement
+        self.results = Results(os.path.join(self.resultsDir, RESULTS_FILE), self.resultsDir, parse=False)
+        self.process = None
+        self.resultsFile = None
+        self.readOffset = 0
+        self.pendingLine = ''
+        self.status = 'pending'
+
+    def start(self):
+        os.makedirs(self.resultsDir, exist_ok=True)
+        # an interrupted run starts over, its partial results would be mixed up with the new ones otherwise
+        self.resultsFile = open(self.results.resultsFilePath, 'w')
+        command = self.trainer + ['--vocab', 'vocab.txt', '--unk', '--train', 'train.txt.gz', '--dev', 'validation.txt.gz',
+                                  '--batch-size', str(self.configuration.batchSize), '--max-epoch', str(self.configuration.maxEpoch),
+                                  '--learning-rate', str(self.configuration.learningRate), '--sequence-length', '500', '--word-wrapping', 'verbatim', self.modelFilePath]
+        self.process = subprocess.Popen(command, stdout=self.resultsFile, stderr=subprocess.STDOUT, env=dict(os.environ, OMP_NUM_THREADS=str(self.numThreads)))
+        self.status = 'running'
+
+    def follow(self):
+        with open(self.results.resultsFilePath, 'r') as file:
+            file.seek(self.readOffset)
+            text = file.read()
+            self.readOffset = file.tell()
+        lines = (self.pendingLine + text).split('\n')
+        self.pendingLine = lines.pop()
+        for line in lines:
+            self.results.parseLine(line + '\n')
+
+    def hasStalled(self):
+        perplexities = self.results.perplexities
+        if(len(perplexities) <= self.patience):
+            return False
+        bestBefore = min(perplexities[:-self.patience])
+        return min(perplexities[-self.patience:]) > bestBefore * (1 - self.minImprovement)
+
+    def poll(self):
+        # returns True once the job has finished, normally or because it was stopped early
+        self.follow()
+        returnCode = self.process.poll()
+        if(returnCode is None and self.patience is not None and self.hasStalled()):
+            self.process.terminate()
+            returnCode = self.process.wait()
+            self.status = 'stopped'
+        if(returnCode is None):
+            return False
+        self.follow()
+        self.resultsFile.close()
+        if(self.status != 'stopped'):
+            self.status = 'done' if returnCode == 0 and self.results.perplexities else 'failed'
+        if(self.status == 'done' and not all(math.isfinite(perplexity) for perplexity in self.results.perplexities)):
+            self.status = 'diverged'
+        if(self.status != 'failed'):
+            self.finish()
+        if(os.path.exists(self.modelFilePath)):
+            os.remove(self.modelFilePath)
+        return True
+
+    def getBestPerplexity(self):
+        # a diverged run has no perplexity worth reporting
+        return self.results.bestPerplexity if self.status != 'diverged' else None
+
+    def finish(self):
+        if(self.status == 'stopped'):
+            # the trainer keeps the best model, which is not the one of the last, stalled epoch
+            self.results.bestPerplexity = min(self.results.perplexities)
+        # a diverged run writes its infinite perplexity as well, so it is not trained again
+        self.results.writeBestPerplexity()
+        try:
+            self.results.plot()
+        except ImportError:
+            pass
+
+    def kill(self):
+        if(self.process is not None and self.process.poll() is None):
+            self.process.terminate()
+            self.process.wait()
+        if(self.resultsFile is not None):
+            self.resultsFile.close()
+
+class GridRunner(object):
+
+    # runs as many trainer processes at a time as their threads fit on the cores; finished configurations are skipped
+    def __init__(self, configurations, modelsDir='models', trainer=(RWTHLM,), numThreads=2, numCores=None, patience=None, minImprovement=0.0, pollSeconds=1.0, rerun=False):
+        self.configurations = configurations
+        self.modelsDir = modelsDir
+        self.trainer = list(trainer)
+        self.numThreads = numThreads
+        self.numCores = numCores or os.cpu_count() or 1
+        self.patience = patience
+        self.minImprovement = minImprovement
+        self.pollSeconds = pollSeconds
+        self.rerun = rerun
+        self.rows = {}
+
+    def getMaxJobs(self):
+        return max(1, self.numCores // self.numThreads)
+
+    def run(self):
+        pending = []
+        for configuration in self.configurations:
+            bestPerplexity = configuration.getBestPerplexity(self.modelsDir)
+            if(bestPerplexity is not None and not self.rerun):
+                if(math.isfinite(bestPerplexity)):
+                    self.rows[configuration.getName()] = (configuration, 'skipped', None, bestPerplexity)
+                else:
+                    self.rows[configuration.getName()] = (configuration, 'diverged', None, None)
+            else:
+                pending.append(TrainingJob(configuration, self.modelsDir, self.trainer, self.numThreads, self.patience, self.minImprovement))
+        running = []
+        try:
+            while(pending or running):
+                while(pending and len(running) < self.getMaxJobs()):
+                    job = pending.pop(0)
+                    job.start()
+                    running.append(job)
+                    print('started ' + job.configuration.getName())
+                time.sleep(self.pollSeconds)
+                for job in [job for job in running if job.poll()]:
+                    running.remove(job)
+                    self.rows[job.configuration.getName()] = (job.configuration, job.status, job.results.numEpochs, job.getBestPerplexity())
+                    print('%s %s after %d epochs, best perplexity %s' % (job.configuration.getName(), job.status, job.results.numEpochs, job.getBestPerplexity()))
+        finally:
+            for job in running:
+                job.kill()
+        return self.rows
+
+    def getTableLines(self):
+        rows = sorted(self.rows.values(), key=lambda row: float('inf') if row[3] is None else row[3])
+        lines = ['%-16s %9s %8s %13s %7s %8s %15s\n' % ('architecture', 'batchSize', 'maxEpoch', 'learningRate', 'epochs', 'status', 'bestPerplexity')]
+        for configuration, status, numEpochs, bestPerplexity in rows:
+            lines.append('%-16s %9s %8s %13s %7s %8s %15s\n' % (configuration.architecture, configuration.batchSize, configuration.maxEpoch, configuration.learningRate,
+                                                                '-' if numEpochs is None else numEpochs, status, '-' if bestPerplexity is None else bestPerplexity))
+        return lines
+
+    def writeTable(self, tableFilePath):
+        with open(tableFilePath, 'w') as file:
+            file.writelines(self.getTableLines())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the LM of every hyper-parameter configuration of a grid, several at a time')
+    parser.add_argument('--architectures', nargs='+', default=['i100-m100', 'i100-m200', 'i100-m50-m50'])
+    parser.add_argument('--batch-sizes', nargs='+', default=['4', '16'])
+    parser.add_argument('--max-epochs', nargs='+', default=['20'])
+    parser.add_argument('--learning-rates', nargs='+', default=['5e-2', '1e-2', '5e-3'])
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--trainer', default=RWTHLM, help='the rwthlm binary, or e.g. "python3 stubTrainer.py" to test without it')
+    parser.add_argument('--threads-per-job', type=int, default=int(os.environ.get('OMP_NUM_THREADS', '2')))
+    parser.add_argument('--cores', type=int, default=None, help='defaults to all cores of this machine')
+    parser.add_argument('--patience', type=int, default=None, help='stop a run once its dev perplexity has not improved for this many epochs')
+    parser.add_argument('--min-improvement', type=float, default=0.0, help='relative improvement below which an epoch counts as not improving')
+    parser.add_argument('--poll-seconds', type=float, default=1.0)
+    parser.add_argument('--rerun', action='store_true', help='also train the configurations that are already done')
+    parser.add_argument('--table', default='tuning.txt')
+    args = parser.parse_args()
+
+    configurations = [Configuration(*values) for values in itertools.product(args.architectures, args.batch_sizes, args.max_epochs, args.learning_rates)]
+    runner = GridRunner(configurations, args.models_dir, args.trainer.split(), args.threads_per_job, args.cores, args.patience, args.min_improvement, args.poll_seconds, args.rerun)
+    rows = runner.run()
+    runner.writeTable(args.table)
+    sys.stdout.writelines(runner.getTableLines())
+    sys.exit(1 if any(row[1] == 'failed' for row in rows.values()) else 0)
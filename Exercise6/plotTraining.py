@@ -1,46 +1,54 @@
-import matplotlib.pyplot as plt
 import sys
 
 class Results(object):
 
-    def __init__(self, resultsFilePath, outputDir):
+    def __init__(self, resultsFilePath, outputDir, parse=True):
         self.resultsFilePath = resultsFilePath
         self.outputDir = outputDir
         self.numEpochs = 0
         self.learningRates = []
         self.perplexities = []
         self.epochs = []
-        self.parse()
-        self.bestPerplexity = self.perplexities[-1]
+        self.bestPerplexity = None
+        if(parse):
+            self.parse()
 
     def parse(self):
         with open(self.resultsFilePath, 'r') as file:
             for line in file:
-                if(line.startswith('epoch')):
-                        self.numEpochs += 1
-                elif(line.startswith('development')):
-                    self.parseDevelopment(line[:-1])
+                self.parseLine(line)
+
+    def parseLine(self, line):
+        # also used on the lines of a results file that is still being written
+        if(line.startswith('epoch')):
+            self.numEpochs += 1
             self.epochs = list(range(self.numEpochs))
+        elif(line.startswith('development')):
+            self.parseDevelopment(line.rstrip('\n'))
+            self.bestPerplexity = self.perplexities[-1]
 
     def parseDevelopment(self, line):
         self.learningRates.append(float(line.split()[7].replace(",","")))
         self.perplexities.append(float(line.split()[3].replace(",","")))
 
     def plot(self):
+        import matplotlib.pyplot as plt
         fig, (ax1, ax2)  = plt.subplots(2)
+        # a run stopped during an epoch has no dev perplexity for it
+        epochs = self.epochs[:len(self.perplexities)]
 
-        ax1.plot(self.epochs, self.learningRates)
+        ax1.plot(epochs, self.learningRates)
         ax1.set(xlabel='epoch',ylabel='learning rate')
         ax1.grid()
 
-        ax2.plot(self.epochs, self.perplexities)
+        ax2.plot(epochs, self.perplexities)
         ax2.set(xlabel='epoch',ylabel='perplexity')
         ax2.grid()
 
-        fig.savefig(outputDir + '/resultsPlotted.png')
+        fig.savefig(self.outputDir + '/resultsPlotted.png')
 
     def writeBestPerplexity(self):
-        with open(outputDir + '/bestPerplexity.txt','w') as file:
+        with open(self.outputDir + '/bestPerplexity.txt','w') as file:
             file.write(str(self.bestPerplexity))
             
 
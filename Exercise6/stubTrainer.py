@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+# stands in for the rwthlm binary when testing the grid runner: it takes the same options, writes a model file and
+# prints rwthlm's progress lines, with dev perplexities that follow a made-up curve of the hyper-parameters
+EPOCH_SECONDS = float(os.environ.get('STUB_TRAINER_EPOCH_SECONDS', '0.05'))
+
+def getLayerSizes(modelFilePath):
+    # the grid runner names models name-results_<architecture>_<batch size>_<max epoch>_<learning rate>
+    architecture = os.path.basename(modelFilePath).split('name-results_')[-1].split('_')[0]
+    return [int(layer[1:]) for layer in architecture.split('-') if len(layer) > 1 and layer[0] in 'ilmr' and layer[1:].isdigit()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fake rwthlm training run')
+    parser.add_argument('--vocab')
+    parser.add_argument('--unk', action='store_true')
+    parser.add_argument('--train')
+    parser.add_argument('--dev')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--max-epoch', type=int, default=20)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--sequence-length', type=int, default=100)
+    parser.add_argument('--word-wrapping', default='verbatim')
+    parser.add_argument('model')
+    args = parser.parse_args()
+
+    print("Reading vocabulary from file '%s' ..." % args.vocab)
+    print("Randomly initializing neural network weights ...")
+    print("Reading development data from file '%s' ..." % args.dev)
+    print("Reading training data from file '%s' ..." % args.train)
+    print("Training ...")
+    sys.stdout.flush()
+
+    generator = random.Random(' '.join(sys.argv[1:]).replace(args.model, os.path.basename(args.model)))
+    finalPerplexity = 80.0 + 4000.0 / sum(getLayerSizes(args.model) or [100]) + 5.0 * abs(math.log10(args.learning_rate * args.batch_size / 0.1))
+    diverges = args.learning_rate * args.batch_size >= 0.8
+    learningRate = args.learning_rate
+    bestPerplexity = float('inf')
+    for epoch in range(1, args.max_epoch + 1):
+        time.sleep(EPOCH_SECONDS)
+        print("Shuffling ... done")
+        print("epoch %d took %.2f minutes" % (epoch, EPOCH_SECONDS / 60))
+        perplexity = float('inf') if diverges else finalPerplexity + 100.0 * math.exp(-0.5 * epoch * learningRate / args.learning_rate) * generator.uniform(0.8, 1.2)
+        print("development perplexity = %20.15f, learning rate = %.15e" % (perplexity, learningRate))
+        sys.stdout.flush()
+        if(diverges):
+            break
+        # newbob: the learning rate is halved whenever the dev perplexity does not improve
+        if(perplexity >= bestPerplexity):
+            learningRate /= 2
+        bestPerplexity = min(bestPerplexity, perplexity)
+        with open(args.model, 'w') as modelFile:
+            modelFile.write('stub model after epoch %d\n' % epoch)
@@ -0,0 +1,15 @@
+import os
+import sys
+from gridRunner import Configuration, GridRunner
+
+STUB_TRAINER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubTrainer.py')
+
+def test_stub_perplexities_depend_on_the_architecture(tmp_path, monkeypatch):
+    monkeypatch.setenv('STUB_TRAINER_EPOCH_SECONDS', '0')
+    configurations = [Configuration(architecture, '4', '10', '5e-3') for architecture in ('i100-m50', 'i100-m200')]
+    runner = GridRunner(configurations, str(tmp_path), [sys.executable, STUB_TRAINER], numThreads=1, numCores=2, pollSeconds=0.05)
+    rows = runner.run()
+    assert [rows[configuration.getName()][1] for configuration in configurations] == ['done', 'done']
+    small, large = [rows[configuration.getName()][3] for configuration in configurations]
+    # the stub trainer converges to 80 + 4000 / (sum of the layer sizes) + a learning rate term
+    assert small - large > 10.0